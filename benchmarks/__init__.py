@@ -0,0 +1,4 @@
+"""Benchmarks for CicloPiBot hot paths.
+
+Run them from repository root, e.g. `python -m benchmarks.extractor`.
+"""
@@ -0,0 +1,62 @@
+"""Compare CicloPi station extractors on the pages corpus.
+
+- `beautifulsoup`: build a BeautifulSoup tree and run
+    `_get_station_records`, as the bot did before the fast extractor was
+    introduced;
+- `traversal`: run `_get_station_records` on an already built tree;
+- `fast`: run `_extract_station_records` on page text.
+"""
+
+# Standard library modules
+import argparse
+import timeit
+
+# Third party modules
+from bs4 import BeautifulSoup
+
+# Project modules
+from ciclopibot.ciclopi import _extract_station_records, _get_station_records
+from .pages import get_pages
+
+
+def time_it(function, repeat, number):
+    """Return best time per call of `function`, in microseconds."""
+    return min(
+        timeit.repeat(function, repeat=repeat, number=number)
+    ) / number * 1e6
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__,
+                                         allow_abbrev=False)
+    cli_parser.add_argument('--repeat', type=int, default=5,
+                            help='number of timing repetitions')
+    cli_parser.add_argument('--number', type=int, default=50,
+                            help='calls per timing repetition')
+    cli_arguments = cli_parser.parse_args()
+    repeat, number = cli_arguments.repeat, cli_arguments.number
+    print(f"{'page':<30} {'beautifulsoup':>14} {'traversal':>10} "
+          f"{'fast':>8} {'speedup':>8}")
+    for name, page in get_pages().items():
+        tree = BeautifulSoup(page, "html.parser")
+        if _extract_station_records(page) != _get_station_records(tree):
+            raise RuntimeError(f"Extractors disagree on page `{name}`")
+        beautifulsoup_time = time_it(
+            lambda: _get_station_records(BeautifulSoup(page, "html.parser")),
+            repeat=repeat, number=number
+        )
+        traversal_time = time_it(
+            lambda: _get_station_records(tree),
+            repeat=repeat, number=number
+        )
+        fast_time = time_it(
+            lambda: _extract_station_records(page),
+            repeat=repeat, number=number
+        )
+        print(f"{name:<30} {beautifulsoup_time:>12.0f}us "
+              f"{traversal_time:>8.0f}us {fast_time:>6.0f}us "
+              f"{beautifulsoup_time / fast_time:>7.1f}x")
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,274 @@
+"""Time CicloPiBot hot paths in isolation and check regression budgets.
+
+Each benchmark reports the median time per call, in microseconds.
+Each timing is preceded by a timing of a fixed pure-Python workload
+    (`calibrate`), and benchmarks are timed in interleaved rounds: the
+    median ratio between benchmark and calibration times does not change
+    when the whole machine gets slower or faster during or between runs.
+Results may be stored as JSON (`--save`) and compared with a previously
+    stored baseline (`--baseline`): the command fails if the relative time
+    of a benchmark exceeds its baseline one by more than the factor set in
+    `budgets.json` (or by the `default` factor there).
+
+Usage:
+python -m benchmarks.hotpaths --save baseline.json
+python -m benchmarks.hotpaths --baseline baseline.json
+"""
+
+# Standard library modules
+import argparse
+import datetime
+import json
+import os
+import platform
+import statistics
+import sys
+import tempfile
+import timeit
+
+# Third party modules
+import davtelepot
+from bs4 import BeautifulSoup
+
+# Project modules
+from ciclopibot import ciclopi
+from ciclopibot.messages import MessageCatalog, default_ciclopi_messages
+from .pages import get_pages
+
+budgets_file_name = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'budgets.json'
+)
+
+# A place in Pisa, other than default location
+POSITION = (43.7160, 10.3966)
+
+# Custom order records of a chat having a few favourite stations
+CUSTOM_ORDER = [
+    dict(station=station_id, value=value)
+    for value, station_id in enumerate((3, 14, 7, 22, 9))
+]
+
+
+# Calls of `calibrate` per calibration timing (about 1 ms)
+CALIBRATION_NUMBER = 10
+
+
+def calibrate():
+    """Run a fixed workload of arithmetic, dict, list and str operations."""
+    table = {}
+    for i in range(500):
+        table[i % 97] = table.get(i % 97, 0) + i * 3 // 7
+    return ''.join(str(value) for value in sorted(table.values()))
+
+
+def run_benchmarks(benchmarks, repeat, scale=1.0):
+    """Time `benchmarks` {name: (function, calls per timing)}.
+
+    Return two dicts: median time per call in microseconds and median time
+        relative to calibration, by benchmark name.
+    """
+    times = {name: [] for name in benchmarks}
+    relative_times = {name: [] for name in benchmarks}
+    for _ in range(repeat):
+        for name, (function, number) in benchmarks.items():
+            number = max(1, int(number * scale))
+            calibration = timeit.timeit(
+                calibrate, number=CALIBRATION_NUMBER
+            ) / CALIBRATION_NUMBER
+            time_per_call = timeit.timeit(function, number=number) / number
+            times[name].append(time_per_call)
+            relative_times[name].append(time_per_call / calibration)
+    return (
+        {
+            name: statistics.median(values) * 1e6
+            for name, values in times.items()
+        },
+        {
+            name: statistics.median(values)
+            for name, values in relative_times.items()
+        }
+    )
+
+
+def get_benchmarks(bot):
+    """Return a dict {name: (function, calls per timing)} of benchmarks."""
+    pages = list(get_pages().values())
+    trees = [BeautifulSoup(page, "html.parser") for page in pages]
+    snapshot = ciclopi.StationSnapshot(
+        ciclopi._extract_station_records(pages[0]),
+        version=1,
+        fetched_at=datetime.datetime.now()
+    )
+    center = ciclopi.Location(ciclopi.default_location.coordinates)
+    position = ciclopi.Location(POSITION)
+    stations = snapshot.get_stations(center)
+    not_available = bot.get_message('ciclopi', 'status', 'not_available',
+                                    language='en')
+
+    def sort(sorting_code, location):
+        sorting_method = ciclopi.get_sorting_method(sorting_code,
+                                                    CUSTOM_ORDER)
+        return lambda: sorted(snapshot.get_stations(location),
+                              key=sorting_method)
+
+    return {
+        'haversine_distance': (
+            lambda: ciclopi.haversine_distance(43.7160, 10.3966,
+                                               43.7185, 10.4021),
+            10000
+        ),
+        'get_stations': (
+            lambda: [ciclopi._get_stations(tree, center) for tree in trees],
+            5
+        ),
+        'extract_station_records': (
+            lambda: [ciclopi._extract_station_records(page)
+                     for page in pages],
+            20
+        ),
+        'sort_center': (sort(0, center), 200),
+        'sort_alphabetical': (sort(1, center), 200),
+        'sort_position': (sort(2, position), 200),
+        'sort_custom': (sort(3, center), 200),
+        'nearest_stations': (
+            lambda: snapshot.get_nearest_stations(position, 5),
+            1000
+        ),
+        'station_status': (
+            lambda: [station.status.format(not_available=not_available)
+                     for station in stations],
+            200
+        ),
+        'settings_keyboard': (
+            lambda: ciclopi.get_settings_keyboard(
+                bot=bot, update={}, user_record={}, language='en'
+            ),
+            1000
+        ),
+        'sorting_keyboard': (
+            lambda: ciclopi.get_sorting_keyboard(
+                bot=bot, update={}, user_record={}, language='en',
+                sorting=1
+            ),
+            1000
+        ),
+        'limit_keyboard': (
+            lambda: ciclopi.get_limit_keyboard(
+                bot=bot, update={}, user_record={}, stations_to_show=5
+            ),
+            1000
+        ),
+        'menu_back_buttons': (
+            lambda: ciclopi.get_menu_back_buttons(
+                bot=bot, update={}, user_record={}, language='en'
+            ),
+            5000
+        ),
+    }
+
+
+def get_regressions(results, baseline, budgets):
+    """Return a list of (name, time, baseline time, budget) over budget."""
+    regressions = []
+    for name, result in results.items():
+        if name not in baseline:
+            continue
+        budget = budgets.get(name, budgets.get('default', 1.2))
+        if result > baseline[name] * budget:
+            regressions.append((name, result, baseline[name], budget))
+    return regressions
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__,
+                                         allow_abbrev=False)
+    cli_parser.add_argument('--repeat', type=int, default=15,
+                            help='number of timing repetitions')
+    cli_parser.add_argument('--scale', type=float, default=1.0,
+                            help='multiply calls per timing repetition')
+    cli_parser.add_argument('--only', type=str, nargs='*', default=None,
+                            help='names of benchmarks to run')
+    cli_parser.add_argument('--save', type=str, default=None,
+                            help='JSON file to store results')
+    cli_parser.add_argument('--baseline', type=str, default=None,
+                            help='JSON file of results to compare with')
+    cli_parser.add_argument('--budgets', type=str, default=budgets_file_name,
+                            help='JSON file of allowed slowdown factors')
+    cli_arguments = cli_parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as path:
+        bot = davtelepot.bot.Bot(
+            token='123456789:benchmark',
+            database_url=os.path.join(path, 'benchmark.db')
+        )
+        bot.messages['ciclopi'] = default_ciclopi_messages
+        ciclopi.message_catalog = MessageCatalog(
+            default_ciclopi_messages,
+            missing_message=bot.missing_message
+        )
+        ciclopi.default_location = ciclopi.Location((43.718518, 10.402165))
+        results, relative_results = run_benchmarks(
+            {
+                name: benchmark
+                for name, benchmark in get_benchmarks(bot).items()
+                if not cli_arguments.only or name in cli_arguments.only
+            },
+            repeat=cli_arguments.repeat,
+            scale=cli_arguments.scale
+        )
+
+    baseline = {}
+    relative_baseline = {}
+    if cli_arguments.baseline is not None:
+        with open(cli_arguments.baseline, 'r') as baseline_file:
+            baseline_data = json.load(baseline_file)
+        baseline = baseline_data['results']
+        relative_baseline = baseline_data.get('relative_results', {})
+    budgets = {}
+    if os.path.isfile(cli_arguments.budgets):
+        with open(cli_arguments.budgets, 'r') as budgets_file:
+            budgets = json.load(budgets_file)
+    print(f"{'benchmark':<26} {'time':>12} {'baseline':>12} {'ratio':>7}")
+    for name, result in results.items():
+        if name in baseline:
+            print(f"{name:<26} {result:>10.2f}us {baseline[name]:>10.2f}us "
+                  f"{result / baseline[name]:>6.2f}x")
+        else:
+            print(f"{name:<26} {result:>10.2f}us")
+    if relative_baseline:
+        print(f"\n{'benchmark':<26} {'relative':>12} {'baseline':>12} "
+              f"{'ratio':>7}")
+        for name, result in relative_results.items():
+            if name in relative_baseline:
+                print(f"{name:<26} {result:>12.3f} "
+                      f"{relative_baseline[name]:>12.3f} "
+                      f"{result / relative_baseline[name]:>6.2f}x")
+    if cli_arguments.save is not None:
+        with open(cli_arguments.save, 'w') as results_file:
+            json.dump(
+                dict(
+                    python=platform.python_version(),
+                    machine=platform.machine(),
+                    recorded_at=datetime.datetime.now().isoformat(),
+                    results=results,
+                    relative_results=relative_results
+                ),
+                results_file,
+                indent=2
+            )
+    # Compare relative times, unless baseline was stored without them
+    if relative_baseline:
+        regressions = get_regressions(relative_results, relative_baseline,
+                                      budgets)
+    else:
+        regressions = get_regressions(results, baseline, budgets)
+    for name, result, baseline_result, budget in regressions:
+        print(f"Regression: `{name}` took {result:.3f}, more than "
+              f"{budget:.2f} x {baseline_result:.3f} "
+              f"({'relative time' if relative_baseline else 'us'})")
+    return 1 if regressions else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,501 @@
+"""Load test CicloPiBot against local stand-ins for CicloPi and Telegram.
+
+Two web servers are started on localhost:
+- a CicloPi stand-in, serving in turn the pages of the corpus (see
+    `benchmarks.pages`), so that available bikes keep changing;
+- a fake Telegram Bot API, delivering simulated updates through
+    `getUpdates` and recording messages sent and edited by the bot.
+`ciclopibot.bot.main` is then run against them, while simulated users send
+    `/ciclopi` commands and press buttons. Throughput and latency
+    percentiles are reported per handler: latency is measured from the
+    moment an update is available to the bot to its first reply (or to the
+    answer of the callback query, for buttons).
+
+By default Telegram flood limits are lifted, to measure the bot itself;
+    pass `--telegram_limits` to keep them.
+"""
+
+# Standard library modules
+import argparse
+import asyncio
+import collections
+import datetime
+import hashlib
+import json
+import logging
+import os
+import random
+import socket
+import tempfile
+import time
+
+# Third party modules
+import aiohttp.web
+import davtelepot
+
+# Project modules
+from ciclopibot import bot as ciclopi_bot, ciclopi
+from ciclopibot.outbox import OutboundQueue
+from .pages import get_pages
+
+BOT_TOKEN = '123456789:load-test-token'
+
+# Simulated actions and their relative frequency: a command or the callback
+#   data of a button, after the `ciclopi:///` prefix
+DEFAULT_MIX = (
+    ('/ciclopi', 40),
+    ('main', 10),
+    ('sort', 5),
+    ('sort|{sorting}', 5),
+    ('limit', 5),
+    ('limit|{limit}', 5),
+    ('show', 10),
+    ('show|all', 5),
+    ('legend', 10),
+    ('fav', 5),
+)
+
+
+def get_free_port(host='127.0.0.1'):
+    """Return a TCP port nobody is listening on."""
+    with socket.socket() as probe:
+        probe.bind((host, 0))
+        return probe.getsockname()[1]
+
+
+def get_percentile(sorted_values, percentile):
+    """Return nearest-rank `percentile` of a non-empty sorted list."""
+    index = max(0, int(round(percentile / 100 * len(sorted_values))) - 1)
+    return sorted_values[min(index, len(sorted_values) - 1)]
+
+
+class LocalServer:
+    """aiohttp web application listening on localhost."""
+
+    def __init__(self, host='127.0.0.1', port=None):
+        """Set address; server is started by `start`."""
+        self._host = host
+        self._port = port or get_free_port(host)
+        self._runner = None
+        self.app = aiohttp.web.Application()
+
+    @property
+    def url(self):
+        """Return base URL of the server."""
+        return f"http://{self._host}:{self._port}"
+
+    async def start(self):
+        """Start listening."""
+        self._runner = aiohttp.web.AppRunner(self.app)
+        await self._runner.setup()
+        await aiohttp.web.TCPSite(self._runner, self._host,
+                                  self._port).start()
+
+    async def stop(self):
+        """Stop listening."""
+        if self._runner is not None:
+            await self._runner.cleanup()
+
+
+class CicloPiStandIn(LocalServer):
+    """Serve `frmLeStazioni.aspx` pages, switching every `page_interval` s.
+
+    Pages carry an `ETag` header and `If-None-Match` requests are answered
+        with `304 Not Modified` while the page does not change.
+    """
+
+    def __init__(self, pages, page_interval=15, **kwargs):
+        """Take a list of page texts."""
+        super().__init__(**kwargs)
+        self._pages = [
+            (page, '"' + hashlib.blake2b(page.encode('utf-8'),
+                                         digest_size=8).hexdigest() + '"')
+            for page in pages
+        ]
+        self._page_interval = page_interval
+        self._started_at = time.monotonic()
+        self.requests = 0
+        self.not_modified = 0
+        self.app.router.add_get('/frmLeStazioni.aspx', self.handle)
+
+    @property
+    def url(self):
+        """Return URL of the stations page."""
+        return f"{super().url}/frmLeStazioni.aspx"
+
+    async def handle(self, request):
+        self.requests += 1
+        page, etag = self._pages[
+            int((time.monotonic() - self._started_at) / self._page_interval)
+            % len(self._pages)
+        ]
+        if request.headers.get('If-None-Match') == etag:
+            self.not_modified += 1
+            return aiohttp.web.Response(status=304, headers={'ETag': etag})
+        return aiohttp.web.Response(text=page, content_type='text/html',
+                                    headers={'ETag': etag})
+
+
+class FakeTelegramApi(LocalServer):
+    """Minimal Telegram Bot API: long polling, messages and callbacks.
+
+    Methods not implemented here just return True.
+    """
+
+    def __init__(self, token=BOT_TOKEN, **kwargs):
+        """Start with no update."""
+        super().__init__(**kwargs)
+        self._token = token
+        self._updates = collections.deque()
+        self._new_updates = asyncio.Event()
+        self._next_update_id = 1
+        self._next_message_id = 1
+        # ('chat', chat_id) or ('callback', query_id) -> future
+        self._waiters = {}
+        self.last_message_ids = {}
+        self.calls = collections.Counter()
+        self._methods = {
+            'getMe': self._get_me,
+            'getUpdates': self._get_updates,
+            'sendMessage': self._send_message,
+            'editMessageText': self._edit_message_text,
+            'answerCallbackQuery': self._answer_callback_query,
+            'getUserProfilePhotos': self._get_user_profile_photos,
+        }
+        self.app.router.add_post('/bot{token}/{method}', self.handle)
+
+    def add_update(self, update, waiter_key):
+        """Deliver `update` and return a future of its reply time.
+
+        `waiter_key` : ('chat', chat_id) or ('callback', query_id)
+            Reply to wait for.
+        """
+        update['update_id'] = self._next_update_id
+        self._next_update_id += 1
+        future = asyncio.get_event_loop().create_future()
+        self._waiters[waiter_key] = future
+        self._updates.append(update)
+        self._new_updates.set()
+        return future
+
+    def _reply(self, waiter_key):
+        future = self._waiters.pop(waiter_key, None)
+        if future is not None and not future.done():
+            future.set_result(time.monotonic())
+
+    def _make_message(self, chat_id, text, message_id=None):
+        if message_id is None:
+            message_id = self._next_message_id
+            self._next_message_id += 1
+        return dict(message_id=message_id, date=int(time.time()),
+                    chat=dict(id=chat_id, type='private'), text=text)
+
+    async def handle(self, request):
+        if request.match_info['token'] != self._token:
+            return aiohttp.web.json_response(
+                dict(ok=False, error_code=401, description='Unauthorized')
+            )
+        method = request.match_info['method']
+        self.calls[method] += 1
+        parameters = dict(await request.post())
+        if method in self._methods:
+            result = await self._methods[method](parameters)
+        else:
+            result = True
+        return aiohttp.web.json_response(dict(ok=True, result=result))
+
+    async def _get_me(self, parameters):
+        return dict(id=int(self._token.split(':')[0]), is_bot=True,
+                    first_name='CicloPi load test',
+                    username='ciclopi_load_test_bot')
+
+    async def _get_updates(self, parameters):
+        offset = int(parameters.get('offset') or 0)
+        limit = int(parameters.get('limit') or 100)
+        timeout = float(parameters.get('timeout') or 0)
+        while self._updates and self._updates[0]['update_id'] < offset:
+            self._updates.popleft()
+        if not self._updates and timeout:
+            self._new_updates.clear()
+            try:
+                await asyncio.wait_for(self._new_updates.wait(),
+                                       min(timeout, 5))
+            except asyncio.TimeoutError:
+                pass
+        return [
+            update
+            for update, _ in zip(self._updates, range(limit))
+        ]
+
+    async def _send_message(self, parameters):
+        chat_id = int(parameters['chat_id'])
+        message = self._make_message(chat_id, parameters.get('text'))
+        self.last_message_ids[chat_id] = message['message_id']
+        self._reply(('chat', chat_id))
+        return message
+
+    async def _edit_message_text(self, parameters):
+        if 'chat_id' not in parameters:
+            return True
+        chat_id = int(parameters['chat_id'])
+        self._reply(('chat', chat_id))
+        return self._make_message(chat_id, parameters.get('text'),
+                                  int(parameters['message_id']))
+
+    async def _answer_callback_query(self, parameters):
+        self._reply(('callback', parameters['callback_query_id']))
+        return True
+
+    async def _get_user_profile_photos(self, parameters):
+        return dict(total_count=0, photos=[])
+
+
+class LoadTest:
+    """Simulate `users` users, each performing `requests` actions.
+
+    Users wait an exponentially distributed time (mean `think_time`
+        seconds) before each action; replies not received within `timeout`
+        seconds are counted as timeouts.
+    """
+
+    def __init__(self, telegram, users=1000, requests=5, think_time=1.0,
+                 timeout=30, mix=DEFAULT_MIX, seed=0):
+        """Take a `FakeTelegramApi` and simulation parameters."""
+        self._telegram = telegram
+        self._users = users
+        self._requests = requests
+        self._think_time = think_time
+        self._timeout = timeout
+        self._actions, self._weights = zip(*mix)
+        self._seed = seed
+        self.latencies = collections.defaultdict(list)
+        self.timeouts = collections.Counter()
+        self.duration = 0
+
+    def _make_command_update(self, user_id, text):
+        return dict(
+            message=dict(
+                message_id=0,
+                date=int(time.time()),
+                chat=dict(id=user_id, type='private', first_name='User'),
+                text=text,
+                entities=[
+                    dict(type='bot_command', offset=0, length=len(text))
+                ],
+                **{'from': self._get_user(user_id)}
+            )
+        )
+
+    def _make_callback_update(self, user_id, query_id, message_id, data):
+        return dict(
+            callback_query=dict(
+                id=query_id,
+                chat_instance=str(user_id),
+                message=dict(
+                    message_id=message_id,
+                    date=int(time.time()),
+                    chat=dict(id=user_id, type='private', first_name='User'),
+                    text='CicloPi'
+                ),
+                data=f"ciclopi:///{data}",
+                **{'from': self._get_user(user_id)}
+            )
+        )
+
+    @staticmethod
+    def _get_user(user_id):
+        return dict(id=user_id, is_bot=False, first_name=f'User {user_id}',
+                    language_code=('it' if user_id % 2 else 'en'))
+
+    async def _simulate_user(self, user_id):
+        random_generator = random.Random(self._seed * 1000003 + user_id)
+        for request in range(self._requests):
+            if self._think_time:
+                await asyncio.sleep(
+                    random_generator.expovariate(1 / self._think_time)
+                )
+            message_id = self._telegram.last_message_ids.get(user_id)
+            action = random_generator.choices(self._actions,
+                                              self._weights)[0]
+            if message_id is None or action.startswith('/'):
+                action = '/ciclopi' if message_id is None else action
+                label = action
+                waiter_key = ('chat', user_id)
+                update = self._make_command_update(user_id, action)
+            else:
+                data = action.format(
+                    sorting=random_generator.choice(
+                        list(ciclopi.CICLOPI_SORTING_CHOICES)
+                    ),
+                    limit=random_generator.choice(
+                        list(ciclopi.CICLOPI_STATIONS_TO_SHOW)
+                    )
+                )
+                label = f"button {action.split('|')[0]}"
+                query_id = f"{user_id}_{request}"
+                waiter_key = ('callback', query_id)
+                update = self._make_callback_update(user_id, query_id,
+                                                    message_id, data)
+            started_at = time.monotonic()
+            try:
+                replied_at = await asyncio.wait_for(
+                    self._telegram.add_update(update, waiter_key),
+                    self._timeout
+                )
+            except asyncio.TimeoutError:
+                self.timeouts[label] += 1
+                continue
+            self.latencies[label].append(replied_at - started_at)
+
+    async def run(self):
+        """Run all simulated users and wait for them to finish."""
+        started_at = time.monotonic()
+        await asyncio.gather(
+            *[
+                self._simulate_user(user_id)
+                for user_id in range(1, self._users + 1)
+            ]
+        )
+        self.duration = time.monotonic() - started_at
+
+    def get_results(self):
+        """Return a dict of results: throughput and latencies per handler."""
+        handlers = {}
+        for label in sorted(set(self.latencies) | set(self.timeouts)):
+            latencies = sorted(self.latencies[label])
+            handlers[label] = dict(
+                requests=len(latencies),
+                timeouts=self.timeouts[label],
+                **{
+                    f'p{percentile}': (
+                        get_percentile(latencies, percentile) * 1000
+                        if latencies else None
+                    )
+                    for percentile in (50, 95, 99)
+                },
+                max=latencies[-1] * 1000 if latencies else None
+            )
+        requests = sum(handler['requests'] for handler in handlers.values())
+        return dict(
+            users=self._users,
+            duration=self.duration,
+            requests=requests,
+            throughput=requests / self.duration if self.duration else 0,
+            handlers=handlers
+        )
+
+
+def print_results(results, telegram, ciclopi_stand_in):
+    print(f"{results['requests']} requests by {results['users']} users in "
+          f"{results['duration']:.1f} s: "
+          f"{results['throughput']:.1f} requests/s")
+    print(f"{'handler':<16} {'requests':>9} {'timeouts':>9} "
+          f"{'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}")
+    for label, handler in results['handlers'].items():
+        print(
+            f"{label:<16} {handler['requests']:>9} {handler['timeouts']:>9} "
+            + ' '.join(
+                f"{'-':>9}" if handler[key] is None
+                else f"{handler[key]:>7.1f}ms"
+                for key in ('p50', 'p95', 'p99', 'max')
+            )
+        )
+    print("Telegram API calls: " + ', '.join(
+        f"{method} {count}"
+        for method, count in telegram.calls.most_common()
+    ))
+    print(f"CicloPi page requests: {ciclopi_stand_in.requests} "
+          f"({ciclopi_stand_in.not_modified} not modified)")
+
+
+async def drive(load_test, telegram, verbose=False):
+    """Wait for the bot to be ready, run `load_test` and stop the bot."""
+    if not verbose:
+        for handler in logging.getLogger().handlers:
+            handler.setLevel(logging.WARNING)
+    # Service status is not checked while CicloPi is closed
+    while await ciclopi.ciclopi_snapshots.get_snapshot() is None:
+        await asyncio.sleep(1)
+    for bot in davtelepot.bot.Bot.bots:
+        bot.shared_data['ciclopi']['is_working'] = True
+    while not telegram.calls['getUpdates']:
+        await asyncio.sleep(0.1)
+    try:
+        await load_test.run()
+    finally:
+        davtelepot.bot.Bot.stop("Load test completed")
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__,
+                                         allow_abbrev=False)
+    cli_parser.add_argument('--users', type=int, default=1000,
+                            help='number of simulated users')
+    cli_parser.add_argument('--requests', type=int, default=5,
+                            help='actions performed by each user')
+    cli_parser.add_argument('--think_time', type=float, default=1.0,
+                            help='mean time between actions of a user (s)')
+    cli_parser.add_argument('--timeout', type=float, default=30,
+                            help='time after which a reply is missing (s)')
+    cli_parser.add_argument('--page_interval', type=float, default=15,
+                            help='time between CicloPi page changes (s)')
+    cli_parser.add_argument('--seed', type=int, default=0,
+                            help='seed of simulated users behaviour')
+    cli_parser.add_argument('--telegram_limits', action='store_true',
+                            help='keep Telegram flood limits')
+    cli_parser.add_argument('--output', type=str, default=None,
+                            help='JSON file to store results')
+    cli_parser.add_argument('--verbose', action='store_true',
+                            help='keep bot log in console')
+    cli_arguments = cli_parser.parse_args()
+
+    # The bot creates its event loop when instantiated: create it first, to
+    #   start stand-in servers on it
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    davtelepot.bot.Bot._loop = loop
+    ciclopi_stand_in = CicloPiStandIn(
+        pages=list(get_pages().values()),
+        page_interval=cli_arguments.page_interval
+    )
+    telegram = FakeTelegramApi()
+    loop.run_until_complete(ciclopi_stand_in.start())
+    loop.run_until_complete(telegram.start())
+    ciclopi.ciclopi_web_page._url = ciclopi_stand_in.url
+    davtelepot.bot.Bot.set_class_api_url(telegram.url)
+    if not cli_arguments.telegram_limits:
+        davtelepot.bot.Bot._absolute_cooldown_timedelta = \
+            davtelepot.bot.Bot._per_chat_cooldown_timedelta = \
+            datetime.timedelta(0)
+        ciclopi.ciclopi_outbox = OutboundQueue(
+            rate=1e9, private_chat_rate=1e9, group_chat_rate=1e9
+        )
+    load_test = LoadTest(
+        telegram=telegram,
+        users=cli_arguments.users,
+        requests=cli_arguments.requests,
+        think_time=cli_arguments.think_time,
+        timeout=cli_arguments.timeout,
+        seed=cli_arguments.seed
+    )
+    asyncio.ensure_future(
+        drive(load_test, telegram, verbose=cli_arguments.verbose)
+    )
+    with tempfile.TemporaryDirectory() as path:
+        os.makedirs(os.path.join(path, 'data'))
+        ciclopi_bot.main(bot_token=BOT_TOKEN, path=path,
+                         local_host='127.0.0.1', port=get_free_port())
+        if not cli_arguments.verbose:
+            # Pending bot requests fail as stand-ins are stopped
+            logging.disable(logging.ERROR)
+        loop.run_until_complete(ciclopi_stand_in.stop())
+        loop.run_until_complete(telegram.stop())
+    results = load_test.get_results()
+    print_results(results, telegram, ciclopi_stand_in)
+    if cli_arguments.output is not None:
+        with open(cli_arguments.output, 'w') as output_file:
+            json.dump(results, output_file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
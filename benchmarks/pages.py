@@ -0,0 +1,116 @@
+"""Corpus of CicloPi web pages used by benchmarks.
+
+Recorded pages are stored as `.html` files in `benchmarks/pages/`.
+Use `python -m benchmarks.pages --record` to download the current one.
+If no page has been recorded, synthetic pages mimicking
+    `frmLeStazioni.aspx` markup are generated instead.
+"""
+
+# Standard library modules
+import argparse
+import asyncio
+import datetime
+import os
+import random
+
+# Third party modules
+from davtelepot.utilities import async_get
+
+# Project modules
+from ciclopibot.ciclopi import _URL, Station
+
+pages_folder = os.path.join(
+    os.path.dirname(os.path.abspath(__file__)),
+    'pages'
+)
+
+
+def make_page(seed=0, bikes=None):
+    """Return a synthetic CicloPi page.
+
+    Available bikes and free stalls are random (but reproducible through
+        `seed`), unless a `bikes` dict {station_id: (bikes, free)} is given.
+    """
+    random_generator = random.Random(seed)
+    items = []
+    for station_id, station in Station.stations.items():
+        name = station['name']
+        if random_generator.random() < 0.05:
+            name += ' - Non operativa'
+        if bikes is not None and station_id in bikes:
+            available_bikes, free = bikes[station_id]
+        else:
+            available_bikes = random_generator.randint(0, 12)
+            free = random_generator.randint(0, 12)
+        items.append(
+            f'<li class="rrItem">\n'
+            f'<div class="cssNumero">{station_id}</div>\n'
+            f'<div class="cssInfo">'
+            f'<span class="Stazione">{name}</span><br />\n'
+            f'<span class="TableComune">'
+            f'Pisa - {station["name"]} &amp; dintorni, citta`</span><br />\n'
+            f'<span class="Red"><span class="cssBici">Bici disponibili: '
+            f'{available_bikes}</span><br /><span class="cssPosti">'
+            f'Posti disponibili: {free}</span></span>'
+            f'</div>\n'
+            f'</li>\n'
+        )
+    return (
+        '<!DOCTYPE html>\n<html>\n<head><title>CicloPi - Le stazioni</title>'
+        '</head>\n<body>\n<form id="frmLeStazioni">\n'
+        '<ul class="rrList">\n'
+        f'{"".join(items)}'
+        '</ul>\n</form>\n</body>\n</html>\n'
+    )
+
+
+def get_pages(synthetic_pages=10):
+    """Return a dict {name: page text} of recorded pages.
+
+    If there is no recorded page, return `synthetic_pages` synthetic ones.
+    """
+    pages = {}
+    if os.path.isdir(pages_folder):
+        for file_name in sorted(os.listdir(pages_folder)):
+            if not file_name.endswith('.html'):
+                continue
+            with open(os.path.join(pages_folder, file_name),
+                      'r', encoding='utf-8') as page_file:
+                pages[file_name] = page_file.read()
+    if not pages:
+        pages = {
+            f'synthetic_{seed}': make_page(seed=seed)
+            for seed in range(synthetic_pages)
+        }
+    return pages
+
+
+async def record_page():
+    """Download current CicloPi page and store it in `pages_folder`."""
+    page = await async_get(_URL, mode='string')
+    if isinstance(page, Exception):
+        raise page
+    os.makedirs(pages_folder, exist_ok=True)
+    file_name = os.path.join(
+        pages_folder,
+        f"{datetime.datetime.now():%Y%m%d_%H%M%S}.html"
+    )
+    with open(file_name, 'w', encoding='utf-8') as page_file:
+        page_file.write(page)
+    return file_name
+
+
+def main():
+    cli_parser = argparse.ArgumentParser(description=__doc__,
+                                         allow_abbrev=False)
+    cli_parser.add_argument('--record', action='store_true',
+                            help='download and store current CicloPi page')
+    cli_arguments = cli_parser.parse_args()
+    if cli_arguments.record:
+        print(asyncio.run(record_page()))
+    for name, page in get_pages().items():
+        print(f"{name}: {len(page)} characters")
+
+
+if __name__ == '__main__':
+    main()
@@ -27,6 +27,31 @@ def main():
                             default=None,
                             required=False,
                             help='file to store error log')
+    cli_parser.add_argument('--log_level', type=str,
+                            default=None,
+                            required=False,
+                            help='minimum level of full log records '
+                                 '(e.g. DEBUG, INFO; default: DEBUG)')
+    cli_parser.add_argument('--errors_log_level', type=str,
+                            default=None,
+                            required=False,
+                            help='minimum level of error log records '
+                                 '(default: ERROR)')
+    cli_parser.add_argument('--console_log_level', type=str,
+                            default=None,
+                            required=False,
+                            help='minimum level of records shown in console '
+                                 '(default: DEBUG)')
+    cli_parser.add_argument('--log_max_bytes', type=int,
+                            default=None,
+                            required=False,
+                            help='rotate log files at this size '
+                                 '(0: never rotate; default: 10 MB)')
+    cli_parser.add_argument('--log_backup_count', type=int,
+                            default=None,
+                            required=False,
+                            help='number of rotated log files to keep '
+                                 '(default: 5)')
     cli_parser.add_argument('--local_host', '--host', type=str,
                             default=None,
                             required=False,
@@ -43,6 +68,16 @@ def main():
                             default=None,
                             required=False,
                             help='certificate for webhooks')
+    cli_parser.add_argument('--sampling_profiler', '--sample',
+                            action='store_true',
+                            default=None,
+                            required=False,
+                            help='sample event loop stack and store it in '
+                                 'flame graph format under data/samples')
+    cli_parser.add_argument('--sampling_rate', type=float,
+                            default=None,
+                            required=False,
+                            help='stack samples per second (default: 100)')
     cli_arguments = vars(cli_parser.parse_args())
     bot.main(
         **cli_arguments
@@ -0,0 +1,137 @@
+"""Detect when CicloPi stations reach availability thresholds.
+
+Subscriptions like "at least 3 bikes at station 5" are indexed by station,
+    kind (bikes or free stalls) and threshold, so that comparing two
+    snapshots costs a bisection per changed station, regardless of the
+    number of subscriptions.
+"""
+
+# Standard library modules
+import bisect
+import collections
+import time
+
+# `bikes` and `free` are station values in the snapshot firing the alert
+Alert = collections.namedtuple(
+    'Alert',
+    ['chat_id', 'station_id', 'kind', 'threshold', 'value', 'language',
+     'bikes', 'free']
+)
+
+ALERT_KINDS = ('bikes', 'free')
+
+
+class AlertIndex:
+    """Subscriptions to station availability thresholds.
+
+    A subscription fires when the number of available bikes (or free
+        stalls) of a station rises from below its threshold to at least its
+        threshold, unless it fired less than `cooldown` seconds before.
+
+    Usage:
+    index = AlertIndex()
+    index.add(chat_id=123, station_id=5, kind='bikes', threshold=3)
+    for alert in index.get_alerts(previous_snapshot.table, snapshot.table):
+        ...
+    """
+
+    def __init__(self, cooldown=10 * 60):
+        """Start with no subscription."""
+        self._cooldown = cooldown
+        # (station_id, kind) -> sorted list of (threshold, chat_id)
+        self._subscriptions = {}
+        # chat_id -> set of (station_id, kind, threshold)
+        self._chats = collections.defaultdict(set)
+        self._languages = {}
+        self._last_alerts = {}
+        self._size = 0
+
+    def __len__(self):
+        return self._size
+
+    def add(self, chat_id, station_id, kind, threshold, language=None):
+        """Subscribe `chat_id` to `kind` reaching `threshold` at station."""
+        assert kind in ALERT_KINDS, f"Unknown alert kind: {kind}"
+        if language is not None:
+            self._languages[chat_id] = language
+        if (station_id, kind, threshold) in self._chats[chat_id]:
+            return
+        self._chats[chat_id].add((station_id, kind, threshold))
+        bisect.insort(
+            self._subscriptions.setdefault((station_id, kind), []),
+            (threshold, chat_id)
+        )
+        self._size += 1
+
+    def remove(self, chat_id, station_id, kind, threshold):
+        """Remove a subscription, if it exists."""
+        if (station_id, kind, threshold) not in self._chats.get(chat_id, ()):
+            return
+        self._chats[chat_id].remove((station_id, kind, threshold))
+        if not self._chats[chat_id]:
+            del self._chats[chat_id]
+        subscriptions = self._subscriptions[(station_id, kind)]
+        del subscriptions[
+            bisect.bisect_left(subscriptions, (threshold, chat_id))
+        ]
+        if not subscriptions:
+            del self._subscriptions[(station_id, kind)]
+        self._last_alerts.pop((chat_id, station_id, kind, threshold), None)
+        self._size -= 1
+
+    def remove_station(self, chat_id, station_id):
+        """Remove all subscriptions of `chat_id` about `station_id`."""
+        for subscription in self.get_subscriptions(chat_id, station_id):
+            self.remove(chat_id, *subscription)
+
+    def get_subscriptions(self, chat_id, station_id=None):
+        """Return a sorted list of (station_id, kind, threshold) of chat.
+
+        If `station_id` is given, return only subscriptions about it.
+        """
+        return sorted(
+            subscription
+            for subscription in self._chats.get(chat_id, ())
+            if station_id is None or subscription[0] == station_id
+        )
+
+    def get_alerts(self, previous_table, table, now=None):
+        """Return a list of `Alert`s fired between two `StationTable`s."""
+        if now is None:
+            now = time.monotonic()
+        alerts = []
+        for kind in ALERT_KINDS:
+            previous_values = getattr(previous_table, kind)
+            for row, (station_id, value) in enumerate(
+                    zip(table.ids, getattr(table, kind))
+            ):
+                subscriptions = self._subscriptions.get((station_id, kind))
+                if not subscriptions:
+                    continue
+                previous_row = previous_table.get_row(station_id)
+                if previous_row is None:
+                    continue
+                previous_value = previous_values[previous_row]
+                if value <= previous_value:
+                    continue
+                # Thresholds t such that previous_value < t <= value
+                start = bisect.bisect_right(subscriptions,
+                                            (previous_value, float('inf')))
+                end = bisect.bisect_right(subscriptions,
+                                          (value, float('inf')))
+                for threshold, chat_id in subscriptions[start:end]:
+                    key = (chat_id, station_id, kind, threshold)
+                    last_alert = self._last_alerts.get(key)
+                    if (
+                            last_alert is not None
+                            and now - last_alert < self._cooldown
+                    ):
+                        continue
+                    self._last_alerts[key] = now
+                    alerts.append(
+                        Alert(chat_id=chat_id, station_id=station_id,
+                              kind=kind, threshold=threshold, value=value,
+                              language=self._languages.get(chat_id),
+                              bikes=table.bikes[row], free=table.free[row])
+                    )
+        return alerts
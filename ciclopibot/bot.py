@@ -2,19 +2,82 @@
 
 # Standard library modules
 import logging
+import logging.handlers
 import os
+import queue
 import sys
 
 # Third party modules
 import davtelepot
 
 # Project modules
-from . import ciclopi, messages
+from . import ciclopi, messages, profiling, sampling
 from .messages import (
     default_help_messages, language_messages, supported_languages
 )
 
 
+def get_log_level(level):
+    """Return numeric logging level of `level` (name or number)."""
+    if isinstance(level, int):
+        return level
+    if isinstance(level, str) and level.isnumeric():
+        return int(level)
+    numeric_level = logging.getLevelName(str(level).upper())
+    if not isinstance(numeric_level, int):
+        raise ValueError(f"Unknown logging level: {level}")
+    return numeric_level
+
+
+def set_up_logging(log_file: str,
+                   errors_file: str,
+                   log_level='DEBUG',
+                   errors_log_level='ERROR',
+                   console_log_level='DEBUG',
+                   log_max_bytes: int = 10 * 1024 * 1024,
+                   log_backup_count: int = 5):
+    """Output the log in console, `log_file` and `errors_file`.
+
+    Records are put in a queue by the root logger and formatted and written
+        by a background thread, so that logging does not block the event
+        loop. Log files are rotated when they reach `log_max_bytes`, keeping
+        `log_backup_count` old files (no rotation if `log_max_bytes` is 0).
+    Return the started `QueueListener`: stop it to flush pending records.
+    """
+    # Log formatter: datetime, module name (filled with spaces up to 15
+    # characters), logging level name (filled to 8), message
+    # noinspection SpellCheckingInspection
+    log_formatter = logging.Formatter(
+        "%(asctime)s [%(module)-15s %(levelname)-8s]     %(message)s",
+        style='%'
+    )
+    handlers = []
+    for file_name, level in ((log_file, log_level),
+                             (errors_file, errors_log_level)):
+        file_handler = logging.handlers.RotatingFileHandler(
+            file_name, mode="a", encoding="utf-8",
+            maxBytes=log_max_bytes, backupCount=log_backup_count
+        )
+        file_handler.setLevel(get_log_level(level))
+        handlers.append(file_handler)
+    console_handler = logging.StreamHandler()
+    console_handler.setLevel(get_log_level(console_log_level))
+    handlers.append(console_handler)
+    for handler in handlers:
+        handler.setFormatter(log_formatter)
+
+    log_queue = queue.SimpleQueue()
+    root_logger = logging.getLogger()
+    # Records below every handler level are not even created
+    root_logger.setLevel(min(handler.level for handler in handlers))
+    root_logger.addHandler(logging.handlers.QueueHandler(log_queue))
+    log_listener = logging.handlers.QueueListener(
+        log_queue, *handlers, respect_handler_level=True
+    )
+    log_listener.start()
+    return log_listener
+
+
 def main(bot_token: str = None,
          path: str = None,
          log_file_name: str = None,
@@ -22,7 +85,14 @@ def main(bot_token: str = None,
          local_host: str = None,
          port: int = None,
          hostname: str = None,
-         certificate: str = None):
+         certificate: str = None,
+         sampling_profiler: bool = None,
+         sampling_rate: float = None,
+         log_level: str = None,
+         errors_log_level: str = None,
+         console_log_level: str = None,
+         log_max_bytes: int = None,
+         log_backup_count: int = None):
     if bot_token is None:
         try:
             from .data.passwords import bot_token
@@ -68,34 +138,53 @@ def main(bot_token: str = None,
             from .data.config import certificate
         except ImportError:
             certificate = None
+    if sampling_profiler is None:
+        try:
+            from .data.config import sampling_profiler
+        except ImportError:
+            sampling_profiler = False
+    if sampling_rate is None:
+        try:
+            from .data.config import sampling_rate
+        except ImportError:
+            sampling_rate = 100
+    if log_level is None:
+        try:
+            from .data.config import log_level
+        except ImportError:
+            log_level = 'DEBUG'
+    if errors_log_level is None:
+        try:
+            from .data.config import errors_log_level
+        except ImportError:
+            errors_log_level = 'ERROR'
+    if console_log_level is None:
+        try:
+            from .data.config import console_log_level
+        except ImportError:
+            console_log_level = 'DEBUG'
+    if log_max_bytes is None:
+        try:
+            from .data.config import log_max_bytes
+        except ImportError:
+            log_max_bytes = 10 * 1024 * 1024
+    if log_backup_count is None:
+        try:
+            from .data.config import log_backup_count
+        except ImportError:
+            log_backup_count = 5
     log_file = f"{path}/data/{log_file_name}"
     errors_file = f"{path}/data/{errors_file_name}"
 
-    # Outputs the log in console, log_file and errors_file
-    # Log formatter: datetime, module name (filled with spaces up to 15
-    # characters), logging level name (filled to 8), message
-    # noinspection SpellCheckingInspection
-    log_formatter = logging.Formatter(
-        "%(asctime)s [%(module)-15s %(levelname)-8s]     %(message)s",
-        style='%'
+    log_listener = set_up_logging(
+        log_file=log_file,
+        errors_file=errors_file,
+        log_level=log_level,
+        errors_log_level=errors_log_level,
+        console_log_level=console_log_level,
+        log_max_bytes=log_max_bytes,
+        log_backup_count=log_backup_count
     )
-    root_logger = logging.getLogger()
-    root_logger.setLevel(logging.DEBUG)
-
-    file_handler = logging.FileHandler(log_file, mode="a", encoding="utf-8")
-    file_handler.setFormatter(log_formatter)
-    file_handler.setLevel(logging.DEBUG)
-    root_logger.addHandler(file_handler)
-
-    file_handler = logging.FileHandler(errors_file, mode="a", encoding="utf-8")
-    file_handler.setFormatter(log_formatter)
-    file_handler.setLevel(logging.ERROR)
-    root_logger.addHandler(file_handler)
-
-    console_handler = logging.StreamHandler()
-    console_handler.setFormatter(log_formatter)
-    console_handler.setLevel(logging.DEBUG)
-    root_logger.addHandler(console_handler)
 
     # Instantiate bot
     bot = davtelepot.bot.Bot(token=bot_token,
@@ -119,6 +208,7 @@ def main(bot_token: str = None,
     )
     davtelepot.administration_tools.init(bot)
     ciclopi.init(bot)
+    profiling.init(bot)
     davtelepot.authorization.init(bot)
     davtelepot.languages.init(
         bot, language_messages=language_messages,
@@ -126,12 +216,28 @@ def main(bot_token: str = None,
     )
     davtelepot.suggestions.init(bot)
     davtelepot.helper.init(bot, help_messages=default_help_messages)
+    # Sample event loop (i.e. this thread) stack, if required
+    stack_sampler = (
+        sampling.SamplingProfiler(path=f'{path}/data/samples',
+                                  rate=sampling_rate)
+        if sampling_profiler
+        else None
+    )
+    if stack_sampler is not None:
+        stack_sampler.start()
+        logging.info(f"Sampling event loop stack {sampling_rate} times "
+                     f"per second.")
     # Run bot(s)
     logging.info("Press ctrl+C to exit.")
-    exit_state = davtelepot.bot.Bot.run(
-        local_host=local_host,
-        port=port
-    )
+    try:
+        exit_state = davtelepot.bot.Bot.run(
+            local_host=local_host,
+            port=port
+        )
+    finally:
+        if stack_sampler is not None:
+            stack_sampler.stop()
+        log_listener.stop()
     return exit_state
 
 
@@ -4,30 +4,161 @@ Available bikes in bike sharing stations.
 """
 
 # Standard library modules
+import array
 import asyncio
+import atexit
 import datetime
+import functools
+import hashlib
+import heapq
+import html
 import inspect
+import logging
 import math
-from collections import OrderedDict
+import os
+import re
+import sys
+import time
+from collections import defaultdict, namedtuple, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
 
 # Third party modules
 from typing import Union
 
+import aiohttp.web
+import dataset
 import davtelepot
+from bs4 import BeautifulSoup
+try:
+    import numpy
+except ImportError:
+    numpy = None
 from davtelepot.utilities import (
     async_wrapper, CachedPage, get_cleaned_text,
     line_drawing_unordered_list, make_button, make_inline_keyboard,
     make_lines_of_buttons
 )
 
+# Project modules
+from .alerts import AlertIndex
+from .forecast import StationForecaster
+from .history import StationHistory
+from .messages import MessageCatalog
+from .metrics import MetricsRegistry
+from .outbox import BULK, OutboundQueue
+
 default_location = None
+ciclopi_db = None
+ciclopi_alerts = AlertIndex()
+ciclopi_forecaster = None
+ciclopi_history = None
+ciclopi_notifications = None
+message_catalog = None
+
+ciclopi_metrics = MetricsRegistry(prefix='ciclopi_')
+page_fetch_seconds = ciclopi_metrics.histogram(
+    'page_fetch_seconds',
+    "Time spent downloading CicloPi web page, in seconds."
+)
+page_fetch_failures = ciclopi_metrics.counter(
+    'page_fetch_failures_total',
+    "Failed downloads of CicloPi web page."
+)
+parse_seconds = ciclopi_metrics.histogram(
+    'parse_seconds',
+    "Time spent parsing CicloPi web page into a snapshot, in seconds."
+)
+handler_seconds = ciclopi_metrics.histogram(
+    'handler_seconds',
+    "Time spent handling /ciclopi command and ciclopi:/// buttons, "
+    "in seconds.",
+    labels=('handler',)
+)
+event_loop_lag_seconds = ciclopi_metrics.histogram(
+    'event_loop_lag_seconds',
+    "Delay of event loop wake-ups, in seconds."
+)
 
 _URL = "http://www.ciclopi.eu/frmLeStazioni.aspx"
 
-ciclopi_web_page = CachedPage.get(
+
+class ConditionalCachedPage(CachedPage):
+    """`CachedPage` making conditional requests when server supports them.
+
+    `ETag` and `Last-Modified` response headers are sent back as
+        `If-None-Match` and `If-Modified-Since` request headers: if server
+        answers `304 Not Modified`, cached page is kept as it is.
+    Only `string` and `html` modes are supported.
+    """
+
+    instances = {}
+
+    def __init__(self, url, cache_time=None, **async_get_kwargs):
+        """Instantiate a `CachedPage` with no validator yet."""
+        super().__init__(url, cache_time, **async_get_kwargs)
+        self._etag = None
+        self._last_modified = None
+        self._not_modified = 0
+
+    @property
+    def etag(self):
+        """Return last `ETag` response header, or None."""
+        return self._etag
+
+    @property
+    def last_modified(self):
+        """Return last `Last-Modified` response header, or None."""
+        return self._last_modified
+
+    @property
+    def not_modified(self):
+        """Return number of refreshes answered with `304 Not Modified`."""
+        return self._not_modified
+
+    async def refresh(self):
+        """Update cached web page, unless server says it did not change.
+
+        Return 0 on success, 1 on failure.
+        """
+        headers = {}
+        if self._page is not None:
+            if self._etag is not None:
+                headers['If-None-Match'] = self._etag
+            if self._last_modified is not None:
+                headers['If-Modified-Since'] = self._last_modified
+        try:
+            with page_fetch_seconds.time():
+                async with aiohttp.ClientSession() as session:
+                    async with session.get(
+                            self.url, headers=headers,
+                            timeout=aiohttp.ClientTimeout(total=30)
+                    ) as response:
+                        if response.status == 304:
+                            self._not_modified += 1
+                            self._last_update = datetime.datetime.now()
+                            return 0
+                        response.raise_for_status()
+                        page = await response.text()
+                        self._etag = response.headers.get('ETag')
+                        self._last_modified = response.headers.get(
+                            'Last-Modified'
+                        )
+        except Exception as e:
+            page_fetch_failures.inc()
+            self._page = None
+            logging.error(f"Error refreshing {self.url}: {e}")
+            return 1
+        if self.async_get_kwargs.get('mode') == 'html':
+            page = BeautifulSoup(page, "html.parser")
+        self._page = page
+        self._last_update = datetime.datetime.now()
+        return 0
+
+
+ciclopi_web_page = ConditionalCachedPage.get(
     _URL,
     datetime.timedelta(seconds=15),
-    mode='html'
+    mode='string'
 )
 
 UNIT_TO_KM = {
@@ -81,6 +212,113 @@ CICLOPI_STATIONS_TO_SHOW = {
     )
 }
 
+# Daily opening and closing time of CicloPi service (local time).
+#   Closing time earlier than opening time means closing after midnight.
+CICLOPI_OPENING_HOURS = (datetime.time(7, 0), datetime.time(1, 0))
+
+CICLOPI_ALERT_THRESHOLDS = {
+    'bikes': dict(
+        symbol='🚲',
+        thresholds=(1, 3, 5)
+    ),
+    'free': dict(
+        symbol='🅿️',
+        thresholds=(1, 3)
+    )
+}
+
+
+_GEOHASH_ALPHABET = '0123456789bcdefghjkmnpqrstuvwxyz'
+
+
+def get_geohash(latitude, longitude, precision=8):
+    """Return the geohash of a location and the center of its cell.
+
+    Result is a tuple (geohash, (latitude, longitude)).
+    A precision of 8 characters yields cells of about 38 x 19 metres.
+    """
+    latitude_range = [-90.0, 90.0]
+    longitude_range = [-180.0, 180.0]
+    characters = []
+    bit, character, even = 0, 0, True
+    while len(characters) < precision:
+        if even:
+            value, interval = longitude, longitude_range
+        else:
+            value, interval = latitude, latitude_range
+        middle = (interval[0] + interval[1]) / 2
+        character <<= 1
+        if value >= middle:
+            character |= 1
+            interval[0] = middle
+        else:
+            interval[1] = middle
+        even = not even
+        bit += 1
+        if bit == 5:
+            characters.append(_GEOHASH_ALPHABET[character])
+            bit, character = 0, 0
+    return ''.join(characters), (
+        (latitude_range[0] + latitude_range[1]) / 2,
+        (longitude_range[0] + longitude_range[1]) / 2
+    )
+
+
+class LRUCache:
+    """Bounded cache discarding least recently used items first.
+
+    Count hits and misses of `get` calls.
+    """
+
+    def __init__(self, maxsize=1024):
+        """Set maximum number of items to be stored."""
+        self._maxsize = maxsize
+        self._items = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @property
+    def maxsize(self):
+        """Return maximum number of items."""
+        return self._maxsize
+
+    @property
+    def hit_ratio(self):
+        """Return ratio of `get` calls which found an item."""
+        if self.hits + self.misses == 0:
+            return 0.0
+        return self.hits / (self.hits + self.misses)
+
+    def __len__(self):
+        return len(self._items)
+
+    def __contains__(self, key):
+        return key in self._items
+
+    def get(self, key, default=None):
+        """Return item stored under `key`, or `default` if missing."""
+        if key not in self._items:
+            self.misses += 1
+            return default
+        self.hits += 1
+        self._items.move_to_end(key)
+        return self._items[key]
+
+    def set(self, key, value):
+        """Store `value` under `key`, discarding the oldest item if full."""
+        self._items[key] = value
+        self._items.move_to_end(key)
+        if len(self._items) > self._maxsize:
+            self._items.popitem(last=False)
+
+    def pop(self, key, default=None):
+        """Remove item stored under `key` and return it."""
+        return self._items.pop(key, default)
+
+    def clear(self):
+        """Remove all items."""
+        self._items.clear()
+
 
 def haversine_distance(lat1, lon1, lat2, lon2, degrees='dec', unit='m'):
     """
@@ -111,9 +349,282 @@ def haversine_distance(lat1, lon1, lat2, lon2, degrees='dec', unit='m'):
     )
 
 
+class StationDistanceTable:
+    """Precomputed coordinates of stations, to get many distances at once.
+
+    Distances are evaluated in a single NumPy call if NumPy is installed,
+        otherwise in plain Python using the same precomputed values.
+
+    Usage:
+    table = StationDistanceTable(Station.stations)
+    distances = table.get_distances(43.72, 10.40)
+    distance = distances[table.get_index(station_id)]
+    """
+
+    def __init__(self, stations):
+        """Precompute radians and cosines of `stations` coordinates.
+
+        `stations` : dict
+            {station_id: dict(coordinates=(latitude, longitude), ...)}
+        """
+        self._station_ids = tuple(sorted(stations))
+        self._indexes = {
+            station_id: index
+            for index, station_id in enumerate(self._station_ids)
+        }
+        self._latitudes = [
+            math.radians(stations[station_id]['coordinates'][0])
+            for station_id in self._station_ids
+        ]
+        self._longitudes = [
+            math.radians(stations[station_id]['coordinates'][1])
+            for station_id in self._station_ids
+        ]
+        self._cosines = [math.cos(latitude) for latitude in self._latitudes]
+        if numpy is not None:
+            self._latitudes = numpy.array(self._latitudes)
+            self._longitudes = numpy.array(self._longitudes)
+            self._cosines = numpy.array(self._cosines)
+
+    @property
+    def station_ids(self):
+        """Return station identifiers, in the same order as distances."""
+        return self._station_ids
+
+    def __len__(self):
+        return len(self._station_ids)
+
+    def __contains__(self, station_id):
+        return station_id in self._indexes
+
+    def get_index(self, station_id):
+        """Return position of `station_id` in distance vectors."""
+        return self._indexes[station_id]
+
+    def get_distances(self, latitude, longitude, unit='m'):
+        """Return distances from a location to every station.
+
+        `latitude` and `longitude` are expressed in decimal degrees.
+        Result is a NumPy array if NumPy is installed, a list otherwise.
+        """
+        return self.get_distances_batch(
+            [(latitude, longitude)],
+            unit=unit
+        )[0]
+
+    def get_distances_batch(self, locations, unit='m'):
+        """Return distances from each of `locations` to every station.
+
+        `locations` : iterable of (latitude, longitude) tuples expressed in
+            decimal degrees.
+        Result has one row per location and one column per station: it is a
+            2-D NumPy array if NumPy is installed, a list of lists otherwise.
+        """
+        diameter = 2 * 6371.0088 * UNIT_TO_KM[unit]
+        if numpy is not None:
+            locations = numpy.radians(
+                numpy.asarray(locations, dtype=float).reshape(-1, 2)
+            )
+            latitudes = locations[:, 0:1]
+            longitudes = locations[:, 1:2]
+            return diameter * numpy.arcsin(
+                numpy.sqrt(
+                    numpy.sin((self._latitudes - latitudes) * 0.5) ** 2
+                    + numpy.cos(latitudes)
+                    * self._cosines
+                    * numpy.sin((self._longitudes - longitudes) * 0.5) ** 2
+                )
+            )
+        result = []
+        for latitude, longitude in locations:
+            latitude, longitude = map(math.radians, (latitude, longitude))
+            cosine = math.cos(latitude)
+            result.append(
+                [
+                    diameter * math.asin(
+                        math.sqrt(
+                            math.sin((station_latitude - latitude) * 0.5) ** 2
+                            + cosine
+                            * station_cosine
+                            * math.sin(
+                                (station_longitude - longitude) * 0.5
+                            ) ** 2
+                        )
+                    )
+                    for station_latitude, station_longitude, station_cosine
+                    in zip(self._latitudes, self._longitudes, self._cosines)
+                ]
+            )
+        return result
+
+
+class StationGridIndex:
+    """Fixed latitude / longitude grid over station coordinates.
+
+    Answer "k nearest stations" and "stations within R metres" queries by
+        visiting only grid cells around the queried location, instead of
+        evaluating the distance from every station.
+
+    Usage:
+    index = StationGridIndex(Station.stations)
+    for distance, station_id in index.get_nearest(43.72, 10.40, k=3):
+        ...
+    """
+
+    def __init__(self, stations, cell_size=500):
+        """Put `stations` in square cells about `cell_size` metres wide.
+
+        `stations` : dict
+            {station_id: dict(coordinates=(latitude, longitude), ...)}
+        """
+        self._cell_size = cell_size
+        self._cells = defaultdict(list)
+        metres_per_degree = 2 * math.pi * 6371008.8 / 360
+        mean_latitude = (
+            sum(
+                station['coordinates'][0]
+                for station in stations.values()
+            ) / len(stations)
+            if stations
+            else 0.0
+        )
+        self._latitude_step = cell_size / metres_per_degree
+        self._longitude_step = self._latitude_step / max(
+            math.cos(math.radians(mean_latitude)),
+            0.01
+        )
+        for station_id, station in stations.items():
+            latitude, longitude = station['coordinates']
+            self._cells[self.get_cell(latitude, longitude)].append(
+                (station_id, latitude, longitude)
+            )
+        rows = [row for row, column in self._cells] or [0]
+        columns = [column for row, column in self._cells] or [0]
+        self._bounds = (min(rows), max(rows), min(columns), max(columns))
+
+    def get_cell(self, latitude, longitude):
+        """Return (row, column) of the cell containing a location."""
+        return (
+            math.floor(latitude / self._latitude_step),
+            math.floor(longitude / self._longitude_step)
+        )
+
+    def _get_ring(self, row, column, radius):
+        """Yield stations in cells `radius` cells away from (row, column)."""
+        for r in range(row - radius, row + radius + 1):
+            if radius == 0 or abs(r - row) == radius:
+                columns = range(column - radius, column + radius + 1)
+            else:
+                columns = (column - radius, column + radius)
+            for c in columns:
+                yield from self._cells.get((r, c), ())
+
+    def _get_max_radius(self, row, column):
+        """Return the number of rings needed to cover every cell."""
+        min_row, max_row, min_column, max_column = self._bounds
+        return max(
+            abs(row - min_row), abs(row - max_row),
+            abs(column - min_column), abs(column - max_column)
+        )
+
+    def _is_inside(self, row, column):
+        """Return True if cell (row, column) is in the grid bounding box."""
+        min_row, max_row, min_column, max_column = self._bounds
+        return (
+            min_row <= row <= max_row
+            and min_column <= column <= max_column
+        )
+
+    def _get_distances(self, latitude, longitude, condition=None):
+        """Return a list of (distance, id) of every station."""
+        return [
+            (
+                haversine_distance(latitude, longitude,
+                                   station_latitude, station_longitude),
+                station_id
+            )
+            for cell in self._cells.values()
+            for station_id, station_latitude, station_longitude in cell
+            if condition is None or condition(station_id)
+        ]
+
+    def get_nearest(self, latitude, longitude, k=1, condition=None):
+        """Return the `k` nearest stations as a list of (distance, id).
+
+        `condition` : callable
+            If given, consider only stations for which `condition(station_id)`
+            is True (e.g. stations having available bikes).
+        Result is sorted by distance, in metres.
+        Locations outside the grid are compared with every station, rather
+            than scanning the (many, empty) rings between them and the grid.
+        """
+        row, column = self.get_cell(latitude, longitude)
+        if not self._is_inside(row, column):
+            return heapq.nsmallest(
+                k, self._get_distances(latitude, longitude, condition)
+            )
+        # Stations beyond ring `radius` are at least this far (with a small
+        #   margin for cells getting narrower towards the poles)
+        ring_width = self._cell_size * 0.99
+        found = []
+        for radius in range(self._get_max_radius(row, column) + 1):
+            for station_id, station_latitude, station_longitude in \
+                    self._get_ring(row, column, radius):
+                if condition is not None and not condition(station_id):
+                    continue
+                found.append(
+                    (
+                        haversine_distance(latitude, longitude,
+                                           station_latitude,
+                                           station_longitude),
+                        station_id
+                    )
+                )
+            found.sort()
+            if len(found) >= k and found[k - 1][0] <= radius * ring_width:
+                break
+        return found[:k]
+
+    def get_within(self, latitude, longitude, radius, condition=None):
+        """Return stations within `radius` metres as a list of (distance, id).
+
+        `condition` : callable
+            If given, consider only stations for which `condition(station_id)`
+            is True.
+        Result is sorted by distance.
+        """
+        row, column = self.get_cell(latitude, longitude)
+        if not self._is_inside(row, column):
+            return sorted(
+                (distance, station_id)
+                for distance, station_id in self._get_distances(
+                    latitude, longitude, condition
+                )
+                if distance <= radius
+            )
+        found = []
+        rings = min(
+            math.ceil(radius / (self._cell_size * 0.99)),
+            self._get_max_radius(row, column)
+        )
+        for ring in range(rings + 1):
+            for station_id, station_latitude, station_longitude in \
+                    self._get_ring(row, column, ring):
+                if condition is not None and not condition(station_id):
+                    continue
+                distance = haversine_distance(latitude, longitude,
+                                              station_latitude,
+                                              station_longitude)
+                if distance <= radius:
+                    found.append((distance, station_id))
+        return sorted(found)
+
+
 class Location:
     """Location in world map."""
 
+    __slots__ = ('_coordinates',)
+
     def __init__(self, coordinates):
         """Check and set instance attributes."""
         assert type(coordinates) is tuple, "`coordinates` must be a tuple"
@@ -148,7 +659,11 @@ class Location:
 
 
 class Station(Location):
-    """CicloPi bike sharing station."""
+    """CicloPi bike sharing station.
+
+    Station objects are views of a row of a `StationTable`: only location
+        and distance are stored in the view itself.
+    """
 
     stations = {
         1: dict(
@@ -309,35 +824,90 @@ class Station(Location):
         ),
     }
 
-    def __init__(self, id_=0, name='unknown', coordinates=(91.0, 181.0)):
-        """Check and set instance attributes."""
-        if id_ in self.__class__.stations:
-            coordinates = self.__class__.stations[id_]['coordinates']
-            name = self.__class__.stations[id_]['name']
-        Location.__init__(self, coordinates)
-        self._id = id_
-        self._name = name
-        self._active = True
+    __slots__ = ('_table', '_row', '_location', '_distance', '_forecast',
+                 '_owns_table')
+
+    def __init__(self, id_=0, name='unknown', coordinates=(91.0, 181.0),
+                 table=None, row=0):
+        """Set station table and row this object is a view of.
+
+        If no `table` is given, a single-row table is created for station
+            `id_` (`name` and `coordinates` are used only if `id_` is not
+            in `Station.stations`).
+        A given `table` is never changed: setters of station data copy the
+            row to a table of this view first (copy on write).
+        """
+        self._owns_table = table is None
+        if table is None:
+            if id_ in self.__class__.stations:
+                info = StationInfo.get(id_)
+            else:
+                info = StationInfo(id_, name, *coordinates)
+            table = StationTable(
+                [StationRecord(id=id_, active=True, description='',
+                               bikes=0, free=0)],
+                infos=[info]
+            )
+            row = 0
+        self._table = table
+        self._row = row
         self._location = None
-        self._description = ''
         self._distance = None
-        self._bikes = 0
-        self._free = 0
+        self._forecast = None
+
+    @property
+    def table(self):
+        """Return the `StationTable` holding station data."""
+        return self._table
+
+    def _get_own_table(self):
+        """Return a table of this view only, copying station row if needed.
+
+        Snapshot tables are shared by all handlers and must not change.
+        """
+        if not self._owns_table:
+            self._table = StationTable(
+                [self._table.get_record(self._row)],
+                infos=[self._table.infos[self._row]]
+            )
+            self._row = 0
+            self._owns_table = True
+        return self._table
+
+    @property
+    def row(self):
+        """Return station row in `self.table`."""
+        return self._row
+
+    @property
+    def coordinates(self):
+        """Return a tuple (latitude, longitude)."""
+        return self._table.infos[self._row].coordinates
+
+    @property
+    def latitude(self):
+        """Return latitude."""
+        return self._table.latitudes[self._row]
+
+    @property
+    def longitude(self):
+        """Return longitude."""
+        return self._table.longitudes[self._row]
 
     @property
     def id(self):
         """Return station identification number."""
-        return self._id
+        return self._table.ids[self._row]
 
     @property
     def name(self):
         """Return station name."""
-        return self._name
+        return self._table.infos[self._row].name
 
     @property
     def description(self):
         """Return station description."""
-        return self._description
+        return self._table.descriptions[self._row]
 
     @property
     def is_active(self):
@@ -348,7 +918,7 @@ class Station(Location):
         """
         if self.free == self.bikes == 0:
             return False
-        return self._active
+        return bool(self._table.active[self._row])
 
     @property
     def location(self):
@@ -371,12 +941,17 @@ class Station(Location):
     @property
     def bikes(self):
         """Return number of available bikes."""
-        return self._bikes
+        return self._table.bikes[self._row]
+
+    @property
+    def forecast(self):
+        """Return number of bikes expected to be available soon, or None."""
+        return self._forecast
 
     @property
     def free(self):
         """Return number of free slots."""
-        return self._free
+        return self._table.free[self._row]
 
     def set_active(self, active):
         """Change station status to `active`.
@@ -384,7 +959,7 @@ class Station(Location):
         `active` should be either `True` or `False`.
         """
         assert type(active) is bool, "`active` should be a boolean."
-        self._active = active
+        self._get_own_table().active[self._row] = active
 
     def set_description(self, description):
         """Change station description to `description`.
@@ -392,7 +967,7 @@ class Station(Location):
         `description` should be a string.
         """
         assert type(description) is str, "`description` should be a boolean."
-        self._description = description
+        self._get_own_table().set_description(self._row, description)
 
     def set_location(self, location):
         """Change station location to `location`.
@@ -404,6 +979,23 @@ class Station(Location):
         ), "`location` should be a Location."
         self._location = location
 
+    def set_distance(self, distance):
+        """Set distance from `self.location`, if it was evaluated elsewhere.
+
+        `distance` should be a number.
+        """
+        assert (
+            isinstance(distance, (int, float))
+        ), "`distance` should be a number."
+        self._distance = distance
+
+    def set_forecast(self, forecast):
+        """Set number of bikes expected to be available soon.
+
+        `forecast` should be an int, or None not to show it.
+        """
+        self._forecast = forecast
+
     def set_bikes(self, bikes):
         """Change number of available `bikes`.
 
@@ -412,7 +1004,7 @@ class Station(Location):
         assert (
                 type(bikes) is int
         ), "`bikes` should be an int."
-        self._bikes = bikes
+        self._get_own_table().bikes[self._row] = bikes
 
     def set_free(self, free):
         """Change number of `free` bike parking slots.
@@ -422,18 +1014,21 @@ class Station(Location):
         assert (
                 type(free) is int
         ), "`free` should be an int."
-        self._free = free
+        self._get_own_table().free[self._row] = free
 
     @property
     def status(self):
         """Return station status to be shown to users.
 
-        It includes distance, location, available bikes and free stalls.
+        It includes distance, location, available bikes and free stalls,
+            and bikes forecast if any.
         """
         if self.bikes + self.free == 0:
             bikes_and_stalls = "<i>⚠️ {{not_available}}</i>"
         else:
             bikes_and_stalls = f"🚲 {self.bikes}  |  🅿️ {self.free}"
+            if self.forecast is not None:
+                bikes_and_stalls += f"  |  🔮 {self.forecast}"
         return (
             f"<b>{self.name}</b> | <i>{self.description}</i>\n"
             f"<code>   </code>{bikes_and_stalls}  | 📍 {self.distance:.0f} m"
@@ -442,6 +1037,91 @@ class Station(Location):
         )
 
 
+station_distances = StationDistanceTable(Station.stations)
+station_index = StationGridIndex(Station.stations)
+
+
+class StationDistanceCache:
+    """Cache distance vectors of places sharing the same geohash cell.
+
+    Distances are evaluated from the center of the cell, so they are shared
+        by all users whose places are in that cell (about 38 x 19 metres
+        with default precision).
+    The price is accuracy: a distance may be off by up to half the cell
+        diagonal (about 21 metres with default precision), and two stations
+        whose distances differ by less than twice that may be listed in
+        swapped order.
+    Vectors are kept until the station registry changes.
+    """
+
+    def __init__(self, precision=8, maxsize=1024):
+        """Set geohash `precision` and maximum number of cached vectors."""
+        self._precision = precision
+        self._cache = LRUCache(maxsize=maxsize)
+        self._distance_table = None
+
+    @property
+    def precision(self):
+        """Return geohash precision."""
+        return self._precision
+
+    @property
+    def hits(self):
+        """Return number of vectors found in cache."""
+        return self._cache.hits
+
+    @property
+    def misses(self):
+        """Return number of vectors which had to be evaluated."""
+        return self._cache.misses
+
+    @property
+    def hit_ratio(self):
+        """Return ratio of vectors found in cache."""
+        return self._cache.hit_ratio
+
+    def get_distances(self, latitude, longitude):
+        """Return distances from location cell to every station, in metres.
+
+        Use `station_distances.get_index` to find a station in the result.
+        """
+        if self._distance_table is not station_distances:
+            # Station registry changed: cached vectors are no longer valid
+            self._cache.clear()
+            self._distance_table = station_distances
+        geohash, center = get_geohash(latitude, longitude,
+                                      precision=self._precision)
+        distances = self._cache.get(geohash)
+        if distances is None:
+            distances = station_distances.get_distances(*center)
+            self._cache.set(geohash, distances)
+        return distances
+
+
+distance_cache = StationDistanceCache()
+
+
+def update_station_registry(stations):
+    """Add or update `stations` and rebuild distance table and grid index.
+
+    `stations` : iterable of dicts having `station_id`, `name`, `latitude`
+        and `longitude` keys, such as `ciclopi_stations` table records.
+    """
+    global station_distances, station_index
+    for station in stations:
+        Station.stations[station['station_id']] = dict(
+            name=station['name'],
+            coordinates=(
+                float(station['latitude']),
+                float(station['longitude'])
+            )
+        )
+    StationInfo.clear()
+    StationTable.clear_layouts()
+    station_distances = StationDistanceTable(Station.stations)
+    station_index = StationGridIndex(Station.stations)
+
+
 def ciclopi_custom_sorter(custom_order):
     """Return a function to sort stations by a `custom_order`."""
     custom_values = {
@@ -461,8 +1141,26 @@ def ciclopi_custom_sorter(custom_order):
     return sorter
 
 
-def _get_stations(data, location):
-    stations = []
+def get_sorting_method(sorting_code, custom_order):
+    """Return the key function sorting stations as `sorting_code` says.
+
+    `sorting_code` : int
+        A key of `CICLOPI_SORTING_CHOICES`.
+    `custom_order` : list of `ciclopi_custom_order` records
+        Used if sorting is custom.
+    """
+    if sorting_code in (0, 2):
+        return lambda station: station.distance
+    if sorting_code == 1:
+        return lambda station: station.name
+    if sorting_code == 3:
+        return ciclopi_custom_sorter(custom_order)
+    return lambda station: 0
+
+
+def _get_station_records(data):
+    """Return a list of `StationRecord`s from BeautifulSoup object `data`."""
+    records = []
     for _station in data.find_all(
             "li",
             attrs={"class": "rrItem"}
@@ -487,19 +1185,15 @@ def _get_stations(data, location):
             station_id = 0
         else:
             station_id = int(station_id)
-        station = Station(station_id)
-        station.set_active(active)
-        station.set_description(
-            _station.find(
-                "span",
-                attrs={"class": "TableComune"}
-            ).text.replace(
-                'a`',
-                'à'
-            ).replace(
-                'e`',
-                'è'
-            )
+        description = _station.find(
+            "span",
+            attrs={"class": "TableComune"}
+        ).text.replace(
+            'a`',
+            'à'
+        ).replace(
+            'e`',
+            'è'
         )
         bikes_text = _station.find(
             "span",
@@ -519,66 +1213,1059 @@ def _get_stations(data, location):
                 )
                 for s in bikes_text.split('\t')
             ]
-        station.set_bikes(bikes)
-        station.set_free(free)
-        station.set_location(location)
-        stations.append(
-            station
+        records.append(
+            StationRecord(
+                id=station_id,
+                active=active,
+                description=description,
+                bikes=bikes,
+                free=free
+            )
         )
-    return stations
+    return records
 
 
-async def set_ciclopi_location(bot: davtelepot.bot.Bot,
-                               update: dict, user_record: OrderedDict,
-                               language: str):
-    """Take a location update and store it as CicloPi place.
+def _get_stations(data, location):
+    return StationTable(_get_station_records(data)).get_stations(location)
 
-    CicloPi stations will be sorted by distance from this place.
+
+StationRecord = namedtuple(
+    'StationRecord',
+    ['id', 'active', 'description', 'bikes', 'free']
+)
+
+
+class StationInfo:
+    """Static data of a CicloPi station, shared by all its views.
+
+    Use `StationInfo.get(station_id)` to get the only instance of each
+        station in `Station.stations`.
     """
-    location = update['location']
-    chat_id = update['chat']['id']
-    telegram_id = update['from']['id']
-    with bot.db as db:
-        db['ciclopi'].upsert(
-            dict(
-                chat_id=chat_id,
-                latitude=location['latitude'],
-                longitude=location['longitude']
-            ),
-            ['chat_id']
-        )
-    await bot.send_message(
-        chat_id=chat_id,
-        text=bot.get_message(
-            'ciclopi', 'set_position', 'success',
-            update=update, user_record=user_record
-        )
-    )
-    # Remove individual text message handler which was set to catch `/cancel`
-    bot.remove_individual_text_message_handler(telegram_id)
-    return await _ciclopi_command(bot=bot, update=update,
-                                  user_record=user_record, language=language)
 
+    __slots__ = ('id', 'name', 'latitude', 'longitude', 'coordinates')
 
-async def cancel_ciclopi_location(bot, update, user_record):
-    """Handle the situation in which a user does not send location on request.
+    _instances = {}
 
-    This function is set as individual text message handler when the bot
-        requests user's location and is removed if user does send one.
-        If not, return a proper message.
+    def __init__(self, id_, name, latitude, longitude):
+        """Set station identification number, name and coordinates."""
+        self.id = id_
+        self.name = name
+        self.latitude = latitude
+        self.longitude = longitude
+        self.coordinates = (latitude, longitude)
+
+    @classmethod
+    def get(cls, id_):
+        """Return the shared `StationInfo` of station `id_`."""
+        info = cls._instances.get(id_)
+        if info is None:
+            station = Station.stations.get(id_, {})
+            info = cls(id_, station.get('name', 'unknown'),
+                       *station.get('coordinates', (91.0, 181.0)))
+            cls._instances[id_] = info
+        return info
+
+    @classmethod
+    def clear(cls):
+        """Forget all instances, e.g. after `Station.stations` changed."""
+        cls._instances.clear()
+
+
+class StationTable:
+    """Data of many CicloPi stations, stored column-wise in arrays.
+
+    Station ids, available bikes, free stalls, active flags and coordinates
+        are kept in contiguous `array.array`s; descriptions in a tuple.
+    Columns depending only on station ids (infos, coordinates and rows by
+        id) are shared by tables listing the same stations.
     """
-    text = get_cleaned_text(bot=bot, update=update)
-    # If user cancels operation, confirm that it was cancelled
-    if text.lower() == 'annulla':
-        return bot.get_message(
-            'ciclopi', 'set_position', 'cancel',
-            update=update, user_record=user_record
+
+    __slots__ = ('_ids', '_bikes', '_free', '_active', '_descriptions',
+                 '_layout')
+
+    _layouts = LRUCache(maxsize=16)
+
+    def __init__(self, records, infos=None):
+        """Store `records` (iterable of `StationRecord`s) in columns.
+
+        `infos` : list of `StationInfo`
+            Static data of stations, defaults to `StationInfo.get(id)`.
+        """
+        records = list(records)
+        self._ids = array.array('i', [record.id for record in records])
+        self._bikes = array.array('i', [record.bikes for record in records])
+        self._free = array.array('i', [record.free for record in records])
+        self._active = array.array('b', [record.active for record in records])
+        self._descriptions = tuple(
+            sys.intern(record.description) for record in records
         )
-    # If user writes something else, remind them how to set position later
-    return bot.get_message(
-        'ciclopi', 'set_position', 'cancel_and_remind',
-        update=update, user_record=user_record
-    )
+        if infos is not None:
+            self._layout = self._get_layout(self._ids, infos)
+            return
+        key = self._ids.tobytes()
+        self._layout = self.__class__._layouts.get(key)
+        if self._layout is None:
+            self._layout = self._get_layout(
+                self._ids,
+                [StationInfo.get(id_) for id_ in self._ids]
+            )
+            self.__class__._layouts.set(key, self._layout)
+
+    @staticmethod
+    def _get_layout(ids, infos):
+        """Return (infos, latitudes, longitudes, rows by id) columns."""
+        return (
+            tuple(infos),
+            array.array('d', [info.latitude for info in infos]),
+            array.array('d', [info.longitude for info in infos]),
+            {id_: row for row, id_ in enumerate(ids)}
+        )
+
+    @classmethod
+    def clear_layouts(cls):
+        """Forget shared columns, e.g. after `Station.stations` changed."""
+        cls._layouts.clear()
+
+    @property
+    def ids(self):
+        """Return station identification numbers."""
+        return self._ids
+
+    @property
+    def bikes(self):
+        """Return numbers of available bikes."""
+        return self._bikes
+
+    @property
+    def free(self):
+        """Return numbers of free stalls."""
+        return self._free
+
+    @property
+    def active(self):
+        """Return active flags (1 if station is not marked as inactive)."""
+        return self._active
+
+    @property
+    def descriptions(self):
+        """Return station descriptions."""
+        return self._descriptions
+
+    @property
+    def infos(self):
+        """Return `StationInfo`s."""
+        return self._layout[0]
+
+    @property
+    def latitudes(self):
+        """Return station latitudes."""
+        return self._layout[1]
+
+    @property
+    def longitudes(self):
+        """Return station longitudes."""
+        return self._layout[2]
+
+    def __len__(self):
+        return len(self._ids)
+
+    def __contains__(self, station_id):
+        return station_id in self._layout[3]
+
+    def __iter__(self):
+        for row in range(len(self._ids)):
+            yield self.get_record(row)
+
+    def get_row(self, station_id):
+        """Return row of `station_id`, or None if it is missing."""
+        return self._layout[3].get(station_id)
+
+    def get_record(self, row):
+        """Return `StationRecord` of `row`."""
+        return StationRecord(
+            id=self._ids[row],
+            active=bool(self._active[row]),
+            description=self._descriptions[row],
+            bikes=self._bikes[row],
+            free=self._free[row]
+        )
+
+    def set_description(self, row, description):
+        """Change description of station in `row`."""
+        descriptions = list(self._descriptions)
+        descriptions[row] = sys.intern(description)
+        self._descriptions = tuple(descriptions)
+
+    def get_station(self, row, location=None, distance=None):
+        """Return a `Station` view of `row`."""
+        station = Station(table=self, row=row)
+        if location is not None:
+            station.set_location(location)
+        if distance is not None:
+            station.set_distance(distance)
+        return station
+
+    def get_stations(self, location=None):
+        """Return a new list of `Station` views, one per row.
+
+        Distances will be evaluated from `location`.
+        """
+        if location is None:
+            return [self.get_station(row) for row in range(len(self._ids))]
+        distances = distance_cache.get_distances(
+            location.latitude, location.longitude
+        )
+        stations = []
+        for row, station_id in enumerate(self._ids):
+            distance = None
+            if station_id in station_distances:
+                distance = float(
+                    distances[station_distances.get_index(station_id)]
+                )
+            stations.append(self.get_station(row, location, distance))
+        return stations
+
+
+_RR_ITEM_PATTERN = re.compile(
+    r'<li\b[^>]*\bclass="(?:[^"]*\s)?rrItem(?:\s[^"]*)?"[^>]*>'
+)
+_LOOSE_RR_ITEM_PATTERN = re.compile(r'<li\b[^>]*rrItem', re.IGNORECASE)
+_TAG_PATTERN = re.compile(r'<[^>]*>')
+_COMMENT_PATTERN = re.compile(r'<!--.*?-->', re.DOTALL)
+_NOT_A_DIGIT_PATTERN = re.compile(r'\D+')
+
+
+def _compile_element_patterns(tag, class_):
+    """Return patterns matching opening `tag` having `class_` and any `tag`."""
+    return (
+        re.compile(
+            rf'<{tag}\b[^>]*\bclass="(?:[^"]*\s)?{class_}(?:\s[^"]*)?"[^>]*>'
+        ),
+        re.compile(rf'<(/?){tag}\b[^>]*>')
+    )
+
+
+_STATION_NAME_PATTERNS = _compile_element_patterns('span', 'Stazione')
+_STATION_ID_PATTERNS = _compile_element_patterns('div', 'cssNumero')
+_DESCRIPTION_PATTERNS = _compile_element_patterns('span', 'TableComune')
+_BIKES_PATTERNS = _compile_element_patterns('span', 'Red')
+
+
+# Usual markup of a station item: elements in this order, without nested tags
+#   except for the bikes `span`, whose content is scanned separately.
+_STATION_ITEM_PATTERN = re.compile(
+    r'[^<]*<div class="cssNumero">(?P<id>[^<]*)</div>'
+    r'.*?<span class="Stazione">(?P<name>[^<]*)</span>'
+    r'.*?<span class="TableComune">(?P<description>[^<]*)</span>'
+    r'.*?<span class="Red">',
+    re.DOTALL
+)
+
+
+def _get_text_nodes(item, tag_pattern, start):
+    """Return the list of text nodes of the element whose content begins at
+        `start`.
+
+    Elements are matched with balanced opening and closing tags, in order to
+        yield the same text nodes as BeautifulSoup `get_text`.
+    Raise ValueError if element is not closed.
+    """
+    depth = 1
+    for tag in tag_pattern.finditer(item, start):
+        depth += -1 if tag.group(1) else 1
+        if depth == 0:
+            break
+    else:
+        raise ValueError(f"Unclosed element `{tag_pattern.pattern}`")
+    return [
+        html.unescape(text_node)
+        for text_node in _TAG_PATTERN.split(item[start:tag.start()])
+        if text_node
+    ]
+
+
+def _get_element_text_nodes(item, patterns):
+    """Return the list of text nodes of the first element matching `patterns`.
+
+    Raise ValueError if no element matches.
+    """
+    opening_pattern, tag_pattern = patterns
+    opening_tag = opening_pattern.search(item)
+    if opening_tag is None:
+        raise ValueError(f"Missing element `{opening_pattern.pattern}`")
+    return _get_text_nodes(item, tag_pattern, opening_tag.end())
+
+
+def _extract_station_records(page):
+    """Extract `StationRecord`s from CicloPi `page` text.
+
+    This is a faster alternative to `_get_stations` for the markup of
+        `frmLeStazioni.aspx`, yielding the same data without building a
+        BeautifulSoup tree.
+    Comments are dropped, as BeautifulSoup ignores them as well.
+    Raise ValueError if markup does not match the expected one: callers
+        should then fall back to `_get_stations`.
+    """
+    if '<!--' in page:
+        page = _COMMENT_PATTERN.sub('', page)
+        if '<!--' in page:
+            raise ValueError("Unclosed comment")
+    starts = [match.start() for match in _RR_ITEM_PATTERN.finditer(page)]
+    if (
+            not starts
+            or len(starts) != len(_LOOSE_RR_ITEM_PATTERN.findall(page))
+    ):
+        raise ValueError("Unexpected station list markup")
+    records = []
+    for start, end in zip(starts, starts[1:] + [len(page)]):
+        item = page[start:end]
+        usual_item = _STATION_ITEM_PATTERN.match(
+            item, item.index('>') + 1
+        )
+        if usual_item is not None:
+            station_name = html.unescape(usual_item.group('name'))
+            station_id = html.unescape(usual_item.group('id'))
+            description = html.unescape(usual_item.group('description'))
+            bikes_text = _get_text_nodes(item, _BIKES_PATTERNS[1],
+                                         usual_item.end())
+        else:
+            station_name = ''.join(
+                _get_element_text_nodes(item, _STATION_NAME_PATTERNS)
+            )
+            station_id = ''.join(
+                _get_element_text_nodes(item, _STATION_ID_PATTERNS)
+            )
+            description = ''.join(
+                _get_element_text_nodes(item, _DESCRIPTION_PATTERNS)
+            )
+            bikes_text = _get_element_text_nodes(item, _BIKES_PATTERNS)
+        description = description.replace('a`', 'à').replace('e`', 'è')
+        if len(bikes_text) < 2:
+            bikes, free = 0, 0
+        else:
+            bikes, free, *other = [
+                int(_NOT_A_DIGIT_PATTERN.sub('', s))
+                for s in bikes_text
+            ]
+        records.append(
+            StationRecord(
+                id=int(station_id) if station_id.isnumeric() else 0,
+                active='Non operativa' not in station_name,
+                description=description,
+                bikes=bikes,
+                free=free
+            )
+        )
+    return records
+
+
+def _get_station_list_hash(page):
+    """Return a hash of the station list in `page` text.
+
+    Only the markup from first to last station item is considered, so that
+        changes elsewhere in the page (e.g. ASP.NET view state) are ignored.
+    """
+    first_item = _RR_ITEM_PATTERN.search(page)
+    start = first_item.start() if first_item is not None else 0
+    end = page.rfind('</li>', start)
+    fragment = page[start:end] if end >= 0 else page[start:]
+    return hashlib.blake2b(fragment.encode('utf-8'), digest_size=16).digest()
+
+
+class StationSnapshot:
+    """Read-only table of CicloPi stations parsed from one web page.
+
+    Snapshots are shared among all handlers: do not edit them, use
+        `get_stations` to get `Station` views for a single request.
+    """
+
+    __slots__ = ('_table', '_version', '_fetched_at')
+
+    def __init__(self, records, version, fetched_at):
+        """Store `records` in a `StationTable`, with version and datetime."""
+        self._table = StationTable(records)
+        self._version = version
+        self._fetched_at = fetched_at
+
+    @property
+    def table(self):
+        """Return the `StationTable` of snapshot stations."""
+        return self._table
+
+    @property
+    def records(self):
+        """Return a tuple of `StationRecord`s."""
+        return tuple(self._table)
+
+    @property
+    def version(self):
+        """Return snapshot version number.
+
+        It is increased each time a new web page is parsed.
+        """
+        return self._version
+
+    @property
+    def fetched_at(self):
+        """Return datetime of web page download."""
+        return self._fetched_at
+
+    @property
+    def is_working(self):
+        """Return True if at least one station is active."""
+        table = self._table
+        return any(
+            active and bikes + free > 0
+            for active, bikes, free in zip(table.active, table.bikes,
+                                           table.free)
+        )
+
+    def __len__(self):
+        return len(self._table)
+
+    def __iter__(self):
+        return iter(self._table)
+
+    def get_stations(self, location=None):
+        """Return a new list of `Station`s for a single request.
+
+        Distances will be evaluated from `location`.
+        """
+        return self._table.get_stations(location)
+
+    def get_nearest_stations(self, location, k, min_bikes=0, min_free=0):
+        """Return a list of the `k` `Station`s nearest to `location`.
+
+        Only stations having at least `min_bikes` available bikes and
+            `min_free` free stalls are considered.
+        """
+        table = self._table
+        bikes, free = table.bikes, table.free
+        rows = {}
+        for station_id in table.ids:
+            row = table.get_row(station_id)
+            if bikes[row] >= min_bikes and free[row] >= min_free:
+                rows[station_id] = row
+        return [
+            table.get_station(rows[station_id], location, distance)
+            for distance, station_id in station_index.get_nearest(
+                location.latitude, location.longitude, k=k,
+                condition=rows.__contains__
+            )
+        ]
+
+
+class SingleFlight:
+    """Run at most one call at a time per key.
+
+    Callers arriving while a call is running await the same future instead
+        of starting a new call. The number of such waiters is counted for
+        each call.
+
+    Usage:
+    fetches = SingleFlight()
+    page = await fetches.run('page', download, url)
+    """
+
+    def __init__(self):
+        """Start with no running call."""
+        self._futures = {}
+        self._waiters = {}
+        self._calls = 0
+        self._coalesced = 0
+        self._last_waiters = 0
+        self._max_waiters = 0
+
+    @property
+    def calls(self):
+        """Return number of calls actually run."""
+        return self._calls
+
+    @property
+    def coalesced(self):
+        """Return number of callers served by a call started by others."""
+        return self._coalesced
+
+    @property
+    def last_waiters(self):
+        """Return number of waiters served by last completed call."""
+        return self._last_waiters
+
+    @property
+    def max_waiters(self):
+        """Return highest number of waiters served by a single call."""
+        return self._max_waiters
+
+    def is_running(self, key):
+        """Return True if a call is running under `key`."""
+        return key in self._futures
+
+    async def run(self, key, function, *args, **kwargs):
+        """Return result of `function(*args, **kwargs)` coroutine.
+
+        If a call is already running under `key`, await its result instead.
+        Cancelling a caller does not cancel the shared call.
+        """
+        future = self._futures.get(key)
+        if future is not None:
+            self._waiters[key] += 1
+            self._coalesced += 1
+            return await asyncio.shield(future)
+        future = asyncio.ensure_future(function(*args, **kwargs))
+        self._futures[key] = future
+        self._waiters[key] = 0
+        self._calls += 1
+        future.add_done_callback(
+            functools.partial(self._forget, key)
+        )
+        return await asyncio.shield(future)
+
+    def _forget(self, key, future):
+        if self._futures.get(key) is not future:
+            return
+        del self._futures[key]
+        waiters = self._waiters.pop(key)
+        self._last_waiters = waiters
+        self._max_waiters = max(self._max_waiters, waiters)
+        if waiters:
+            logging.debug(f"Call `{key}` served {waiters} more waiters")
+
+
+class StationSnapshotProvider:
+    """Parse each download of a `CachedPage` exactly once.
+
+    User requests should call `get_latest_snapshot`, which never waits for
+        a download once a snapshot is available: `run_refresher` keeps it
+        up to date in background while there is traffic.
+
+    Usage:
+    snapshot = await ciclopi_snapshots.get_latest_snapshot()
+    stations = snapshot.get_stations(location)
+    """
+
+    def __init__(self, cached_page, lead_time=2, idle_time=120,
+                 max_staleness=datetime.timedelta(minutes=2)):
+        """Set `cached_page` as source of station data.
+
+        `lead_time` : int or float
+            Seconds before page expiry when background refresh starts.
+        `idle_time` : int or float
+            Seconds without requests after which background refresh stops.
+        `max_staleness` : datetime.timedelta
+            Age of last download beyond which requests wait for a refresh.
+        """
+        self._cached_page = cached_page
+        self._max_staleness = max_staleness
+        self._snapshot = None
+        self._version = 0
+        self._content_hash = None
+        self._checked_at = None
+        self._unchanged = 0
+        self._lead_time = lead_time
+        self._idle_time = idle_time
+        self._last_request = None
+        self._traffic = None
+        self._refresh_task = None
+        self._fetches = SingleFlight()
+        self._snapshot_handlers = []
+        self._fallbacks = 0
+
+    @property
+    def fetches(self):
+        """Return the `SingleFlight` coalescing page downloads."""
+        return self._fetches
+
+    @property
+    def snapshot(self):
+        """Return last parsed snapshot, or None if nothing was parsed yet."""
+        return self._snapshot
+
+    @property
+    def version(self):
+        """Return version number of last parsed snapshot."""
+        return self._version
+
+    @property
+    def fetched_at(self):
+        """Return datetime of last parsed web page download."""
+        if self._snapshot is None:
+            return None
+        return self._snapshot.fetched_at
+
+    def add_snapshot_handler(self, handler):
+        """Call `handler(snapshot, previous_snapshot)` on each new snapshot.
+
+        `previous_snapshot` is None for the first snapshot.
+        Handlers run synchronously right after parsing: they must be fast.
+        """
+        self._snapshot_handlers.append(handler)
+
+    @property
+    def checked_at(self):
+        """Return datetime of last web page download, changed or not."""
+        return self._checked_at
+
+    @property
+    def unchanged(self):
+        """Return number of downloads whose station list did not change."""
+        return self._unchanged
+
+    def update(self, data, fetched_at):
+        """Parse `data` only if its station list changed; return snapshot.
+
+        If station list is the same as last parsed one, current snapshot
+            (and its version) is kept.
+        """
+        self._checked_at = fetched_at
+        content_hash = None
+        if isinstance(data, str):
+            content_hash = _get_station_list_hash(data)
+            if (
+                    self._snapshot is not None
+                    and content_hash == self._content_hash
+            ):
+                self._unchanged += 1
+                logging.debug(f"CicloPi station list unchanged, "
+                              f"snapshot {self._version} kept")
+                return self._snapshot
+        return self.parse(data=data, fetched_at=fetched_at,
+                          content_hash=content_hash)
+
+    def parse(self, data, fetched_at, content_hash=None):
+        """Parse `data` into a new `StationSnapshot` and store it.
+
+        `data` may be either the page text or a BeautifulSoup object.
+        Page text is parsed with `_extract_station_records`, falling back
+            to `_get_stations` if markup does not match.
+        `content_hash` is the hash of page station list, if known.
+        """
+        self._checked_at = fetched_at
+        if content_hash is None and isinstance(data, str):
+            content_hash = _get_station_list_hash(data)
+        self._content_hash = content_hash
+        started_at = time.perf_counter()
+        records = None
+        if isinstance(data, str):
+            try:
+                records = _extract_station_records(data)
+            except ValueError as e:
+                # Warn once: markup is likely to stay the same for a while
+                self._fallbacks += 1
+                logging.log(
+                    logging.WARNING if self._fallbacks == 1 else logging.DEBUG,
+                    f"Fast CicloPi extractor failed ({e}), "
+                    f"falling back to BeautifulSoup"
+                )
+                data = BeautifulSoup(data, "html.parser")
+        if records is None:
+            records = _get_station_records(data)
+        self._version += 1
+        previous_snapshot = self._snapshot
+        self._snapshot = StationSnapshot(
+            records=records,
+            version=self._version,
+            fetched_at=fetched_at
+        )
+        parse_seconds.observe(time.perf_counter() - started_at)
+        logging.debug(
+            f"CicloPi snapshot {self._version} parsed "
+            f"({len(self._snapshot)} stations)"
+        )
+        for handler in self._snapshot_handlers:
+            try:
+                handler(self._snapshot, previous_snapshot)
+            except Exception as e:
+                logging.error(f"Error handling CicloPi snapshot: {e}",
+                              exc_info=True)
+        return self._snapshot
+
+    async def get_snapshot(self):
+        """Refresh web page if necessary and return up-to-date snapshot.
+
+        Return None if web page is unavailable.
+        """
+        if self._cached_page.is_old:
+            return await self.refresh()
+        data = self._cached_page.page
+        if data is None or isinstance(data, Exception):
+            return None
+        if self._checked_at != self._cached_page.last_update:
+            self.update(data=data,
+                        fetched_at=self._cached_page.last_update)
+        return self._snapshot
+
+    @property
+    def is_idle(self):
+        """Return True if no snapshot was requested in last `idle_time` s."""
+        return (
+            self._last_request is None
+            or time.monotonic() - self._last_request > self._idle_time
+        )
+
+    async def refresh(self):
+        """Download web page now and return its snapshot.
+
+        Concurrent calls share a single download and parse.
+        Return None if web page is unavailable.
+        """
+        return await self._fetches.run('refresh', self._refresh)
+
+    async def _refresh(self):
+        if await self._cached_page.refresh():
+            return None
+        data = self._cached_page.page
+        if data is None or isinstance(data, Exception):
+            return None
+        return self.update(data=data, fetched_at=self._cached_page.last_update)
+
+    def refresh_in_background(self):
+        """Start a background refresh, unless one is running, and return it."""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.ensure_future(self.refresh())
+        return self._refresh_task
+
+    async def get_latest_snapshot(self):
+        """Return latest snapshot, usually without waiting for downloads.
+
+        If snapshot is out of date, a background refresh is started and the
+            stale snapshot is returned anyway.
+        Downloads are awaited only if no snapshot is available yet, or if
+            web page was last downloaded more than `max_staleness` ago (e.g.
+            after an idle period). If that download fails, the stale
+            snapshot is returned.
+        """
+        self._last_request = time.monotonic()
+        if self._traffic is not None:
+            self._traffic.set()
+        if self._snapshot is None:
+            return await self.get_snapshot()
+        if not self._cached_page.is_old:
+            return self._snapshot
+        refresh = self.refresh_in_background()
+        if (
+                self._checked_at is None
+                or datetime.datetime.now() - self._checked_at
+                > self._max_staleness
+        ):
+            return await asyncio.shield(refresh) or self._snapshot
+        return self._snapshot
+
+    async def run_refresher(self):
+        """Refresh web page `lead_time` seconds before it expires.
+
+        Go idle when no snapshot was requested in last `idle_time` seconds,
+            until next request.
+        """
+        self._traffic = asyncio.Event()
+        while 1:
+            if self.is_idle:
+                logging.debug("CicloPi refresher idle")
+                self._traffic.clear()
+                await self._traffic.wait()
+                logging.debug("CicloPi refresher resumed")
+                continue
+            delay = (
+                self._cached_page.last_update
+                + self._cached_page.cache_time
+                - datetime.datetime.now()
+            ).total_seconds() - self._lead_time
+            if delay > 0:
+                await asyncio.sleep(delay)
+                continue
+            if await self.refresh_in_background() is None:
+                # Download failed: do not retry immediately
+                await asyncio.sleep(max(self._lead_time, 1))
+
+
+ciclopi_snapshots = StationSnapshotProvider(ciclopi_web_page)
+
+
+class CicloPiDatabase:
+    """Run queries on CicloPi tables in background threads.
+
+    Queries are functions taking a `dataset.Database` as first argument:
+        they are run inside a transaction, away from the event loop.
+    A single writer thread owns the only connection used for writing, while
+        reads are spread over a pool of threads having a connection each.
+
+    Usage:
+    record = await ciclopi_db.read(
+        lambda db: db['ciclopi'].find_one(chat_id=chat_id)
+    )
+    """
+
+    def __init__(self, database_url, readers=4):
+        """Connect to `database_url` and start writer and reader threads."""
+        on_connect_statements = []
+        if database_url.startswith('sqlite'):
+            # Let readers go on while the writer is committing.
+            #   Journal mode is stored in the database file: the whole bot
+            #   database stays in WAL mode from now on.
+            on_connect_statements = ['PRAGMA journal_mode=WAL',
+                                     'PRAGMA busy_timeout=5000']
+        self._writer = dataset.connect(
+            database_url,
+            on_connect_statements=on_connect_statements
+        )
+        self._reader = dataset.connect(
+            database_url,
+            on_connect_statements=on_connect_statements
+        )
+        self._write_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='ciclopi_db_writer'
+        )
+        self._read_executor = ThreadPoolExecutor(
+            max_workers=readers,
+            thread_name_prefix='ciclopi_db_reader'
+        )
+
+    @staticmethod
+    def _run_in_transaction(database, function, *args, **kwargs):
+        with database as db:
+            return function(db, *args, **kwargs)
+
+    async def read(self, function, *args, **kwargs):
+        """Run `function(db, *args, **kwargs)` in a reader thread."""
+        return await asyncio.get_event_loop().run_in_executor(
+            self._read_executor,
+            functools.partial(self._run_in_transaction, self._reader,
+                              function, *args, **kwargs)
+        )
+
+    async def write(self, function, *args, **kwargs):
+        """Run `function(db, *args, **kwargs)` in the writer thread."""
+        return await asyncio.get_event_loop().run_in_executor(
+            self._write_executor,
+            functools.partial(self._run_in_transaction, self._writer,
+                              function, *args, **kwargs)
+        )
+
+    def close(self):
+        """Wait for pending queries, stop threads and close connections."""
+        self._write_executor.shutdown(wait=True)
+        self._read_executor.shutdown(wait=True)
+        self._writer.close()
+        self._reader.close()
+
+
+def _get_chat_settings(db, chat_id):
+    """Return `chat_id` CicloPi record and custom order as plain dicts."""
+    record = db['ciclopi'].find_one(chat_id=chat_id)
+    return dict(
+        record=(dict(record) if record is not None else None),
+        custom_order=[
+            dict(order_record)
+            for order_record in db['ciclopi_custom_order'].find(
+                chat_id=chat_id,
+                order_by=['value']
+            )
+        ]
+    )
+
+
+class CicloPiSettingsCache:
+    """Keep CicloPi settings of recently active chats in memory.
+
+    For each chat, store its `ciclopi` table record (or None) and its
+        `ciclopi_custom_order` records sorted by value.
+    Settings are loaded lazily from database; handlers editing them must
+        write to database and then update this cache (write-through).
+    Concurrent misses about a chat share a single read. If the chat is
+        written while that read is running, it is read again, as it may
+        return the settings before the write.
+
+    Usage:
+    ciclopi_record = await ciclopi_settings.get_record(chat_id)
+    ...
+    await ciclopi_db.write(
+        lambda db: db['ciclopi'].upsert(dict(chat_id=chat_id, sorting=1),
+                                        ['chat_id'])
+    )
+    ciclopi_settings.update_record(chat_id, sorting=1)
+    """
+
+    def __init__(self, maxsize=4096):
+        """Set maximum number of chats to be kept in memory."""
+        self._cache = LRUCache(maxsize=maxsize)
+        # Chat id -> task reading its settings
+        self._loads = {}
+        # Chats written while their settings were being read
+        self._written = set()
+
+    @property
+    def hit_ratio(self):
+        """Return ratio of settings found in memory."""
+        return self._cache.hit_ratio
+
+    async def _get_settings(self, chat_id):
+        settings = self._cache.get(chat_id)
+        if settings is not None:
+            return settings
+        load = self._loads.get(chat_id)
+        if load is None:
+            load = self._loads[chat_id] = asyncio.ensure_future(
+                self._load(chat_id)
+            )
+        return await asyncio.shield(load)
+
+    async def _load(self, chat_id):
+        try:
+            while 1:
+                self._written.discard(chat_id)
+                settings = await ciclopi_db.read(_get_chat_settings, chat_id)
+                if chat_id not in self._written:
+                    break
+            self._cache.set(chat_id, settings)
+            return settings
+        finally:
+            del self._loads[chat_id]
+            self._written.discard(chat_id)
+
+    def _set_written(self, chat_id):
+        """Make running reads of `chat_id` settings start over."""
+        if chat_id in self._loads:
+            self._written.add(chat_id)
+
+    async def get_record(self, chat_id):
+        """Return a copy of `chat_id` record in `ciclopi` table, or None."""
+        record = (await self._get_settings(chat_id))['record']
+        if record is None:
+            return None
+        return dict(record)
+
+    async def get_custom_order(self, chat_id):
+        """Return a copy of `chat_id` records in `ciclopi_custom_order` table.
+
+        Records are sorted by value.
+        """
+        return list((await self._get_settings(chat_id))['custom_order'])
+
+    def update_record(self, chat_id, **fields):
+        """Update `chat_id` record after an upsert in `ciclopi` table."""
+        self._set_written(chat_id)
+        if chat_id not in self._cache:
+            return
+        settings = self._cache.get(chat_id)
+        if settings['record'] is None:
+            # A new record was inserted: read it with all its columns
+            self.invalidate(chat_id)
+            return
+        settings['record'].update(fields)
+
+    def set_custom_order(self, chat_id, custom_order):
+        """Replace `chat_id` custom order after editing it in database."""
+        self._set_written(chat_id)
+        if chat_id not in self._cache:
+            return
+        self._cache.get(chat_id)['custom_order'] = sorted(
+            (dict(record) for record in custom_order),
+            key=lambda record: record['value']
+        )
+
+    def invalidate(self, chat_id):
+        """Forget `chat_id` settings: they will be read again from database."""
+        self._set_written(chat_id)
+        self._cache.pop(chat_id)
+
+
+ciclopi_settings = CicloPiSettingsCache()
+
+
+class CicloPiResponseCache:
+    """Cache `/ciclopi` responses, i.e. (text, reply_markup) tuples.
+
+    Responses are stored by snapshot version and view parameters, and are
+        dropped as soon as a new snapshot gets parsed.
+    """
+
+    def __init__(self, maxsize=1024):
+        """Set maximum number of responses to be stored."""
+        self._cache = LRUCache(maxsize=maxsize)
+        self._version = None
+
+    @property
+    def hit_ratio(self):
+        """Return ratio of responses found in cache."""
+        return self._cache.hit_ratio
+
+    def _check_version(self, version):
+        if version != self._version:
+            self._cache.clear()
+            self._version = version
+
+    def get(self, version, key):
+        """Return response stored under `key` for snapshot `version`."""
+        self._check_version(version)
+        return self._cache.get(key)
+
+    def set(self, version, key, response):
+        """Store `response` under `key` for snapshot `version`."""
+        self._check_version(version)
+        self._cache.set(key, response)
+
+
+ciclopi_responses = CicloPiResponseCache()
+
+ciclopi_outbox = OutboundQueue()
+
+
+async def set_ciclopi_location(bot: davtelepot.bot.Bot,
+                               update: dict, user_record: OrderedDict,
+                               language: str):
+    """Take a location update and store it as CicloPi place.
+
+    CicloPi stations will be sorted by distance from this place.
+    """
+    location = update['location']
+    chat_id = update['chat']['id']
+    telegram_id = update['from']['id']
+    await ciclopi_db.write(
+        lambda db: db['ciclopi'].upsert(
+            dict(
+                chat_id=chat_id,
+                latitude=location['latitude'],
+                longitude=location['longitude']
+            ),
+            ['chat_id']
+        )
+    )
+    ciclopi_settings.update_record(chat_id,
+                                   latitude=location['latitude'],
+                                   longitude=location['longitude'])
+    await ciclopi_outbox.send(
+        bot.send_message,
+        chat_id=chat_id,
+        text=bot.get_message(
+            'ciclopi', 'set_position', 'success',
+            update=update, user_record=user_record
+        )
+    )
+    # Remove individual text message handler which was set to catch `/cancel`
+    bot.remove_individual_text_message_handler(telegram_id)
+    return await _ciclopi_command(bot=bot, update=update,
+                                  user_record=user_record, language=language)
+
+
+async def cancel_ciclopi_location(bot, update, user_record):
+    """Handle the situation in which a user does not send location on request.
+
+    This function is set as individual text message handler when the bot
+        requests user's location and is removed if user does send one.
+        If not, return a proper message.
+    """
+    text = get_cleaned_text(bot=bot, update=update)
+    # If user cancels operation, confirm that it was cancelled
+    if text.lower() == 'annulla':
+        return bot.get_message(
+            'ciclopi', 'set_position', 'cancel',
+            update=update, user_record=user_record
+        )
+    # If user writes something else, remind them how to set position later
+    return bot.get_message(
+        'ciclopi', 'set_position', 'cancel_and_remind',
+        update=update, user_record=user_record
+    )
 
 
 async def _ciclopi_command(bot: davtelepot.bot.Bot, update: dict,
@@ -605,214 +2292,256 @@ async def _ciclopi_command(bot: davtelepot.bot.Bot, update: dict,
         #     )
         # )
     )
-    ciclopi_data = await ciclopi_web_page.get_page()
-    if ciclopi_data is None or isinstance(ciclopi_data, Exception):
+    snapshot = await ciclopi_snapshots.get_latest_snapshot()
+    response = None
+    if snapshot is None:
         text = bot.get_message(
             'ciclopi', 'command', 'unavailable_website',
             update=update, user_record=user_record
         )
     else:
-        with bot.db as db:
-            ciclopi_record = db['ciclopi'].find_one(
-                chat_id=chat_id
-            )
-            custom_order = list(
-                db['ciclopi_custom_order'].find(
-                    chat_id=chat_id
-                )
-            )
+        ciclopi_record = await ciclopi_settings.get_record(chat_id)
+        custom_order = await ciclopi_settings.get_custom_order(chat_id)
+        if (
+                ciclopi_record is not None
+                and isinstance(ciclopi_record, dict)
+                and 'sorting' in ciclopi_record
+                and ciclopi_record['sorting'] in CICLOPI_SORTING_CHOICES
+        ):
+            sorting_code = ciclopi_record['sorting']
             if (
-                    ciclopi_record is not None
-                    and isinstance(ciclopi_record, dict)
-                    and 'sorting' in ciclopi_record
-                    and ciclopi_record['sorting'] in CICLOPI_SORTING_CHOICES
+                    'latitude' in ciclopi_record
+                    and ciclopi_record['latitude'] is not None
+                    and 'longitude' in ciclopi_record
+                    and ciclopi_record['longitude'] is not None
             ):
-                sorting_code = ciclopi_record['sorting']
-                if (
-                        'latitude' in ciclopi_record
-                        and ciclopi_record['latitude'] is not None
-                        and 'longitude' in ciclopi_record
-                        and ciclopi_record['longitude'] is not None
-                ):
-                    saved_place = Location(
-                        (
-                            ciclopi_record['latitude'],
-                            ciclopi_record['longitude']
-                        )
+                saved_place = Location(
+                    (
+                        ciclopi_record['latitude'],
+                        ciclopi_record['longitude']
                     )
-                else:
-                    saved_place = default_location
-            else:
-                sorting_code = 0
-            if (
-                    ciclopi_record is not None
-                    and isinstance(ciclopi_record, dict)
-                    and 'stations_to_show' in ciclopi_record
-                    and ciclopi_record['stations_to_show'] in CICLOPI_STATIONS_TO_SHOW
-            ):
-                stations_to_show = ciclopi_record[
-                    'stations_to_show'
-                ]
+                )
             else:
-                stations_to_show = default_stations_to_show
+                saved_place = default_location
+        else:
+            sorting_code = 0
+        if (
+                ciclopi_record is not None
+                and isinstance(ciclopi_record, dict)
+                and 'stations_to_show' in ciclopi_record
+                and ciclopi_record['stations_to_show'] in CICLOPI_STATIONS_TO_SHOW
+        ):
+            stations_to_show = ciclopi_record[
+                'stations_to_show'
+            ]
+        else:
+            stations_to_show = default_stations_to_show
         location = (
             saved_place if sorting_code != 0
             else default_location
         )
-        sorting_method = (
-            (lambda station: station.distance) if sorting_code in [0, 2]
-            else (lambda station: station.name) if sorting_code == 1
-            else ciclopi_custom_sorter(custom_order) if sorting_code == 3
-            else (lambda station: 0)
-        )
-        stations = sorted(
-            _get_stations(
-                ciclopi_data,
-                location
+        if location is not None:
+            # Distances are evaluated from the center of location geohash
+            #   cell, so that responses can be shared by nearby places.
+            #   Shown distances may be off by up to about 21 metres and
+            #   nearly equidistant stations may be swapped: see
+            #   `StationDistanceCache`.
+            location_bucket, center = get_geohash(
+                location.latitude, location.longitude,
+                precision=distance_cache.precision
+            )
+            location = Location(center)
+        else:
+            location_bucket = None
+        # Forecast from now rather than from the last change of station
+        #   list: responses are cached by the hours of week involved
+        forecaster = ciclopi_forecaster
+        forecast_timestamp = time.time()
+        response_key = (
+            language, sorting_code, stations_to_show, show_all,
+            location_bucket,
+            tuple(
+                (record['station'], record['value'])
+                for record in custom_order
             ),
-            key=sorting_method
+            (
+                forecaster.get_time_key(forecast_timestamp)
+                if forecaster is not None
+                else None
+            )
         )
-        if (
-                stations_to_show == -1
-                and not show_all
-        ):
-            stations = list(
-                filter(
-                    lambda station: station.id in [
-                        record['station']
-                        for record in custom_order
-                    ],
-                    stations
+        response = ciclopi_responses.get(snapshot.version, response_key)
+        if response is None:
+            sorting_method = get_sorting_method(sorting_code, custom_order)
+            if (
+                    sorting_code in [0, 2]
+                    and stations_to_show > 0
+                    and not show_all
+            ):
+                stations = snapshot.get_nearest_stations(
+                    location or default_location,
+                    stations_to_show
                 )
-            )
-        if (
-                stations_to_show > 0
-                and sorting_code != 1
-                and not show_all
-        ):
-            stations = stations[:stations_to_show]
-        filter_label = ""
-        if stations_to_show == -1:
-            filter_label = bot.get_message(
-                'ciclopi', 'filters', 'fav', 'all' if show_all else 'only',
-                update=update, user_record=user_record
-            )
-        elif len(stations) < len(Station.stations):
-            filter_label = bot.get_message(
-                'ciclopi', 'filters', 'num',
-                update=update, user_record=user_record,
-                n=stations_to_show
-            )
-        if filter_label:
-            filter_label = ' ({label})'.format(
-                label=filter_label
-            )
-        text = (
-            "🚲 {title} {order}"
-            "{filter} {sort[symbol]}\n"
-            "\n"
-            "{stations_list}"
-        ).format(
-            title=bot.get_message(
-                'ciclopi', 'command', 'title',
-                update=update, user_record=user_record
-            ),
-            sort=CICLOPI_SORTING_CHOICES[sorting_code],
-            order=bot.get_message(
-                'ciclopi', 'sorting',
-                CICLOPI_SORTING_CHOICES[sorting_code]['id'],
-                'short_description',
-                update=update, user_record=user_record
-            ),
-            filter=filter_label,
-            stations_list=(
-                '\n\n'.join(
-                    station.status.format(
-                        not_available=bot.get_message(
-                            'ciclopi', 'status', 'not_available',
-                            update=update, user_record=user_record
-                        )
+            else:
+                stations = sorted(
+                    snapshot.get_stations(location),
+                    key=sorting_method
+                )
+            if (
+                    stations_to_show == -1
+                    and not show_all
+            ):
+                stations = list(
+                    filter(
+                        lambda station: station.id in [
+                            record['station']
+                            for record in custom_order
+                        ],
+                        stations
                     )
-                    for station in stations
-                ) if len(stations)
-                else "<i>- {message} -</i>".format(
-                    message=bot.get_message(
-                        'ciclopi', 'command', 'no_station_available',
-                        update=update, user_record=user_record
+                )
+            if (
+                    stations_to_show > 0
+                    and sorting_code != 1
+                    and not show_all
+            ):
+                stations = stations[:stations_to_show]
+            if forecaster is not None:
+                for station in stations:
+                    station.set_forecast(
+                        forecaster.forecast(
+                            station.id, station.bikes, station.free,
+                            forecast_timestamp
+                        )
                     )
+            filter_label = ""
+            if stations_to_show == -1:
+                filter_label = bot.get_message(
+                    'ciclopi', 'filters', 'fav', 'all' if show_all else 'only',
+                    update=update, user_record=user_record
                 )
-            ),
-        )
-    if not text:
-        return
-    reply_markup = make_inline_keyboard(
-        (
-            [
-                make_button(
-                    text="💯 {message}".format(
+            elif len(stations) < len(Station.stations):
+                filter_label = bot.get_message(
+                    'ciclopi', 'filters', 'num',
+                    update=update, user_record=user_record,
+                    n=stations_to_show
+                )
+            if filter_label:
+                filter_label = ' ({label})'.format(
+                    label=filter_label
+                )
+            text = (
+                "🚲 {title} {order}"
+                "{filter} {sort[symbol]}\n"
+                "\n"
+                "{stations_list}"
+            ).format(
+                title=bot.get_message(
+                    'ciclopi', 'command', 'title',
+                    update=update, user_record=user_record
+                ),
+                sort=CICLOPI_SORTING_CHOICES[sorting_code],
+                order=bot.get_message(
+                    'ciclopi', 'sorting',
+                    CICLOPI_SORTING_CHOICES[sorting_code]['id'],
+                    'short_description',
+                    update=update, user_record=user_record
+                ),
+                filter=filter_label,
+                stations_list=(
+                    '\n\n'.join(
+                        station.status.format(
+                            not_available=bot.get_message(
+                                'ciclopi', 'status', 'not_available',
+                                update=update, user_record=user_record
+                            )
+                        )
+                        for station in stations
+                    ) if len(stations)
+                    else "<i>- {message} -</i>".format(
                         message=bot.get_message(
-                            'ciclopi', 'command', 'buttons', 'all',
+                            'ciclopi', 'command', 'no_station_available',
                             update=update, user_record=user_record
                         )
-                    ),
-                    prefix='ciclopi:///',
-                    data=['show', 'all']
-                )
-            ] if len(stations) < len(Station.stations)
-            else [
-                make_button(
-                    "{sy} {message}".format(
-                        message=(
-                            bot.get_message(
-                                'ciclopi', 'command', 'buttons', 'only_fav',
+                    )
+                ),
+            )
+    if response is not None:
+        text, reply_markup = response
+    else:
+        if not text:
+            return
+        reply_markup = make_inline_keyboard(
+            (
+                [
+                    make_button(
+                        text="💯 {message}".format(
+                            message=bot.get_message(
+                                'ciclopi', 'command', 'buttons', 'all',
                                 update=update, user_record=user_record
-                            ) if stations_to_show == -1
-                            else bot.get_message(
-                                'ciclopi', 'command', 'buttons', 'first_n',
-                                update=update, user_record=user_record,
-                                n=stations_to_show
                             )
                         ),
-                        sy=CICLOPI_STATIONS_TO_SHOW[stations_to_show]['symbol']
+                        prefix='ciclopi:///',
+                        data=['show', 'all']
+                    )
+                ] if len(stations) < len(Station.stations)
+                else [
+                    make_button(
+                        "{sy} {message}".format(
+                            message=(
+                                bot.get_message(
+                                    'ciclopi', 'command', 'buttons', 'only_fav',
+                                    update=update, user_record=user_record
+                                ) if stations_to_show == -1
+                                else bot.get_message(
+                                    'ciclopi', 'command', 'buttons', 'first_n',
+                                    update=update, user_record=user_record,
+                                    n=stations_to_show
+                                )
+                            ),
+                            sy=CICLOPI_STATIONS_TO_SHOW[stations_to_show]['symbol']
+                        ),
+                        prefix='ciclopi:///',
+                        data=['show']
+                    )
+                ] if show_all
+                else []
+            ) + [
+                make_button(
+                    text=bot.get_message(
+                        'ciclopi', 'command', 'buttons', 'update',
+                        update=update, user_record=user_record
                     ),
                     prefix='ciclopi:///',
-                    data=['show']
-                )
-            ] if show_all
-            else []
-        ) + [
-            make_button(
-                text=bot.get_message(
-                    'ciclopi', 'command', 'buttons', 'update',
-                    update=update, user_record=user_record
-                ),
-                prefix='ciclopi:///',
-                data=(
-                    ['show'] + (
-                        [] if len(stations) < len(Station.stations)
-                        else ['all']
+                    data=(
+                        ['show'] + (
+                            [] if len(stations) < len(Station.stations)
+                            else ['all']
+                        )
                     )
-                )
-            ),
-            make_button(
-                text=bot.get_message(
-                    'ciclopi', 'command', 'buttons', 'legend',
-                    update=update, user_record=user_record
                 ),
-                prefix='ciclopi:///',
-                data=['legend']
-            ),
-            make_button(
-                text=bot.get_message(
-                    'ciclopi', 'command', 'buttons', 'settings',
-                    update=update, user_record=user_record
+                make_button(
+                    text=bot.get_message(
+                        'ciclopi', 'command', 'buttons', 'legend',
+                        update=update, user_record=user_record
+                    ),
+                    prefix='ciclopi:///',
+                    data=['legend']
                 ),
-                prefix='ciclopi:///',
-                data=['main']
-            )
-        ],
-        2
-    )
+                make_button(
+                    text=bot.get_message(
+                        'ciclopi', 'command', 'buttons', 'settings',
+                        update=update, user_record=user_record
+                    ),
+                    prefix='ciclopi:///',
+                    data=['main']
+                )
+            ],
+            2
+        )
+        if snapshot is not None:
+            ciclopi_responses.set(snapshot.version, response_key,
+                                  (text, reply_markup))
     parameters = dict(
         update=update,
         text=text,
@@ -824,26 +2553,28 @@ async def _ciclopi_command(bot: davtelepot.bot.Bot, update: dict,
         if sent_message is None
         else bot.edit_message_text
     )
-    await method(**parameters)
+    await ciclopi_outbox.send(method, **parameters)
     # Mark request as done
     bot.placeholder_requests[placeholder_id] = 1
     return
 
 
 def get_menu_back_buttons(bot, update, user_record,
-                          include_back_to_settings=True):
+                          include_back_to_settings=True, language=None):
     """Return a list of menu buttons to navigate back in the menu.
 
     `include_back_to_settings` : Bool
         Set it to True to include a 'back to settings' menu button.
     """
+    if language is None:
+        language = bot.get_language(update=update, user_record=user_record)
     if include_back_to_settings:
         buttons = [
             make_button(
                 text="⚙️ {message}".format(
-                    message=bot.get_message(
-                        'ciclopi', 'button', 'back_to_settings',
-                        update=update, user_record=user_record
+                    message=message_catalog.get(
+                        'button', 'back_to_settings',
+                        language=language
                     )
                 ),
                 prefix='ciclopi:///',
@@ -855,9 +2586,9 @@ def get_menu_back_buttons(bot, update, user_record,
     buttons += [
         make_button(
             text="🚲 {message}".format(
-                message=bot.get_message(
-                    'ciclopi', 'button', 'back_to_stations',
-                    update=update, user_record=user_record
+                message=message_catalog.get(
+                    'button', 'back_to_stations',
+                    language=language
                 )
             ),
             prefix='ciclopi:///',
@@ -867,93 +2598,163 @@ def get_menu_back_buttons(bot, update, user_record,
     return buttons
 
 
-async def _ciclopi_button_main(bot, update, user_record):
-    result, text, reply_markup = '', '', None
-    text = (
-        "⚙️ {settings_title} 🚲\n"
-        "\n"
-        "{settings_list}"
-    ).format(
-        settings_title=bot.get_message(
-            'ciclopi', 'button', 'title',
-            update=update, user_record=user_record
-        ),
-        settings_list='\n'.join(
-            "- {symbol} {name}: {description}".format(
-                symbol=bot.get_message(
-                    'ciclopi', 'settings', setting, 'symbol',
-                    update=update, user_record=user_record
-                ),
-                name=bot.get_message(
-                    'ciclopi', 'settings', setting, 'name',
-                    update=update, user_record=user_record
+def _get_settings(language):
+    """Return a list of (setting, symbol, name) tuples in `language`."""
+    return [
+        (
+            setting,
+            message_catalog.get('settings', setting, 'symbol',
+                                language=language),
+            message_catalog.get('settings', setting, 'name',
+                                language=language)
+        )
+        for setting in message_catalog.get_children('settings')
+    ]
+
+
+def get_settings_keyboard(bot, update, user_record, language):
+    """Return the inline keyboard of CicloPi settings menu."""
+    return make_inline_keyboard(
+        [
+            make_button(
+                text="{symbol} {name}".format(
+                    symbol=symbol,
+                    name=name
                 ),
-                description=bot.get_message(
-                    'ciclopi', 'settings', setting, 'description',
-                    update=update, user_record=user_record
-                )
+                prefix='ciclopi:///',
+                data=[setting]
             )
-            for setting in bot.messages['ciclopi']['settings']
+            for setting, symbol, name in _get_settings(language)
+        ] + get_menu_back_buttons(
+            bot=bot, update=update, user_record=user_record,
+            include_back_to_settings=False, language=language
         )
     )
-    reply_markup = make_inline_keyboard(
+
+
+def get_sorting_keyboard(bot, update, user_record, language, sorting):
+    """Return the inline keyboard of sorting options.
+
+    Current `sorting` option is checked.
+    """
+    return make_inline_keyboard(
         [
             make_button(
-                text="{symbol} {name}".format(
-                    symbol=bot.get_message(
-                        'ciclopi', 'settings', setting, 'symbol',
-                        update=update, user_record=user_record
+                text="{s} {name} {c[symbol]}".format(
+                    c=choice,
+                    s=(
+                        '✅'
+                        if code == sorting
+                        else '☑️'
                     ),
+                    name=message_catalog.get(
+                        'sorting', choice['id'], 'name',
+                        language=language
+                    )
+                ),
+                prefix='ciclopi:///',
+                data=['sort', code]
+            )
+            for code, choice in CICLOPI_SORTING_CHOICES.items()
+        ] + get_menu_back_buttons(
+            bot=bot, update=update, user_record=user_record,
+            include_back_to_settings=True, language=language
+        )
+    )
+
+
+def get_limit_keyboard(bot, update, user_record, stations_to_show):
+    """Return the inline keyboard of stations-to-show options.
+
+    Current `stations_to_show` option is checked.
+    """
+    return make_inline_keyboard(
+        [
+            make_button(
+                text="{s} {name} {symbol}".format(
+                    symbol=choice['symbol'],
                     name=bot.get_message(
-                        'ciclopi', 'settings', setting, 'name',
+                        'ciclopi', 'filters', choice['id'], 'name',
                         update=update, user_record=user_record
+                    ),
+                    s=(
+                        '✅'
+                        if code == stations_to_show
+                        else '☑️'
                     )
                 ),
                 prefix='ciclopi:///',
-                data=[setting]
+                data=['limit', code]
             )
-            for setting in bot.messages['ciclopi']['settings']
+            for code, choice in CICLOPI_STATIONS_TO_SHOW.items()
         ] + get_menu_back_buttons(
             bot=bot, update=update, user_record=user_record,
-            include_back_to_settings=False
+            include_back_to_settings=True
+        )
+    )
+
+
+async def _ciclopi_button_main(bot, update, user_record, language):
+    result, text, reply_markup = '', '', None
+    settings = _get_settings(language)
+    text = (
+        "⚙️ {settings_title} 🚲\n"
+        "\n"
+        "{settings_list}"
+    ).format(
+        settings_title=message_catalog.get(
+            'button', 'title',
+            language=language
+        ),
+        settings_list='\n'.join(
+            "- {symbol} {name}: {description}".format(
+                symbol=symbol,
+                name=name,
+                description=message_catalog.get(
+                    'settings', setting, 'description',
+                    language=language
+                )
+            )
+            for setting, symbol, name in settings
         )
     )
+    reply_markup = get_settings_keyboard(bot=bot, update=update,
+                                         user_record=user_record,
+                                         language=language)
     return result, text, reply_markup
 
 
-async def _ciclopi_button_sort(bot, update, user_record, arguments):
+async def _ciclopi_button_sort(bot, update, user_record, language, arguments):
     result, text, reply_markup = '', '', None
     chat_id = (
         update['message']['chat']['id'] if 'message' in update
         else update['chat']['id'] if 'chat' in update
         else 0
     )
-    with bot.db as db:
-        ciclopi_record = db['ciclopi'].find_one(
-            chat_id=chat_id
+    ciclopi_record = await ciclopi_settings.get_record(chat_id)
+    if ciclopi_record is None:
+        ciclopi_record = dict(
+            chat_id=chat_id,
+            sorting=0
         )
-        if ciclopi_record is None:
-            ciclopi_record = dict(
-                chat_id=chat_id,
-                sorting=0
-            )
-        if len(arguments) == 1:
-            new_choice = (
-                arguments[0]
-                if type(arguments[0]) is int
-                else 0
-            )
-            if new_choice == ciclopi_record['sorting']:
-                return bot.get_message(
-                    'ciclopi', 'button', 'no_change',
-                    update=update, user_record=user_record
-                ), '', None
-            elif new_choice not in CICLOPI_SORTING_CHOICES:
-                return bot.get_message(
-                    'ciclopi', 'button', 'unknown_option',
-                    update=update, user_record=user_record
-                ), '', None
-            db['ciclopi'].upsert(
+    if len(arguments) == 1:
+        new_choice = (
+            arguments[0]
+            if type(arguments[0]) is int
+            else 0
+        )
+        if new_choice == ciclopi_record['sorting']:
+            return bot.get_message(
+                'ciclopi', 'button', 'no_change',
+                update=update, user_record=user_record
+            ), '', None
+        elif new_choice not in CICLOPI_SORTING_CHOICES:
+            return bot.get_message(
+                'ciclopi', 'button', 'unknown_option',
+                update=update, user_record=user_record
+            ), '', None
+        await ciclopi_db.write(
+            lambda db: db['ciclopi'].upsert(
                 dict(
                     chat_id=chat_id,
                     sorting=new_choice
@@ -961,54 +2762,36 @@ async def _ciclopi_button_sort(bot, update, user_record, arguments):
                 ['chat_id'],
                 ensure=True
             )
-            ciclopi_record['sorting'] = new_choice
-            result = bot.get_message(
-                'ciclopi', 'button', 'done',
-                update=update, user_record=user_record
-            )
-    text = bot.get_message(
-        'ciclopi', 'button', 'sorting_header',
-        update=update, user_record=user_record
-    ).format(
+        )
+        ciclopi_settings.update_record(chat_id, sorting=new_choice)
+        ciclopi_record['sorting'] = new_choice
+        result = bot.get_message(
+            'ciclopi', 'button', 'done',
+            update=update, user_record=user_record
+        )
+    text = message_catalog.get_template(
+        'button', 'sorting_header',
+        language=language, pre_rendered=True
+    ).render(
         options='\n'.join(
             "- {symbol} {name}: {description}".format(
                 symbol=choice['symbol'],
-                name=bot.get_message(
-                    'ciclopi', 'sorting', choice['id'], 'name',
-                    update=update, user_record=user_record
+                name=message_catalog.get(
+                    'sorting', choice['id'], 'name',
+                    language=language
                 ),
-                description=bot.get_message(
-                    'ciclopi', 'sorting', choice['id'], 'description',
-                    update=update, user_record=user_record
+                description=message_catalog.get(
+                    'sorting', choice['id'], 'description',
+                    language=language
                 )
             )
             for choice in CICLOPI_SORTING_CHOICES.values()
         )
     )
-    reply_markup = make_inline_keyboard(
-        [
-            make_button(
-                text="{s} {name} {c[symbol]}".format(
-                    c=choice,
-                    s=(
-                        '✅'
-                        if code == ciclopi_record['sorting']
-                        else '☑️'
-                    ),
-                    name=bot.get_message(
-                        'ciclopi', 'sorting', choice['id'], 'name',
-                        update=update, user_record=user_record
-                    )
-                ),
-                prefix='ciclopi:///',
-                data=['sort', code]
-            )
-            for code, choice in CICLOPI_SORTING_CHOICES.items()
-        ] + get_menu_back_buttons(
-            bot=bot, update=update, user_record=user_record,
-            include_back_to_settings=True
-        )
-    )
+    reply_markup = get_sorting_keyboard(bot=bot, update=update,
+                                        user_record=user_record,
+                                        language=language,
+                                        sorting=ciclopi_record['sorting'])
     return result, text, reply_markup
 
 
@@ -1019,34 +2802,32 @@ async def _ciclopi_button_limit(bot, update, user_record, arguments):
         else update['chat']['id'] if 'chat' in update
         else 0
     )
-    with bot.db as db:
-        ciclopi_record = db['ciclopi'].find_one(
-            chat_id=chat_id
+    ciclopi_record = await ciclopi_settings.get_record(chat_id)
+    if ciclopi_record is None or 'stations_to_show' not in ciclopi_record:
+        ciclopi_record = dict(
+            chat_id=chat_id,
+            stations_to_show=5
         )
-        if ciclopi_record is None or 'stations_to_show' not in ciclopi_record:
-            ciclopi_record = dict(
-                chat_id=chat_id,
-                stations_to_show=5
-            )
-        if len(arguments) == 1:
-            new_choice = (
-                arguments[0]
-                if type(arguments[0]) is int
-                else int(arguments[0])
-                if type(arguments[0]) is str and arguments[0].lstrip('+-').isnumeric()
-                else 0
-            )
-            if new_choice == ciclopi_record['stations_to_show']:
-                return bot.get_message(
-                    'ciclopi', 'button', 'no_change',
-                    update=update, user_record=user_record
-                ), '', None
-            elif new_choice not in CICLOPI_STATIONS_TO_SHOW:
-                return bot.get_message(
-                    'ciclopi', 'button', 'unknown_option',
-                    update=update, user_record=user_record
-                ), '', None
-            db['ciclopi'].upsert(
+    if len(arguments) == 1:
+        new_choice = (
+            arguments[0]
+            if type(arguments[0]) is int
+            else int(arguments[0])
+            if type(arguments[0]) is str and arguments[0].lstrip('+-').isnumeric()
+            else 0
+        )
+        if new_choice == ciclopi_record['stations_to_show']:
+            return bot.get_message(
+                'ciclopi', 'button', 'no_change',
+                update=update, user_record=user_record
+            ), '', None
+        elif new_choice not in CICLOPI_STATIONS_TO_SHOW:
+            return bot.get_message(
+                'ciclopi', 'button', 'unknown_option',
+                update=update, user_record=user_record
+            ), '', None
+        await ciclopi_db.write(
+            lambda db: db['ciclopi'].upsert(
                 dict(
                     chat_id=chat_id,
                     stations_to_show=new_choice
@@ -1054,11 +2835,13 @@ async def _ciclopi_button_limit(bot, update, user_record, arguments):
                 ['chat_id'],
                 ensure=True
             )
-            ciclopi_record['stations_to_show'] = new_choice
-            result = bot.get_message(
-                'ciclopi', 'button', 'done',
-                update=update, user_record=user_record
-            )
+        )
+        ciclopi_settings.update_record(chat_id, stations_to_show=new_choice)
+        ciclopi_record['stations_to_show'] = new_choice
+        result = bot.get_message(
+            'ciclopi', 'button', 'done',
+            update=update, user_record=user_record
+        )
     text = bot.get_message(
         'ciclopi', 'button', 'limit_header',
         update=update, user_record=user_record
@@ -1074,29 +2857,9 @@ async def _ciclopi_button_limit(bot, update, user_record, arguments):
             for choice in CICLOPI_STATIONS_TO_SHOW.values()
         )
     )
-    reply_markup = make_inline_keyboard(
-        [
-            make_button(
-                text="{s} {name} {symbol}".format(
-                    symbol=choice['symbol'],
-                    name=bot.get_message(
-                        'ciclopi', 'filters', choice['id'], 'name',
-                        update=update, user_record=user_record
-                    ),
-                    s=(
-                        '✅'
-                        if code == ciclopi_record['stations_to_show']
-                        else '☑️'
-                    )
-                ),
-                prefix='ciclopi:///',
-                data=['limit', code]
-            )
-            for code, choice in CICLOPI_STATIONS_TO_SHOW.items()
-        ] + get_menu_back_buttons(
-            bot=bot, update=update, user_record=user_record,
-            include_back_to_settings=True
-        )
+    reply_markup = get_limit_keyboard(
+        bot=bot, update=update, user_record=user_record,
+        stations_to_show=ciclopi_record['stations_to_show']
     )
     return result, text, reply_markup
 
@@ -1123,27 +2886,71 @@ async def _ciclopi_button_show(bot: davtelepot.bot.Bot, update: dict,
     return result, text, reply_markup
 
 
-async def _ciclopi_button_legend(bot, update, user_record):
+async def _ciclopi_button_legend(bot, update, user_record, language):
     result, text, reply_markup = '', '', None
     text = (
         "<b>{s[name]}</b> | <i>{s[description]}</i>\n"
-        "<code>  </code>🚲 {s[bikes]}  |  🅿️ {s[free]}  | 📍 {s[distance]}"
+        "<code>  </code>🚲 {s[bikes]}  |  🅿️ {s[free]}{forecast}"
+        "  | 📍 {s[distance]}"
     ).format(
         s={
-            key: bot.get_message(
-                'ciclopi', 'button', 'legend', key,
-                update=update, user_record=user_record
+            key: message_catalog.get(
+                'button', 'legend', key,
+                language=language
             )
-            for key in ('name', 'distance', 'description', 'bikes', 'free')
-        }
+            for key in message_catalog.get_children('button', 'legend')
+        },
+        forecast=(
+            "  |  🔮 {forecast}".format(
+                forecast=message_catalog.get('button', 'legend', 'forecast',
+                                             language=language)
+            ) if ciclopi_forecaster is not None
+            else ''
+        )
     )
     reply_markup = make_inline_keyboard(
         get_menu_back_buttons(
             bot=bot, update=update, user_record=user_record,
-            include_back_to_settings=True
+            include_back_to_settings=True, language=language
+        )
+    )
+    return result, text, reply_markup
+
+
+def _remove_favourite_station(db, chat_id, old_record):
+    """Remove `old_record` from `chat_id` custom order and shift others."""
+    db.query(
+        """UPDATE ciclopi_custom_order
+        SET value = value - 1
+        WHERE chat_id = {chat_id}
+            AND value > {val}
+        """.format(
+            chat_id=chat_id,
+            val=old_record['value']
+        )
+    )
+    db['ciclopi_custom_order'].delete(
+        id=old_record['id']
+    )
+
+
+def _add_favourite_station(db, chat_id, station_id, value):
+    """Add `station_id` to `chat_id` custom order and return its record."""
+    db['ciclopi_custom_order'].upsert(
+        dict(
+            chat_id=chat_id,
+            station=station_id,
+            value=value
+        ),
+        ['chat_id', 'station'],
+        ensure=True
+    )
+    return dict(
+        db['ciclopi_custom_order'].find_one(
+            chat_id=chat_id,
+            station=station_id
         )
     )
-    return result, text, reply_markup
 
 
 async def _ciclopi_button_favourites_add(bot, update, user_record, arguments,
@@ -1159,46 +2966,50 @@ async def _ciclopi_button_favourites_add(bot, update, user_record, arguments,
             else update['chat']['id'] if 'chat' in update
             else 0
         )
-        with bot.db as db:
-            if station_id in (s.id for s in ordered_stations):  # Remove
-                # Find `old_record` to be removed
-                for old_record in order_record:
-                    if old_record['station'] == station_id:
-                        break
-                db.query(
-                    """UPDATE ciclopi_custom_order
-                    SET value = value - 1
-                    WHERE chat_id = {chat_id}
-                        AND value > {val}
-                    """.format(
-                        chat_id=chat_id,
-                        val=old_record['value']
-                    )
-                )
-                db['ciclopi_custom_order'].delete(
-                    id=old_record['id']
+        if station_id in (s.id for s in ordered_stations):  # Remove
+            # Find `old_record` to be removed
+            for old_record in order_record:
+                if old_record['station'] == station_id:
+                    break
+            await ciclopi_db.write(
+                _remove_favourite_station,
+                chat_id=chat_id,
+                old_record=old_record
+            )
+            await ciclopi_db.write(
+                _remove_station_alerts,
+                chat_id=chat_id,
+                station_id=station_id
+            )
+            ciclopi_alerts.remove_station(chat_id, station_id)
+            order_record = [
+                (
+                    dict(record, value=record['value'] - 1)
+                    if record['value'] > old_record['value']
+                    else record
                 )
-                ordered_stations = list(
-                    filter(
-                        (lambda s: s.id != station_id),
-                        ordered_stations
-                    )
+                for record in order_record
+                if record['id'] != old_record['id']
+            ]
+            ordered_stations = list(
+                filter(
+                    (lambda s: s.id != station_id),
+                    ordered_stations
                 )
-            else:  # Add
-                new_record = dict(
+            )
+        else:  # Add
+            order_record.append(
+                await ciclopi_db.write(
+                    _add_favourite_station,
                     chat_id=chat_id,
-                    station=station_id,
+                    station_id=station_id,
                     value=(len(order_record) + 1)
                 )
-                db['ciclopi_custom_order'].upsert(
-                    new_record,
-                    ['chat_id', 'station'],
-                    ensure=True
-                )
-                order_record.append(new_record)
-                ordered_stations.append(
-                    Station(station_id)
-                )
+            )
+            ordered_stations.append(
+                Station(station_id)
+            )
+        ciclopi_settings.set_custom_order(chat_id, order_record)
     text = bot.get_message(
         'ciclopi', 'button', 'favourites', 'header',
         update=update, user_record=user_record,
@@ -1254,13 +3065,12 @@ async def _ciclopi_button_favourites_add(bot, update, user_record, arguments,
     return result, text, reply_markup
 
 
-def move_favorite_station(
-        bot, chat_id, action, station_id,
+async def move_favorite_station(
+        chat_id, action, station_id,
         order_record
 ):
     """Move a station in `chat_id`-associated custom order.
 
-    `bot`: Bot object, having a `.db` property.
     `action`: should be `up` or `down`
     `order_record`: list of records about `chat_id`-associated custom order.
     """
@@ -1270,7 +3080,8 @@ def move_favorite_station(
             break
     else:  # Error: no record found
         return
-    with bot.db as db:
+
+    def move(db):
         if action == 'down':
             db.query(
                 """UPDATE ciclopi_custom_order
@@ -1333,16 +3144,20 @@ def move_favorite_station(
                     val=old_record['value']
                 )
             )
-        order_record = list(
-            db['ciclopi_custom_order'].find(
+        return [
+            dict(record)
+            for record in db['ciclopi_custom_order'].find(
                 chat_id=chat_id,
                 order_by=['value']
             )
-        )
-        ordered_stations = [
-            Station(record['station'])
-            for record in order_record
         ]
+
+    order_record = await ciclopi_db.write(move)
+    ciclopi_settings.set_custom_order(chat_id, order_record)
+    ordered_stations = [
+        Station(record['station'])
+        for record in order_record
+    ]
     return order_record, ordered_stations
 
 
@@ -1357,17 +3172,11 @@ async def _ciclopi_button_favourites(bot, update, user_record, arguments):
         else update['chat']['id'] if 'chat' in update
         else 0
     )
-    with bot.db as db:
-        order_record = list(
-            db['ciclopi_custom_order'].find(
-                chat_id=chat_id,
-                order_by=['value']
-            )
-        )
-        ordered_stations = [
-            Station(record['station'])
-            for record in order_record
-        ]
+    order_record = await ciclopi_settings.get_custom_order(chat_id)
+    ordered_stations = [
+        Station(record['station'])
+        for record in order_record
+    ]
     if action == 'add':
         return await _ciclopi_button_favourites_add(
             bot, update, user_record, arguments,
@@ -1386,8 +3195,8 @@ async def _ciclopi_button_favourites(bot, update, user_record, arguments):
             and type(arguments[1]) is int
     ):
         station_id = int(arguments[1])
-        order_record, ordered_stations = move_favorite_station(
-            bot, chat_id, action, station_id,
+        order_record, ordered_stations = await move_favorite_station(
+            chat_id, action, station_id,
             order_record
         )
     text = bot.get_message(
@@ -1501,71 +3310,487 @@ async def _ciclopi_button_setpos(bot, update, user_record, language):
         cancel_ciclopi_location,
         update
     )
-    asyncio.ensure_future(
-        bot.send_message(
-            chat_id=chat_id,
-            text=bot.get_message(
-                'ciclopi', 'button', 'location', 'instructions',
-                update=update, user_record=user_record
-            ),
-            reply_markup=dict(
-                keyboard=[
-                    [
-                        dict(
-                            text=bot.get_message(
-                                'ciclopi', 'button', 'location',
-                                'send_current_location',
-                                update=update, user_record=user_record
-                            ),
-                            request_location=True
-                        )
-                    ],
-                    [
-                        dict(
-                            text=bot.get_message(
-                                'ciclopi', 'button', 'location', 'cancel',
-                                update=update, user_record=user_record
-                            ),
-                        )
-                    ]
+    ciclopi_outbox.put(
+        bot.send_message,
+        chat_id=chat_id,
+        text=bot.get_message(
+            'ciclopi', 'button', 'location', 'instructions',
+            update=update, user_record=user_record
+        ),
+        reply_markup=dict(
+            keyboard=[
+                [
+                    dict(
+                        text=bot.get_message(
+                            'ciclopi', 'button', 'location',
+                            'send_current_location',
+                            update=update, user_record=user_record
+                        ),
+                        request_location=True
+                    )
                 ],
-                resize_keyboard=True
+                [
+                    dict(
+                        text=bot.get_message(
+                            'ciclopi', 'button', 'location', 'cancel',
+                            update=update, user_record=user_record
+                        ),
+                    )
+                ]
+            ],
+            resize_keyboard=True
+        )
+    )
+    return result, text, reply_markup
+
+
+def _set_alert(db, chat_id, station_id, kind, threshold, language,
+               active):
+    """Add (if `active`) or remove an alert subscription of `chat_id`."""
+    keys = dict(
+        chat_id=chat_id,
+        station=station_id,
+        kind=kind,
+        threshold=threshold
+    )
+    if active:
+        db['ciclopi_alerts'].upsert(
+            dict(keys, language=language),
+            list(keys.keys()),
+            ensure=True
+        )
+    else:
+        db['ciclopi_alerts'].delete(**keys)
+
+
+def _remove_station_alerts(db, chat_id, station_id):
+    """Remove all alert subscriptions of `chat_id` about `station_id`."""
+    db['ciclopi_alerts'].delete(
+        chat_id=chat_id,
+        station=station_id
+    )
+
+
+def _get_alert_condition(kind, threshold, language):
+    """Return a description of alert condition, like '🚲 at least 3 bikes'."""
+    return "{symbol} {condition}".format(
+        symbol=CICLOPI_ALERT_THRESHOLDS[kind]['symbol'],
+        condition=message_catalog.get('alerts', kind, n=threshold,
+                                      language=language)
+    )
+
+
+async def _ciclopi_button_alerts(bot, update, user_record, language,
+                                 arguments):
+    result, text, reply_markup = '', '', None
+    chat_id = (
+        update['message']['chat']['id'] if 'message' in update
+        else update['chat']['id'] if 'chat' in update
+        else 0
+    )
+    order_record = await ciclopi_settings.get_custom_order(chat_id)
+    favourite_stations = [
+        Station(record['station'])
+        for record in order_record
+    ]
+    if not favourite_stations:
+        return message_catalog.get('alerts', 'no_favourites',
+                                   language=language), '', None
+    if (
+            len(arguments) > 0
+            and arguments[0] in [station.id for station in favourite_stations]
+    ):
+        station_id = arguments[0]
+        if (
+                len(arguments) == 3
+                and arguments[1] in CICLOPI_ALERT_THRESHOLDS
+                and arguments[2] in (
+                    CICLOPI_ALERT_THRESHOLDS[arguments[1]]['thresholds']
+                )
+        ):
+            kind, threshold = arguments[1:]
+            active = (station_id, kind, threshold) not in (
+                ciclopi_alerts.get_subscriptions(chat_id, station_id)
+            )
+            await ciclopi_db.write(
+                _set_alert,
+                chat_id=chat_id,
+                station_id=station_id,
+                kind=kind,
+                threshold=threshold,
+                language=language,
+                active=active
+            )
+            if active:
+                ciclopi_alerts.add(chat_id, station_id, kind, threshold,
+                                   language=language)
+            else:
+                ciclopi_alerts.remove(chat_id, station_id, kind, threshold)
+            result = message_catalog.get('alerts',
+                                         'set' if active else 'unset',
+                                         language=language)
+        subscriptions = ciclopi_alerts.get_subscriptions(chat_id, station_id)
+        text = message_catalog.get('alerts', 'station_header',
+                                   station=Station(station_id).name,
+                                   language=language)
+        reply_markup = make_inline_keyboard(
+            [
+                make_button(
+                    text="{s} {condition}".format(
+                        s=(
+                            '✅'
+                            if (station_id, kind, threshold) in subscriptions
+                            else '☑️'
+                        ),
+                        condition=_get_alert_condition(kind, threshold,
+                                                       language)
+                    ),
+                    prefix='ciclopi:///',
+                    data=['alerts', station_id, kind, threshold]
+                )
+                for kind, options in CICLOPI_ALERT_THRESHOLDS.items()
+                for threshold in options['thresholds']
+            ] + [
+                make_button(
+                    text="🔔 {message}".format(
+                        message=message_catalog.get(
+                            'alerts', 'back_to_alerts',
+                            language=language
+                        )
+                    ),
+                    prefix='ciclopi:///',
+                    data=['alerts']
+                )
+            ] + get_menu_back_buttons(
+                bot=bot, update=update, user_record=user_record,
+                include_back_to_settings=True, language=language
             )
         )
+        return result, text, reply_markup
+    subscriptions = defaultdict(list)
+    for station_id, kind, threshold in ciclopi_alerts.get_subscriptions(
+            chat_id
+    ):
+        subscriptions[station_id].append(
+            _get_alert_condition(kind, threshold, language)
+        )
+    text = message_catalog.get(
+        'alerts', 'header',
+        options=line_drawing_unordered_list(
+            [
+                "{name}: {conditions}".format(
+                    name=station.name,
+                    conditions=', '.join(subscriptions[station.id])
+                )
+                for station in favourite_stations
+                if station.id in subscriptions
+            ]
+        ),
+        language=language
+    )
+    reply_markup = dict(
+        inline_keyboard=make_lines_of_buttons(
+            [
+                make_button(
+                    text="{s} {name}".format(
+                        s='🔔' if station.id in subscriptions else '🔕',
+                        name=station.name
+                    ),
+                    prefix='ciclopi:///',
+                    data=['alerts', station.id]
+                )
+                for station in favourite_stations
+            ],
+            2
+        ) + make_lines_of_buttons(
+            get_menu_back_buttons(
+                bot=bot, update=update, user_record=user_record,
+                include_back_to_settings=True, language=language
+            ),
+            2
+        )
     )
     return result, text, reply_markup
 
 
-_ciclopi_button_routing_table = {
-    'main': _ciclopi_button_main,
-    'sort': _ciclopi_button_sort,
-    'limit': _ciclopi_button_limit,
-    'show': _ciclopi_button_show,
-    'setpos': _ciclopi_button_setpos,
-    'legend': _ciclopi_button_legend,
-    'fav': _ciclopi_button_favourites
-}
+def queue_alerts(snapshot, previous_snapshot):
+    """Queue notifications of alerts fired by a new `snapshot`."""
+    if previous_snapshot is None or not len(ciclopi_alerts):
+        return
+    for alert in ciclopi_alerts.get_alerts(previous_snapshot.table,
+                                           snapshot.table):
+        ciclopi_notifications.put_nowait(alert)
+
+
+async def send_alerts(bot: davtelepot.bot.Bot):
+    """Pass queued alert notifications to `ciclopi_outbox` as bulk sends.
+
+    Notifications report station values of the snapshot firing the alert.
+    """
+    while 1:
+        alert = await ciclopi_notifications.get()
+        try:
+            language = alert.language or 'en'
+            ciclopi_outbox.put(
+                bot.send_message,
+                priority=BULK,
+                chat_id=alert.chat_id,
+                text=message_catalog.get(
+                    'alerts', 'notification',
+                    station=Station(alert.station_id).name,
+                    condition=_get_alert_condition(alert.kind,
+                                                   alert.threshold,
+                                                   language),
+                    bikes=alert.bikes,
+                    free=alert.free,
+                    language=language
+                ),
+                parse_mode='HTML',
+                send_default_keyboard=False
+            )
+        except Exception:
+            logging.exception(f"Error sending alert {alert}")
+
+
+class CicloPiButtonHandler:
+    """Function handling a `ciclopi:///` button command, with its options.
+
+    Parameters accepted by `function` are recorded once, at registration,
+        so that dispatching a button click requires no introspection.
+    """
+
+    __slots__ = ('_function', '_parameters', '_debounce', '_cacheable',
+                 '_admin_only', '_last_calls', '_responses')
+
+    def __init__(self, function, debounce=0, cacheable=False,
+                 admin_only=False, maxsize=1024):
+        """Record `function` accepted parameters and dispatch options.
+
+        `debounce` : int or float
+            Ignore clicks by the same user within `debounce` seconds.
+        `cacheable` : Bool
+            Set it to True for handlers whose response depends only on
+            language and arguments, to reuse rendered responses.
+        `admin_only` : Bool
+            Set it to True to restrict the handler to administrators.
+        """
+        self._function = function
+        self._parameters = tuple(
+            name
+            for name in inspect.signature(function).parameters
+            if name in CicloPiButtonRegistry.available_parameters
+        )
+        self._debounce = debounce
+        self._cacheable = cacheable
+        self._admin_only = admin_only
+        self._last_calls = LRUCache(maxsize=maxsize) if debounce else None
+        self._responses = LRUCache(maxsize=maxsize) if cacheable else None
+
+    @property
+    def function(self):
+        """Return handler function."""
+        return self._function
+
+    @property
+    def parameters(self):
+        """Return names of parameters accepted by handler function."""
+        return self._parameters
+
+    @property
+    def debounce(self):
+        """Return minimum interval in seconds between clicks by a user."""
+        return self._debounce
+
+    @property
+    def cacheable(self):
+        """Return True if handler responses may be reused."""
+        return self._cacheable
+
+    @property
+    def hit_ratio(self):
+        """Return ratio of calls answered from cache, or None."""
+        if not self._cacheable:
+            return None
+        return self._responses.hit_ratio
+
+    @property
+    def admin_only(self):
+        """Return True if handler is restricted to administrators."""
+        return self._admin_only
+
+    def is_bounce(self, user_id):
+        """Return True if `user_id` clicked less than `debounce` s ago.
+
+        Otherwise, record current click time.
+        """
+        if not self._debounce:
+            return False
+        now = time.monotonic()
+        last_call = self._last_calls.get(user_id)
+        if last_call is not None and now - last_call < self._debounce:
+            return True
+        self._last_calls.set(user_id, now)
+        return False
+
+    async def __call__(self, bot, update, user_record, language, arguments):
+        """Call handler function and return (result, text, reply_markup)."""
+        if self._cacheable:
+            key = (language, tuple(arguments))
+            response = self._responses.get(key)
+            if response is not None:
+                return response
+        values = dict(bot=bot, update=update, user_record=user_record,
+                      language=language, arguments=arguments)
+        response = await self._function(
+            **{name: values[name] for name in self._parameters}
+        )
+        if self._cacheable:
+            self._responses.set(key, response)
+        return response
+
+
+class CicloPiButtonRegistry:
+    """Registry of `ciclopi:///` button commands and their handlers.
+
+    Usage:
+    registry = CicloPiButtonRegistry()
+    registry.register('main', _ciclopi_button_main, cacheable=True)
+    await registry.dispatch(bot, update, user_record, language, data)
+    """
+
+    available_parameters = ('bot', 'update', 'user_record', 'language',
+                            'arguments')
+
+    def __init__(self):
+        """Start with no registered command."""
+        self._handlers = {}
+
+    def __contains__(self, command):
+        return command in self._handlers
+
+    def get(self, command):
+        """Return `CicloPiButtonHandler` of `command`, or None."""
+        return self._handlers.get(command)
+
+    def register(self, command, function, debounce=0, cacheable=False,
+                 admin_only=False):
+        """Register `function` as handler of `command` and return it.
+
+        See `CicloPiButtonHandler` for dispatch options.
+        """
+        self._handlers[command] = CicloPiButtonHandler(
+            function=function,
+            debounce=debounce,
+            cacheable=cacheable,
+            admin_only=admin_only
+        )
+        return function
+
+    async def dispatch(self, bot, update, user_record, language, data):
+        """Call handler of `data[0]` command with `data[1:]` arguments.
+
+        Return (result, text, reply_markup), or None if command is unknown
+            or click is ignored.
+        """
+        command, *arguments = data
+        handler = self._handlers.get(command)
+        if handler is None:
+            return
+        if handler.admin_only and not bot.authorization_function(
+            update=update,
+            user_record=user_record,
+            authorization_level='admin'
+        ):
+            message = bot.authorization_denied_message
+            if isinstance(message, dict):
+                message = message.get(language, message.get('en', ''))
+            return message, '', None
+        if handler.debounce and handler.is_bounce(
+            user_id=update['from']['id'] if 'from' in update else 0
+        ):
+            return
+        with handler_seconds.time(handler=command):
+            return await handler(bot=bot, update=update,
+                                 user_record=user_record, language=language,
+                                 arguments=arguments)
+
+
+ciclopi_buttons = CicloPiButtonRegistry()
+ciclopi_buttons.register('main', _ciclopi_button_main, cacheable=True)
+ciclopi_buttons.register('sort', _ciclopi_button_sort)
+ciclopi_buttons.register('limit', _ciclopi_button_limit)
+ciclopi_buttons.register('show', _ciclopi_button_show, debounce=1)
+ciclopi_buttons.register('setpos', _ciclopi_button_setpos)
+# Legend is not cacheable: it changes when forecasts become available
+ciclopi_buttons.register('legend', _ciclopi_button_legend)
+ciclopi_buttons.register('fav', _ciclopi_button_favourites)
+ciclopi_buttons.register('alerts', _ciclopi_button_alerts)
+
+
+def _get_snapshot_age():
+    """Return seconds since last web page download, or None."""
+    if ciclopi_snapshots.checked_at is None:
+        return None
+    return (
+        datetime.datetime.now() - ciclopi_snapshots.checked_at
+    ).total_seconds()
+
+
+cache_hit_ratio = ciclopi_metrics.gauge(
+    'cache_hit_ratio',
+    "Ratio of cache lookups which found an item.",
+    labels=('cache',)
+)
+cache_hit_ratio.set_function(lambda: ciclopi_settings.hit_ratio,
+                             cache='settings')
+cache_hit_ratio.set_function(lambda: ciclopi_responses.hit_ratio,
+                             cache='responses')
+cache_hit_ratio.set_function(lambda: distance_cache.hit_ratio,
+                             cache='distances')
+cache_hit_ratio.set_function(lambda: StationTable._layouts.hit_ratio,
+                             cache='layouts')
+cache_hit_ratio.set_function(lambda: ciclopi_buttons.get('main').hit_ratio,
+                             cache='button_main')
+ciclopi_metrics.gauge(
+    'page_not_modified',
+    "Downloads of CicloPi web page answered with 304 Not Modified."
+).set_function(lambda: ciclopi_web_page.not_modified)
+ciclopi_metrics.gauge(
+    'page_downloads_coalesced',
+    "Requests served by a CicloPi web page download started by others."
+).set_function(lambda: ciclopi_snapshots.fetches.coalesced)
+ciclopi_metrics.gauge(
+    'snapshots_unchanged',
+    "Downloads of CicloPi web page whose station list did not change."
+).set_function(lambda: ciclopi_snapshots.unchanged)
+ciclopi_metrics.gauge(
+    'snapshot_age_seconds',
+    "Time since last download of CicloPi web page, in seconds."
+).set_function(_get_snapshot_age)
+ciclopi_metrics.gauge(
+    'outbox_depth',
+    "Messages waiting to be sent."
+).set_function(lambda: ciclopi_outbox.depth)
+ciclopi_metrics.gauge(
+    'outbox_sent',
+    "Messages sent through the outbound queue."
+).set_function(lambda: ciclopi_outbox.sent)
+ciclopi_metrics.gauge(
+    'outbox_retried',
+    "Messages retried after Telegram flood limit errors."
+).set_function(lambda: ciclopi_outbox.retried)
 
 
 async def _ciclopi_button(bot: davtelepot.bot.Bot, update: dict,
                           user_record: OrderedDict, language: str,
                           data: list):
-    command, *arguments = data
-    if command in _ciclopi_button_routing_table:
-        handler = _ciclopi_button_routing_table[command]
-        parameters = {
-            name: value
-            for name, value in {'bot': bot,
-                                'update': update,
-                                'user_record': user_record,
-                                'language': language,
-                                'arguments': arguments
-                                }.items()
-            if name in inspect.signature(handler).parameters
-        }
-        result, text, reply_markup = await handler(**parameters)
-    else:
+    response = await ciclopi_buttons.dispatch(
+        bot=bot, update=update, user_record=user_record,
+        language=language, data=data
+    )
+    if response is None:
         return
+    result, text, reply_markup = response
     if text:
         return dict(
             text=result,
@@ -1578,31 +3803,211 @@ async def _ciclopi_button(bot: davtelepot.bot.Bot, update: dict,
     return result
 
 
+class ServiceStatusScheduler:
+    """Decide when CicloPi service status should be checked next.
+
+    Checks are frequent after a status change or a failed check, then the
+        interval grows exponentially while status is stable.
+    No check is scheduled while the service is closed.
+    Every decision is logged.
+    """
+
+    def __init__(self, min_interval=60, max_interval=60 * 60,
+                 failure_interval=30, backoff=2.0,
+                 opening_hours=CICLOPI_OPENING_HOURS):
+        """Set intervals (in seconds), backoff factor and opening hours.
+
+        `opening_hours` : tuple (datetime.time, datetime.time)
+            Opening and closing local time. Pass None if service never
+            closes.
+        """
+        self._min_interval = min_interval
+        self._max_interval = max(max_interval, min_interval)
+        self._failure_interval = failure_interval
+        self._backoff = backoff
+        self._opening_hours = opening_hours
+        self._interval = min_interval
+        self._is_working = None
+        self._failures = 0
+
+    @property
+    def interval(self):
+        """Return last chosen interval, in seconds."""
+        return self._interval
+
+    @property
+    def is_working(self):
+        """Return last known service status, or None if unknown."""
+        return self._is_working
+
+    @property
+    def failures(self):
+        """Return number of consecutive failed checks."""
+        return self._failures
+
+    def is_open(self, moment=None):
+        """Return True if service is open at `moment` (default: now)."""
+        if self._opening_hours is None:
+            return True
+        if moment is None:
+            moment = datetime.datetime.now()
+        opening, closing = self._opening_hours
+        now = moment.time()
+        if opening <= closing:
+            return opening <= now < closing
+        return now >= opening or now < closing
+
+    def get_opening_delay(self, moment=None):
+        """Return seconds from `moment` (default: now) to next opening."""
+        if moment is None:
+            moment = datetime.datetime.now()
+        if self.is_open(moment):
+            return 0
+        opening = datetime.datetime.combine(moment.date(),
+                                            self._opening_hours[0])
+        if opening <= moment:
+            opening += datetime.timedelta(days=1)
+        return (opening - moment).total_seconds()
+
+    def get_closing_delay(self, moment=None):
+        """Return seconds from `moment` (default: now) to next closing.
+
+        Return None if service never closes.
+        """
+        if self._opening_hours is None:
+            return None
+        if moment is None:
+            moment = datetime.datetime.now()
+        closing = datetime.datetime.combine(moment.date(),
+                                            self._opening_hours[1])
+        if closing <= moment:
+            closing += datetime.timedelta(days=1)
+        return (closing - moment).total_seconds()
+
+    def reset(self):
+        """Forget status history, e.g. while service is closed."""
+        self._interval = self._min_interval
+        self._is_working = None
+        self._failures = 0
+
+    def get_delay(self, is_working, moment=None):
+        """Record check result and return seconds to wait before next one.
+
+        `is_working` : Bool or None
+            Service status, or None if check failed.
+        """
+        if is_working is None:
+            self._failures += 1
+            self._interval = self._failure_interval
+            reason = f"check failed ({self._failures} in a row)"
+        elif is_working != self._is_working:
+            reason = (
+                "first check" if self._is_working is None
+                else f"status changed to {'working' if is_working else 'down'}"
+            )
+            self._failures = 0
+            self._is_working = is_working
+            self._interval = self._min_interval
+        else:
+            self._failures = 0
+            self._interval = min(self._interval * self._backoff,
+                                 self._max_interval)
+            reason = f"status stable ({'working' if is_working else 'down'})"
+        delay = self._interval
+        closing_delay = self.get_closing_delay(moment)
+        if closing_delay is not None and closing_delay < delay:
+            delay = closing_delay
+            reason += ", service closing"
+        logging.info(f"CicloPi status check: {reason}, "
+                     f"next check in {delay:.0f} s")
+        return delay
+
+
 async def check_service_status(bot: davtelepot.bot.Bot,
-                               interval: Union[int, datetime.timedelta] = 60 * 60):
-    """Every `interval` seconds, check whether service is active or not.
+                               interval: Union[int, datetime.timedelta] = 60 * 60,
+                               scheduler: ServiceStatusScheduler = None,
+                               max_failures: int = 3):
+    """Check whether service is active or not, as often as needed.
 
     Store service status in `bot.shared_data['ciclopi']`.
+    `interval` is the longest time between checks while status is stable;
+        `scheduler` decides actual intervals. After `max_failures`
+        consecutive failed checks, service is considered not working.
     """
-    # TODO: adapt interval to events (check 1 minute after first
     if isinstance(interval, datetime.timedelta):
         interval = interval.total_seconds()
+    if scheduler is None:
+        scheduler = ServiceStatusScheduler(max_interval=interval)
     while 1:
-        ciclopi_data = await ciclopi_web_page.get_page()
-        if ciclopi_data is not None and not isinstance(ciclopi_data, Exception):
-            stations = _get_stations(
-                data=ciclopi_data,
-                location=default_location
-            )
-            bot.shared_data['ciclopi']['is_working'] = any(
-                station.is_active
-                for station in stations
-            )
+        if not scheduler.is_open():
+            delay = scheduler.get_opening_delay()
+            logging.info(f"CicloPi service is closed, "
+                         f"skipping status checks for {delay:.0f} s")
+            scheduler.reset()
+            await asyncio.sleep(delay)
+            continue
+        snapshot = await ciclopi_snapshots.get_snapshot()
+        is_working = None if snapshot is None else snapshot.is_working
+        delay = scheduler.get_delay(is_working)
+        if is_working is not None:
+            bot.shared_data['ciclopi']['is_working'] = is_working
+        elif scheduler.failures >= max_failures:
+            bot.shared_data['ciclopi']['is_working'] = False
+        await asyncio.sleep(delay)
+
+
+async def monitor_event_loop_lag(interval=1.0):
+    """Measure how late the event loop wakes up after sleeping `interval`s.
+
+    A large lag means that some callback is blocking the loop.
+    """
+    loop = asyncio.get_event_loop()
+    while 1:
+        started_at = loop.time()
         await asyncio.sleep(interval)
+        event_loop_lag_seconds.observe(
+            max(0.0, loop.time() - started_at - interval)
+        )
+
+
+async def load_forecaster(horizon: datetime.timedelta,
+                          history: StationHistory = None,
+                          history_period: datetime.timedelta = None):
+    """Build `ciclopi_forecaster` profiles and start updating them.
+
+    Profiles are built from last `history_period` of `history` in a
+        background thread, then records stored meanwhile are added, and
+        profiles are kept up to date with each new snapshot.
+    """
+    global ciclopi_forecaster
+    forecaster = StationForecaster(horizon=horizon.total_seconds())
+    if history is not None and history_period is not None:
+        end = history.last_timestamp + 1
+        start = end - history_period.total_seconds()
+        # Records are selected here, in the event loop thread, and read in
+        #   the executor thread while new ones may be appended
+        records = history.scan(start, end)
+        await asyncio.get_event_loop().run_in_executor(
+            None,
+            forecaster.add_history,
+            records
+        )
+        forecaster.add_history(history.scan(end))
+    ciclopi_snapshots.add_snapshot_handler(
+        lambda snapshot, previous_snapshot: forecaster.add_snapshot(snapshot)
+    )
+    ciclopi_forecaster = forecaster
+    logging.info("CicloPi forecast profiles loaded")
 
 
 def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
-         _default_location=(43.718518, 10.402165)):
+         _default_location=(43.718518, 10.402165),
+         opening_hours=CICLOPI_OPENING_HOURS,
+         history_file_name='ciclopi_history.bin',
+         forecast_horizon=datetime.timedelta(minutes=15),
+         forecast_history=datetime.timedelta(weeks=4),
+         metrics_path='/metrics', health_path='/health',
+         max_staleness=datetime.timedelta(hours=2)):
     """Take a bot and assign CicloPi-related commands to it.
 
     `ciclopi_messages` : dict
@@ -1611,15 +4016,109 @@ def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
     `default_location` : tuple (float, float)
         Tuple of coordinates (latitude, longitude) of default location.
         Defaults to Borgo Stretto CicloPi station.
+
+    `opening_hours` : tuple (datetime.time, datetime.time)
+        Opening and closing local time of CicloPi service: status is not
+        checked while service is closed. Pass None to check it anytime.
+
+    `history_file_name` : str
+        Name of the file in `data` folder where stations availability is
+        stored each time it changes. Pass None not to store it.
+
+    `forecast_horizon` : datetime.timedelta
+        Show how many bikes are expected to be available after this time.
+        Pass None not to show forecasts.
+
+    `forecast_history` : datetime.timedelta
+        Period of stored history used to build forecast profiles at start.
+
+    `metrics_path` : str
+        Path of the bot web app serving metrics in Prometheus text format.
+        Pass None not to serve them.
+
+    `health_path` : str
+        Path of the bot web app serving a JSON health report. Status is 503
+        if CicloPi web page was not downloaded for `max_staleness` while
+        service is open. Pass None not to serve it.
     """
     # Define a global `default_location` variable holding default location
-    global default_location
+    global ciclopi_db, ciclopi_history, ciclopi_notifications, \
+        default_location, message_catalog
     default_location = Location(_default_location)
     if 'ciclopi' not in telegram_bot.shared_data:
         telegram_bot.shared_data['ciclopi'] = dict()
     telegram_bot.shared_data['ciclopi']['default_location'] = default_location
 
-    asyncio.ensure_future(check_service_status(bot=telegram_bot))
+    if history_file_name is not None:
+        ciclopi_history = StationHistory(
+            os.path.join(
+                telegram_bot.path or os.path.dirname(os.path.abspath(__file__)),
+                'data',
+                history_file_name
+            )
+        )
+        atexit.register(ciclopi_history.close)
+        # Snapshots are only created when station list changes: a station
+        #   keeps its last stored values until a later record
+        ciclopi_snapshots.add_snapshot_handler(
+            lambda snapshot, previous_snapshot: (
+                ciclopi_history.append_snapshot(snapshot)
+            )
+        )
+    if forecast_horizon is not None:
+        asyncio.ensure_future(
+            load_forecaster(
+                horizon=forecast_horizon,
+                history=ciclopi_history,
+                history_period=forecast_history
+            )
+        )
+    asyncio.ensure_future(ciclopi_outbox.run())
+    ciclopi_notifications = asyncio.Queue()
+    ciclopi_snapshots.add_snapshot_handler(queue_alerts)
+    asyncio.ensure_future(send_alerts(bot=telegram_bot))
+    asyncio.ensure_future(ciclopi_snapshots.run_refresher())
+    status_scheduler = ServiceStatusScheduler(opening_hours=opening_hours)
+    asyncio.ensure_future(
+        check_service_status(
+            bot=telegram_bot,
+            scheduler=status_scheduler
+        )
+    )
+    asyncio.ensure_future(monitor_event_loop_lag())
+
+    async def metrics_handler(request):
+        return aiohttp.web.Response(text=ciclopi_metrics.render(),
+                                    content_type='text/plain')
+
+    async def health_handler(request):
+        snapshot = ciclopi_snapshots.snapshot
+        age = _get_snapshot_age()
+        if not status_scheduler.is_open():
+            status = 'closed'
+        elif age is None or age > max_staleness.total_seconds():
+            status = 'stale'
+        else:
+            status = 'ok'
+        return aiohttp.web.json_response(
+            dict(
+                status=status,
+                snapshot_age=age,
+                snapshot_version=(
+                    None if snapshot is None else snapshot.version
+                ),
+                is_working=telegram_bot.shared_data['ciclopi'].get(
+                    'is_working'
+                ),
+                outbox_depth=ciclopi_outbox.depth
+            ),
+            status=503 if status == 'stale' else 200
+        )
+
+    if metrics_path is not None:
+        telegram_bot.app.router.add_get(metrics_path, metrics_handler)
+    if health_path is not None:
+        telegram_bot.app.router.add_get(health_path, health_handler)
 
     db = telegram_bot.db
     if 'ciclopi_stations' not in db.tables:
@@ -1637,6 +4136,7 @@ def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
                 key=(lambda station: station['station_id'])
             )
         )
+    update_station_registry(db['ciclopi_stations'].all())
     if 'ciclopi' not in db.tables:
         db['ciclopi'].insert(
             dict(
@@ -1647,6 +4147,38 @@ def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
                 stations_to_show=-1
             )
         )
+    # Create tables and columns before they are used by background threads
+    telegram_bot.add_table_and_columns_if_not_existent(
+        'ciclopi',
+        (('stations_to_show', db.types.integer),)
+    )
+    telegram_bot.add_table_and_columns_if_not_existent(
+        'ciclopi_custom_order',
+        (('chat_id', db.types.bigint),
+         ('station', db.types.integer),
+         ('value', db.types.integer))
+    )
+    telegram_bot.add_table_and_columns_if_not_existent(
+        'ciclopi_alerts',
+        (('chat_id', db.types.bigint),
+         ('station', db.types.integer),
+         ('kind', db.types.string(8)),
+         ('threshold', db.types.integer),
+         ('language', db.types.string(16)))
+    )
+    db['ciclopi'].create_index(['chat_id'])
+    db['ciclopi_custom_order'].create_index(['chat_id', 'station'])
+    db['ciclopi_alerts'].create_index(['chat_id', 'station'])
+    for record in db['ciclopi_alerts'].all():
+        ciclopi_alerts.add(
+            chat_id=record['chat_id'],
+            station_id=record['station'],
+            kind=record['kind'],
+            threshold=record['threshold'],
+            language=record['language']
+        )
+    ciclopi_db = CicloPiDatabase(telegram_bot.db_url)
+    atexit.register(ciclopi_db.close)
 
     if ciclopi_messages is None:
         try:
@@ -1654,6 +4186,10 @@ def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
         except ImportError:
             ciclopi_messages = {}
     telegram_bot.messages['ciclopi'] = ciclopi_messages
+    message_catalog = MessageCatalog(
+        ciclopi_messages,
+        missing_message=telegram_bot.missing_message
+    )
 
     @telegram_bot.command(command='/ciclopi', aliases=["CicloPi 🚲", "🚲 CicloPi 🔴"],
                           reply_keyboard_button=(
@@ -1667,8 +4203,10 @@ def init(telegram_bot: davtelepot.bot.Bot, ciclopi_messages=None,
                           authorization_level='everybody')
     async def ciclopi_command(bot: davtelepot.bot.Bot, update: dict,
                               user_record: OrderedDict, language: str):
-        return await _ciclopi_command(bot=bot, update=update,
-                                      user_record=user_record, language=language)
+        with handler_seconds.time(handler='/ciclopi'):
+            return await _ciclopi_command(bot=bot, update=update,
+                                          user_record=user_record,
+                                          language=language)
 
     @telegram_bot.button(prefix='ciclopi:///', separator='|', authorization_level='everybody')
     async def ciclopi_button(bot: davtelepot.bot.Bot, update: dict,
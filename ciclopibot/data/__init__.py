@@ -4,12 +4,25 @@ Therefore, it must be .gitignored and excluded from python packaging.
 
 Examples of data files
 - `ciclopi.db`: bot SQLite database file
-- Info and erro logs
+- `ciclopi_history.bin`: history of stations availability (see
+    `ciclopibot.history`)
+- Info and erro logs (rotated as `CicloPi.info.log.1`, `.2`, ...)
+- `profiles/`: `cProfile` stats of updates profiled with `/profile` (see
+    `ciclopibot.profiling`)
+- `samples/`: collapsed stacks of the event loop, sampled when running with
+    `--sampling_profiler` (see `ciclopibot.sampling`)
 - `config.py`: configuration file providing local host and port where web app
-    should run
+    should run, and other optional settings
     ```python
     local_host = '127.0.0.1'
     port = 8080
+    sampling_profiler = False
+    sampling_rate = 100  # Samples per second
+    log_level = 'INFO'
+    errors_log_level = 'ERROR'
+    console_log_level = 'WARNING'
+    log_max_bytes = 10 * 1024 * 1024  # 0: never rotate
+    log_backup_count = 5
     ```
 - `passwords.py`: secret file where you can store your bot token
     ```python
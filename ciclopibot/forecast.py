@@ -0,0 +1,175 @@
+"""Forecast CicloPi stations availability from historical profiles.
+
+Each station has an hour-of-week profile of available bikes (time-weighted
+    averages held in two arrays of 168 floats) and a smoothed trend, both
+    updated incrementally with each sample.
+Samples are stored only when station values change: a value holds until
+    next sample, however long the interval.
+"""
+
+# Standard library modules
+import array
+import datetime
+
+HOURS_PER_WEEK = 7 * 24
+
+
+def get_hour_of_week(timestamp):
+    """Return local hour of week (0 is Monday 0:00-1:00) of `timestamp`."""
+    moment = datetime.datetime.fromtimestamp(timestamp)
+    return moment.weekday() * 24 + moment.hour
+
+
+class StationProfile:
+    """Average available bikes of a station per hour of week, and trend."""
+
+    __slots__ = ('_sums', '_weights', '_trend', '_last_timestamp',
+                 '_last_bikes')
+
+    def __init__(self):
+        """Start with an empty profile."""
+        self._sums = array.array('d', [0.0]) * HOURS_PER_WEEK
+        self._weights = array.array('d', [0.0]) * HOURS_PER_WEEK
+        self._trend = 0.0
+        self._last_timestamp = None
+        self._last_bikes = None
+
+    @property
+    def trend(self):
+        """Return smoothed variation of available bikes, per second."""
+        return self._trend
+
+    def add_sample(self, timestamp, bikes, max_gap=6 * 60 * 60,
+                   smoothing=0.3):
+        """Record that station had `bikes` available bikes at `timestamp`.
+
+        Previous value is credited to each hour of week for the time spent
+            in it since then. Intervals longer than `max_gap` seconds (e.g.
+            service closed at night) are not credited and reset the trend.
+        Samples older than the last one are ignored.
+        """
+        if self._last_timestamp is not None:
+            elapsed = timestamp - self._last_timestamp
+            if elapsed < 0:
+                return
+            if elapsed > max_gap:
+                self._trend = 0.0
+            elif elapsed > 0:
+                self._credit(self._last_timestamp, timestamp,
+                             self._last_bikes)
+                self._trend += smoothing * (
+                    (bikes - self._last_bikes) / elapsed - self._trend
+                )
+        self._last_timestamp = timestamp
+        self._last_bikes = bikes
+
+    def _credit(self, start, end, bikes):
+        """Credit `bikes` to hours of week from `start` to `end` timestamp.
+
+        Hours are split at whole Unix hours, i.e. at local hour changes in
+            time zones with whole-hour offsets.
+        """
+        while start < end:
+            hour_end = min(end, (start // 3600 + 1) * 3600)
+            hour = get_hour_of_week(start)
+            self._sums[hour] += bikes * (hour_end - start)
+            self._weights[hour] += hour_end - start
+            start = hour_end
+
+    def get_average(self, hour, min_weight=0):
+        """Return average available bikes in `hour` of week.
+
+        Return None if less than `min_weight` seconds were recorded in that
+            hour of week.
+        """
+        weight = self._weights[hour]
+        if not weight or weight < min_weight:
+            return None
+        return self._sums[hour] / weight
+
+
+class StationForecaster:
+    """Forecast available bikes `horizon` seconds ahead.
+
+    Forecast is current value plus expected variation according to station
+        profile, plus a fraction (`trend_weight`) of current trend.
+
+    Usage:
+    forecaster = StationForecaster(horizon=15 * 60)
+    forecaster.add_snapshot(snapshot)
+    forecaster.forecast(station_id, bikes, free, timestamp)
+    """
+
+    def __init__(self, horizon=15 * 60, trend_weight=0.5, min_weight=3600):
+        """Set forecast `horizon` (seconds) and weight of current trend.
+
+        Forecasts are made only if at least `min_weight` seconds of history
+            were recorded in current hour of week and in the target one.
+        """
+        self._horizon = horizon
+        self._trend_weight = trend_weight
+        self._min_weight = min_weight
+        self._profiles = {}
+
+    @property
+    def horizon(self):
+        """Return forecast horizon, in seconds."""
+        return self._horizon
+
+    def get_profile(self, station_id):
+        """Return `StationProfile` of `station_id`, or None."""
+        return self._profiles.get(station_id)
+
+    def add_sample(self, timestamp, station_id, bikes):
+        """Update profile of `station_id` with a sample."""
+        profile = self._profiles.get(station_id)
+        if profile is None:
+            profile = self._profiles[station_id] = StationProfile()
+        profile.add_sample(timestamp, bikes)
+
+    def add_snapshot(self, snapshot):
+        """Update profiles with every station in a `StationSnapshot`."""
+        timestamp = snapshot.fetched_at.timestamp()
+        table = snapshot.table
+        for station_id, bikes in zip(table.ids, table.bikes):
+            self.add_sample(timestamp, station_id, bikes)
+
+    def get_time_key(self, timestamp):
+        """Return hours of week involved in forecasts made at `timestamp`.
+
+        Forecasts made from the same profiles at two timestamps with the
+            same key are the same.
+        """
+        return (get_hour_of_week(timestamp),
+                get_hour_of_week(timestamp + self._horizon))
+
+    def add_history(self, records):
+        """Update profiles with `HistoryRecord`s, in time order."""
+        for record in records:
+            self.add_sample(record.timestamp, record.station_id,
+                            record.bikes)
+
+    def forecast(self, station_id, bikes, free, timestamp):
+        """Return available bikes expected `horizon` s after `timestamp`.
+
+        `bikes` and `free` are current values; forecast is not greater than
+            their sum (station capacity).
+        Return None if there is not enough history about `station_id`.
+        """
+        profile = self._profiles.get(station_id)
+        if profile is None:
+            return None
+        now = profile.get_average(get_hour_of_week(timestamp),
+                                  self._min_weight)
+        then = profile.get_average(
+            get_hour_of_week(timestamp + self._horizon),
+            self._min_weight
+        )
+        if now is None or then is None:
+            return None
+        value = (
+            bikes
+            + (then - now) * min(self._horizon / 3600, 1)
+            + profile.trend * self._horizon * self._trend_weight
+        )
+        return int(round(min(max(value, 0), bikes + free)))
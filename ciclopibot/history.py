@@ -0,0 +1,253 @@
+"""Store history of CicloPi stations availability.
+
+Samples are appended to a binary file of fixed-width records, sorted by
+    time, so that time ranges can be found by bisection.
+"""
+
+# Standard library modules
+import asyncio
+import bisect
+import collections
+import datetime
+import itertools
+import logging
+import os
+import struct
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+HistoryRecord = collections.namedtuple(
+    'HistoryRecord',
+    ['timestamp', 'station_id', 'bikes', 'free', 'active']
+)
+
+_MAGIC = b'CPHIST01'
+# Magic bytes, record size, padding
+_HEADER = struct.Struct('<8sI4x')
+# Unix timestamp (seconds), station id, bikes, free stalls, active flag
+_RECORD = struct.Struct('<IHhhB')
+
+
+def _to_timestamp(moment):
+    """Return Unix timestamp (int) of `moment` (datetime or number)."""
+    if isinstance(moment, datetime.datetime):
+        moment = moment.timestamp()
+    return int(moment)
+
+
+class StationHistory:
+    """Append-only store of (timestamp, station_id, bikes, free, active).
+
+    Records are written to `path` through a buffer, which is flushed and
+        synced to disk at most every `sync_interval` seconds or every
+        `sync_records` records. While an event loop is running, syncing to
+        disk happens in a background thread, so that appending records never
+        waits for the disk.
+    Last `ring_size` records are also kept in memory, to answer queries
+        about the recent past without reading the file.
+
+    Usage:
+    history = StationHistory('data/ciclopi_history.bin')
+    history.append_snapshot(snapshot)
+    for record in history.scan(start, end, station_id=5):
+        ...
+    history.close()
+    """
+
+    def __init__(self, path, ring_size=40 * 4 * 60 * 2, sync_interval=60,
+                 sync_records=4096):
+        """Open (or create) store file at `path`."""
+        self._path = path
+        self._sync_interval = sync_interval
+        self._sync_records = sync_records
+        self._ring = collections.deque(maxlen=ring_size)
+        self._ring_timestamps = collections.deque(maxlen=ring_size)
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        self._last_timestamp = 0
+        # A single thread, so that syncs do not overlap and `close` may wait
+        #   for them
+        self._sync_executor = ThreadPoolExecutor(
+            max_workers=1,
+            thread_name_prefix='history_sync'
+        )
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(path, 'a+b')
+        self._file.seek(0, os.SEEK_END)
+        size = self._file.tell()
+        if size == 0:
+            self._file.write(_HEADER.pack(_MAGIC, _RECORD.size))
+            self._file.flush()
+            size = _HEADER.size
+        else:
+            self._file.seek(0)
+            magic, record_size = _HEADER.unpack(
+                self._file.read(_HEADER.size)
+            )
+            if magic != _MAGIC or record_size != _RECORD.size:
+                self._file.close()
+                raise ValueError(f"`{path}` is not a station history file")
+            self._file.seek(0, os.SEEK_END)
+        # Ignore incomplete trailing records (e.g. after a crash)
+        self._records = (size - _HEADER.size) // _RECORD.size
+        if (size - _HEADER.size) % _RECORD.size:
+            logging.warning(f"Truncating incomplete record in `{path}`")
+            self._file.truncate(_HEADER.size + self._records * _RECORD.size)
+        if self._records:
+            self._last_timestamp = self._read_record(self._file,
+                                                     self._records - 1)[0]
+            self._file.seek(0, os.SEEK_END)
+
+    @property
+    def path(self):
+        """Return store file path."""
+        return self._path
+
+    @property
+    def last_timestamp(self):
+        """Return timestamp of last stored record, or 0."""
+        return self._last_timestamp
+
+    def __len__(self):
+        return self._records
+
+    def append(self, moment, rows):
+        """Append `rows` sampled at `moment` (datetime or Unix timestamp).
+
+        `rows` : iterable of (station_id, bikes, free, active) tuples.
+        Timestamps older than the last stored one are moved forward to it,
+            to keep records sorted (e.g. after system clock changes).
+        """
+        timestamp = max(_to_timestamp(moment), self._last_timestamp)
+        data = bytearray()
+        for station_id, bikes, free, active in rows:
+            record = HistoryRecord(timestamp, station_id, bikes, free,
+                                   bool(active))
+            data += _RECORD.pack(*record)
+            self._ring.append(record)
+            self._ring_timestamps.append(timestamp)
+        if not data:
+            return
+        self._file.write(data)
+        records = len(data) // _RECORD.size
+        self._records += records
+        self._pending += records
+        self._last_timestamp = timestamp
+        if (
+                self._pending >= self._sync_records
+                or time.monotonic() - self._last_sync >= self._sync_interval
+        ):
+            self.sync_in_background()
+
+    def append_snapshot(self, snapshot):
+        """Append a record per station of a `StationSnapshot`."""
+        table = snapshot.table
+        self.append(
+            snapshot.fetched_at,
+            zip(table.ids, table.bikes, table.free, table.active)
+        )
+
+    def sync(self):
+        """Write buffered records and make sure they reach the disk."""
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def sync_in_background(self):
+        """Write buffered records and sync them to disk in another thread.
+
+        Return a future of the sync, or None if no event loop is running: in
+            that case records are synced right away.
+        """
+        try:
+            loop = asyncio.get_running_loop()
+        except RuntimeError:
+            self.sync()
+            return None
+        self._file.flush()
+        self._pending = 0
+        self._last_sync = time.monotonic()
+        return loop.run_in_executor(self._sync_executor, os.fsync,
+                                    self._file.fileno())
+
+    def close(self):
+        """Sync and close store file."""
+        if self._file.closed:
+            return
+        self._sync_executor.shutdown(wait=True)
+        self.sync()
+        self._file.close()
+
+    @staticmethod
+    def _read_record(history_file, index):
+        """Return `index`-th record in `history_file`, as a tuple."""
+        history_file.seek(_HEADER.size + index * _RECORD.size)
+        return _RECORD.unpack(history_file.read(_RECORD.size))
+
+    def _find(self, history_file, timestamp, records):
+        """Return index of first record having at least `timestamp`.
+
+        Only the first `records` records are searched.
+        """
+        low, high = 0, records
+        while low < high:
+            middle = (low + high) // 2
+            if self._read_record(history_file, middle)[0] < timestamp:
+                low = middle + 1
+            else:
+                high = middle
+        return low
+
+    def scan(self, start=0, end=None, station_id=None, chunk_size=4096):
+        """Return an iterator of `HistoryRecord`s with start <= timestamp < end.
+
+        `start` and `end` may be datetimes or Unix timestamps; `end`
+            defaults to no limit.
+        `station_id` : int
+            If given, yield only records about that station.
+        Records are yielded in time order.
+        Records to be yielded are determined when `scan` is called, so the
+            iterator may be consumed in another thread while records are
+            being appended.
+        """
+        start = _to_timestamp(start)
+        end = float('inf') if end is None else _to_timestamp(end)
+        if self._ring and (
+                self._ring_timestamps[0] < start
+                or len(self._ring) == self._records
+        ):
+            # Whole range is in memory: copy it, as appending would change it
+            index = bisect.bisect_left(self._ring_timestamps, start)
+            return self._scan_records(
+                list(itertools.islice(self._ring, index, None)),
+                end, station_id
+            )
+        self._file.flush()
+        return self._scan_file(start, end, station_id, self._records,
+                               chunk_size)
+
+    @staticmethod
+    def _scan_records(records, end, station_id):
+        for record in records:
+            if record.timestamp >= end:
+                return
+            if station_id is None or record.station_id == station_id:
+                yield record
+
+    def _scan_file(self, start, end, station_id, records, chunk_size):
+        with open(self._path, 'rb') as history_file:
+            index = self._find(history_file, start, records)
+            history_file.seek(_HEADER.size + index * _RECORD.size)
+            while index < records:
+                count = min(chunk_size, records - index)
+                data = history_file.read(count * _RECORD.size)
+                index += count
+                for timestamp, id_, bikes, free, active in \
+                        _RECORD.iter_unpack(data):
+                    if timestamp >= end:
+                        return
+                    if station_id is None or id_ == station_id:
+                        yield HistoryRecord(timestamp, id_, bikes, free,
+                                            bool(active))
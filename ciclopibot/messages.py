@@ -1,5 +1,10 @@
 """Default messages for bot functions."""
 
+# Standard library modules
+import logging
+import re
+import string
+
 authorization_denied_message = {
     'en': "You are not allowed to use this command, sorry.",
     'it': "Non disponi di autorizzazioni sufficienti per questa richiesta, spiacente.",
@@ -180,6 +185,22 @@ default_ciclopi_messages = {
                 'en': "🧭",
                 'it': "🧭"
             }
+        },
+        'alerts': {
+            'name': {
+                'en': "Alerts",
+                'it': "Avvisi",
+            },
+            'description': {
+                'en': "get notified when bikes or free stalls become "
+                      "available at your favourite stations.",
+                'it': "ricevi un avviso quando si liberano bici o posti "
+                      "nelle tue stazioni preferite."
+            },
+            'symbol': {
+                'en': "🔔",
+                'it': "🔔"
+            }
         }
     },
     'sorting': {
@@ -293,6 +314,56 @@ default_ciclopi_messages = {
             'it': "Non disponibile"
         }
     },
+    'alerts': {
+        'header': {
+            'en': "🔔 <b>Alerts</b>\n"
+                  "{options}\n\n"
+                  "Choose a favourite station to be notified when bikes or "
+                  "free stalls become available there.",
+            'it': "🔔 <b>Avvisi</b>\n"
+                  "{options}\n\n"
+                  "Scegli una stazione preferita per ricevere un avviso "
+                  "quando si liberano bici o posti.",
+        },
+        'station_header': {
+            'en': "🔔 <b>{station}</b>\n\n"
+                  "Touch a condition to be notified (or not anymore) when "
+                  "it comes true.",
+            'it': "🔔 <b>{station}</b>\n\n"
+                  "Tocca una condizione per ricevere (o non ricevere più) un "
+                  "avviso quando si verifica.",
+        },
+        'no_favourites': {
+            'en': "Add some favourite stations first!",
+            'it': "Prima aggiungi qualche stazione preferita!",
+        },
+        'bikes': {
+            'en': "at least {n} bikes",
+            'it': "almeno {n} bici",
+        },
+        'free': {
+            'en': "at least {n} free stalls",
+            'it': "almeno {n} posti liberi",
+        },
+        'set': {
+            'en': "Alert set",
+            'it': "Avviso impostato",
+        },
+        'unset': {
+            'en': "Alert removed",
+            'it': "Avviso rimosso",
+        },
+        'back_to_alerts': {
+            'en': "Back to alerts",
+            'it': "Torna agli avvisi",
+        },
+        'notification': {
+            'en': "🔔 <b>{station}</b>: {condition}!\n"
+                  "🚲 {bikes}  |  🅿️ {free}",
+            'it': "🔔 <b>{station}</b>: {condition}!\n"
+                  "🚲 {bikes}  |  🅿️ {free}",
+        },
+    },
     'set_position': {
         'success': {
             'en': "Position set!\n"
@@ -347,6 +418,10 @@ default_ciclopi_messages = {
             'free': {
                 'en': "Free parking stalls",
                 'it': "Posti liberi",
+            },
+            'forecast': {
+                'en': "Bikes expected in a few minutes",
+                'it': "Bici previste tra qualche minuto",
             }
         },
         'no_change': {
@@ -506,7 +581,185 @@ default_help_messages = {
     },
 }
 
+default_profiling_messages = {
+    'profile_command': {
+        'description': {
+            'en': "Profile next updates",
+            'it': "Profila i prossimi aggiornamenti"
+        },
+    },
+    'started': {
+        'en': "⏱ Profiling next {n} updates (chat: <code>{chat_id}</code>).",
+        'it': "⏱ Profilo i prossimi {n} aggiornamenti "
+              "(chat: <code>{chat_id}</code>).",
+    },
+    'status': {
+        'en': "⏱ {n} updates still to be profiled "
+              "(chat: <code>{chat_id}</code>).\n"
+              "Send <code>/profile off</code> to stop.",
+        'it': "⏱ Restano da profilare {n} aggiornamenti "
+              "(chat: <code>{chat_id}</code>).\n"
+              "Invia <code>/profile off</code> per smettere.",
+    },
+    'stopped': {
+        'en': "Profiling stopped.",
+        'it': "Profilazione interrotta.",
+    },
+    'usage': {
+        'en': "<code>/profile N</code>: profile next N updates\n"
+              "<code>/profile chat ID [N]</code>: profile next N updates "
+              "of chat ID\n"
+              "<code>/profile off</code>: stop profiling",
+        'it': "<code>/profile N</code>: profila i prossimi N "
+              "aggiornamenti\n"
+              "<code>/profile chat ID [N]</code>: profila i prossimi N "
+              "aggiornamenti della chat ID\n"
+              "<code>/profile off</code>: interrompi la profilazione",
+    },
+    'summary': {
+        'en': "⏱ <b>Profiled update</b> ({update_type}, chat "
+              "<code>{chat_id}</code>): {duration:.1f} ms\n"
+              "Stats: <code>{file_name}</code>\n"
+              "Updates still to be profiled: {remaining}",
+        'it': "⏱ <b>Aggiornamento profilato</b> ({update_type}, chat "
+              "<code>{chat_id}</code>): {duration:.1f} ms\n"
+              "Statistiche: <code>{file_name}</code>\n"
+              "Aggiornamenti ancora da profilare: {remaining}",
+    },
+}
+
 unknown_command_message = {
     'en': "Unknown command! Touch /help to read the guide and available commands.",
     'it': "Comando sconosciuto! Fai /help per leggere la guida e i comandi."
 }
+
+
+_formatter = string.Formatter()
+_LANGUAGE_CODE_PATTERN = re.compile(r'^[a-z]{2,3}(-[A-Za-z0-9]+)*$')
+
+
+class MessageTemplate:
+    """Message pre-parsed once, to be rendered many times.
+
+    `render(**kwargs)` yields the same result as `text.format(**kwargs)`.
+    Raw templates (plain string messages, which are not formatted by
+        `bot.get_message`) are returned as they are.
+    """
+
+    __slots__ = ('_text', '_parts')
+
+    def __init__(self, text, raw=False):
+        """Parse `text` unless it is `raw`."""
+        self._text = text
+        self._parts = None
+        if raw:
+            return
+        parts = list(_formatter.parse(text))
+        if all(field_name is None for _, field_name, _, _ in parts):
+            # No replacement field: only escaped braces need rendering
+            self._text = text.format()
+        elif any('{' in (format_spec or '') for _, _, format_spec, _ in parts):
+            # Nested replacement fields: leave them to `str.format`
+            self._parts = ()
+        else:
+            self._parts = parts
+
+    @property
+    def text(self):
+        """Return template source text."""
+        return self._text
+
+    def render(self, **kwargs):
+        """Return template text with replacement fields filled by `kwargs`."""
+        if self._parts is None:
+            return self._text
+        if not self._parts:
+            return self._text.format(**kwargs)
+        result = []
+        for literal_text, field_name, format_spec, conversion in self._parts:
+            result.append(literal_text)
+            if field_name is not None:
+                value = _formatter.get_field(field_name, (), kwargs)[0]
+                if conversion:
+                    value = _formatter.convert_field(value, conversion)
+                result.append(format(value, format_spec))
+        return ''.join(result)
+
+
+class MessageCatalog:
+    """Flat, pre-parsed version of a nested multi-language messages dict.
+
+    Messages are looked up by a tuple of keys and a language, resolving
+        language as `bot.get_message` does (specific language, generic
+        language, English).
+
+    Usage:
+    catalog = MessageCatalog(default_ciclopi_messages)
+    catalog.get('command', 'buttons', 'first_n', language='it', n=5)
+    """
+
+    def __init__(self, messages, missing_message="Invalid message!"):
+        """Compile nested `messages` dict."""
+        self._templates = {}
+        self._children = {}
+        self._rendered_templates = {}
+        self._missing_message = missing_message
+        self._compile(messages, ())
+
+    def _compile(self, messages, keys):
+        if isinstance(messages, str):
+            self._templates[keys] = {'': MessageTemplate(messages, raw=True)}
+            return
+        if not isinstance(messages, dict):
+            return
+        if messages and all(
+            isinstance(value, str) and _LANGUAGE_CODE_PATTERN.match(key)
+            for key, value in messages.items()
+        ):
+            self._templates[keys] = {
+                language: MessageTemplate(text)
+                for language, text in messages.items()
+            }
+            return
+        self._children[keys] = tuple(messages.keys())
+        for key, value in messages.items():
+            self._compile(value, keys + (key,))
+
+    def get_children(self, *keys):
+        """Return the names of messages nested under `keys`, in order."""
+        return self._children.get(keys, ())
+
+    def get_template(self, *keys, language='en', pre_rendered=False):
+        """Return the `MessageTemplate` of `keys` in `language`.
+
+        If `pre_rendered` is True, return a template of the message already
+            rendered once, for messages to be formatted twice (like those
+            having `{{options}}` fields).
+        Return None if message is missing.
+        """
+        if keys not in self._templates:
+            logging.debug(f"Please define message {keys}")
+            return None
+        templates = self._templates[keys]
+        if language not in templates:
+            # Resolve language once, then remember it
+            templates[language] = (
+                templates.get(language.partition('-')[0])
+                or templates.get('en')
+                or templates.get('')
+            )
+        template = templates[language]
+        if template is None or not pre_rendered:
+            return template
+        if template not in self._rendered_templates:
+            self._rendered_templates[template] = MessageTemplate(
+                template.render()
+            )
+        return self._rendered_templates[template]
+
+    def get(self, *keys, language='en', **format_kwargs):
+        """Return message of `keys` in `language`, rendered with kwargs."""
+        template = self.get_template(*keys, language=language)
+        if template is None:
+            return self._missing_message
+        return template.render(**format_kwargs)
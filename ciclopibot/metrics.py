@@ -0,0 +1,244 @@
+"""Collect counters, gauges and histograms and render them for scraping.
+
+Metrics are rendered in Prometheus text exposition format, so that they can
+    be read by a Prometheus server or simply by a human with `curl`.
+"""
+
+# Standard library modules
+import bisect
+import contextlib
+import time
+
+# Latency buckets, in seconds
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5,
+                   1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+def _format_value(value):
+    if value == float('inf'):
+        return '+Inf'
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return repr(value) if isinstance(value, float) else str(value)
+
+
+def _format_labels(names, values, **extra):
+    pairs = list(zip(names, values)) + list(extra.items())
+    if not pairs:
+        return ''
+    return '{' + ','.join(
+        '{name}="{value}"'.format(
+            name=name,
+            value=str(value).replace('\\', '\\\\').replace('"', '\\"')
+        )
+        for name, value in pairs
+    ) + '}'
+
+
+class Metric:
+    """Base class of metrics, possibly having `labels`."""
+
+    type_ = 'untyped'
+
+    def __init__(self, name, description, labels=()):
+        """Set metric name, help text and label names."""
+        self._name = name
+        self._description = description
+        self._labels = tuple(labels)
+        # Tuple of label values -> value
+        self._values = {}
+
+    @property
+    def name(self):
+        """Return metric name."""
+        return self._name
+
+    def _get_key(self, labels):
+        if set(labels) != set(self._labels):
+            raise ValueError(f"Metric `{self._name}` takes labels "
+                             f"{self._labels}, not {tuple(labels)}")
+        return tuple(labels[label] for label in self._labels)
+
+    def get(self, **labels):
+        """Return current value for `labels`."""
+        return self._values.get(self._get_key(labels))
+
+    def _render_samples(self):
+        for key, value in sorted(self._values.items()):
+            yield (f"{self._name}{_format_labels(self._labels, key)} "
+                   f"{_format_value(value)}")
+
+    def render(self):
+        """Return metric in text exposition format."""
+        return '\n'.join(
+            [
+                f"# HELP {self._name} {self._description}",
+                f"# TYPE {self._name} {self.type_}",
+            ] + list(self._render_samples())
+        )
+
+
+class Counter(Metric):
+    """Monotonically increasing count."""
+
+    type_ = 'counter'
+
+    def __init__(self, name, description, labels=()):
+        """Start from zero (if metric has no labels)."""
+        super().__init__(name, description, labels)
+        if not self._labels:
+            self._values[()] = 0
+
+    def inc(self, amount=1, **labels):
+        """Increase count by `amount`."""
+        key = self._get_key(labels)
+        self._values[key] = self._values.get(key, 0) + amount
+
+
+class Gauge(Metric):
+    """Value that can go up and down, possibly read from a function."""
+
+    type_ = 'gauge'
+
+    def __init__(self, name, description, labels=()):
+        """Start with no value."""
+        super().__init__(name, description, labels)
+        self._functions = {}
+
+    def set(self, value, **labels):
+        """Set current value."""
+        self._values[self._get_key(labels)] = value
+
+    def set_function(self, function, **labels):
+        """Read value from `function()` each time metric is rendered."""
+        self._functions[self._get_key(labels)] = function
+
+    def get(self, **labels):
+        """Return current value for `labels`."""
+        key = self._get_key(labels)
+        if key in self._functions:
+            return self._functions[key]()
+        return self._values.get(key)
+
+    def _render_samples(self):
+        values = dict(self._values)
+        for key, function in self._functions.items():
+            values[key] = function()
+        for key, value in sorted(values.items()):
+            if value is None:
+                continue
+            yield (f"{self._name}{_format_labels(self._labels, key)} "
+                   f"{_format_value(value)}")
+
+
+class Histogram(Metric):
+    """Distribution of observed values (e.g. durations) over buckets."""
+
+    type_ = 'histogram'
+
+    def __init__(self, name, description, labels=(),
+                 buckets=DEFAULT_BUCKETS):
+        """Set upper bounds of buckets."""
+        super().__init__(name, description, labels)
+        self._buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        """Record an observed `value`."""
+        key = self._get_key(labels)
+        counts = self._values.get(key)
+        if counts is None:
+            # Bucket counts (last one is +Inf), sum, count
+            counts = self._values[key] = [[0] * (len(self._buckets) + 1),
+                                          0.0, 0]
+        counts[0][bisect.bisect_left(self._buckets, value)] += 1
+        counts[1] += value
+        counts[2] += 1
+
+    @contextlib.contextmanager
+    def time(self, **labels):
+        """Observe the time spent in a `with` block, in seconds."""
+        started_at = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - started_at, **labels)
+
+    def get_count(self, **labels):
+        """Return number of observations."""
+        counts = self._values.get(self._get_key(labels))
+        return 0 if counts is None else counts[2]
+
+    def get_quantile(self, quantile, **labels):
+        """Return upper bound of the bucket holding `quantile` (0-1)."""
+        counts = self._values.get(self._get_key(labels))
+        if counts is None or not counts[2]:
+            return None
+        rank = quantile * counts[2]
+        cumulative = 0
+        for bound, count in zip(self._buckets + (float('inf'),), counts[0]):
+            cumulative += count
+            if cumulative >= rank:
+                return bound
+        return float('inf')
+
+    def _render_samples(self):
+        for key, (bucket_counts, total, count) in sorted(
+                self._values.items()):
+            cumulative = 0
+            for bound, bucket_count in zip(self._buckets + (float('inf'),),
+                                           bucket_counts):
+                cumulative += bucket_count
+                yield (
+                    f"{self._name}_bucket"
+                    f"{_format_labels(self._labels, key, le=_format_value(bound))}"
+                    f" {cumulative}"
+                )
+            labels = _format_labels(self._labels, key)
+            yield f"{self._name}_sum{labels} {_format_value(total)}"
+            yield f"{self._name}_count{labels} {count}"
+
+
+class MetricsRegistry:
+    """Named collection of metrics, rendered together.
+
+    Usage:
+    metrics = MetricsRegistry(prefix='ciclopi_')
+    fetch_seconds = metrics.histogram('fetch_seconds', "Page download time")
+    with fetch_seconds.time():
+        ...
+    metrics.render()
+    """
+
+    def __init__(self, prefix=''):
+        """Prepend `prefix` to all metric names."""
+        self._prefix = prefix
+        self._metrics = {}
+
+    def __getitem__(self, name):
+        return self._metrics[self._prefix + name]
+
+    def _add(self, metric):
+        if metric.name in self._metrics:
+            raise KeyError(f"Metric `{metric.name}` already exists")
+        self._metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name, description, labels=()):
+        """Add and return a `Counter`."""
+        return self._add(Counter(self._prefix + name, description, labels))
+
+    def gauge(self, name, description, labels=()):
+        """Add and return a `Gauge`."""
+        return self._add(Gauge(self._prefix + name, description, labels))
+
+    def histogram(self, name, description, labels=(),
+                  buckets=DEFAULT_BUCKETS):
+        """Add and return a `Histogram`."""
+        return self._add(Histogram(self._prefix + name, description, labels,
+                                   buckets))
+
+    def render(self):
+        """Return all metrics in text exposition format."""
+        return '\n'.join(
+            metric.render() for metric in self._metrics.values()
+        ) + '\n'
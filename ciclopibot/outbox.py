@@ -0,0 +1,305 @@
+"""Send bot messages through a rate-limited priority queue.
+
+Telegram allows about 30 messages per second overall, about one message per
+    second in the same private chat and 20 messages per minute in the same
+    group. Sends are spread accordingly by a global token bucket and a token
+    bucket per chat, and performed by a fixed number of workers, so that a
+    burst of notifications does not spawn a task per message.
+Default limits match those enforced by davtelepot `prevent_flooding` on
+    each API request: a call leaving the queue never has to wait there while
+    holding a worker.
+"""
+
+# Standard library modules
+import asyncio
+import collections
+import heapq
+import itertools
+import logging
+import re
+import time
+
+# Third party modules
+from davtelepot.api import TelegramError
+
+INTERACTIVE = 0
+BULK = 1
+
+_RETRY_AFTER = re.compile(r'retry after (\d+)')
+
+OutboundMessage = collections.namedtuple(
+    'OutboundMessage',
+    ['method', 'kwargs', 'chat_id', 'future', 'attempts']
+)
+
+
+def _get_chat_id(kwargs):
+    """Return id of the chat a send or edit call is about, or None."""
+    if kwargs.get('chat_id') is not None:
+        return kwargs['chat_id']
+    update = kwargs.get('update') or {}
+    if 'message' in update:
+        update = update['message']
+    if 'chat' in update:
+        return update['chat']['id']
+    return None
+
+
+def _get_retry_after(error):
+    """Return seconds to wait according to a 429 `TelegramError`."""
+    match = _RETRY_AFTER.search(error.description)
+    if match is None:
+        return 30
+    return int(match.group(1))
+
+
+class TokenBucket:
+    """Allow `rate` events per second, with bursts up to `capacity`."""
+
+    __slots__ = ('_rate', '_capacity', '_tokens', '_updated_at')
+
+    def __init__(self, rate, capacity=1):
+        """Start full."""
+        self._rate = rate
+        self._capacity = capacity
+        self._tokens = capacity
+        self._updated_at = time.monotonic()
+
+    def _refill(self, now):
+        self._tokens = min(
+            self._capacity,
+            self._tokens + (now - self._updated_at) * self._rate
+        )
+        self._updated_at = now
+
+    def get_delay(self, now=None):
+        """Return seconds to wait before next event is allowed."""
+        if now is None:
+            now = time.monotonic()
+        self._refill(now)
+        if self._tokens >= 1:
+            return 0
+        return (1 - self._tokens) / self._rate
+
+    def consume(self, now=None):
+        """Record an event."""
+        if now is None:
+            now = time.monotonic()
+        self._refill(now)
+        self._tokens -= 1
+
+    def pause(self, seconds, now=None):
+        """Allow no event for the next `seconds`."""
+        if now is None:
+            now = time.monotonic()
+        self._refill(now)
+        self._tokens = min(self._tokens, 0) - seconds * self._rate
+
+    def is_full(self, now=None):
+        """Return True if bucket has been idle long enough to be dropped."""
+        if now is None:
+            now = time.monotonic()
+        self._refill(now)
+        return self._tokens >= self._capacity
+
+
+class OutboundQueue:
+    """Priority queue of bot API calls, sent respecting Telegram limits.
+
+    Interactive replies (priority `INTERACTIVE`) are sent before bulk
+        messages (priority `BULK`); calls with the same priority are sent in
+        order. Calls to the same chat are sent one at a time, so that a
+        message is never overtaken by a later edit of it. Calls failing with
+        error 429 are retried after the `retry_after` time suggested by
+        Telegram, up to `max_retries` times.
+    As in davtelepot API methods, errors are returned rather than raised.
+
+    Usage:
+    outbox = OutboundQueue()
+    asyncio.ensure_future(outbox.run())
+    await outbox.send(bot.send_message, chat_id=123, text='Hello')
+    outbox.put(bot.send_message, priority=BULK, chat_id=123, text='News')
+    """
+
+    def __init__(self, rate=30, private_chat_rate=1, group_chat_rate=20 / 60,
+                 burst=1, chat_burst=1, workers=8, max_retries=3,
+                 max_chat_buckets=10000):
+        """Set global and per-chat rates (messages per second)."""
+        self._bucket = TokenBucket(rate, capacity=burst)
+        self._private_chat_rate = private_chat_rate
+        self._group_chat_rate = group_chat_rate
+        self._chat_burst = chat_burst
+        self._chat_buckets = {}
+        self._max_chat_buckets = max_chat_buckets
+        self._workers = workers
+        self._max_retries = max_retries
+        # Chats having pending calls are queued with the priority and
+        #   sequence number of their first call, and a unique ticket
+        self._queue = None
+        # Chat id -> heap of (priority, sequence, OutboundMessage)
+        self._lanes = {}
+        # Chat id -> (priority, ticket) of its valid queue entry: older
+        #   entries of the chat are skipped. Chats being sent to by a worker
+        #   have no valid entry.
+        self._scheduled = {}
+        self._sequence = itertools.count()
+        self._tickets = itertools.count()
+        self._pending = 0
+        self._sent = 0
+        self._retried = 0
+
+    @property
+    def is_running(self):
+        """Return True if workers are sending queued calls."""
+        return self._queue is not None
+
+    @property
+    def depth(self):
+        """Return number of calls waiting to be sent."""
+        return self._pending
+
+    @property
+    def sent(self):
+        """Return number of calls performed."""
+        return self._sent
+
+    @property
+    def retried(self):
+        """Return number of calls retried after error 429."""
+        return self._retried
+
+    def _get_chat_bucket(self, chat_id):
+        if not isinstance(chat_id, (int, str)):
+            return None
+        bucket = self._chat_buckets.get(chat_id)
+        if bucket is None:
+            if len(self._chat_buckets) >= self._max_chat_buckets:
+                now = time.monotonic()
+                self._chat_buckets = {
+                    key: value
+                    for key, value in self._chat_buckets.items()
+                    if not value.is_full(now)
+                }
+            bucket = self._chat_buckets[chat_id] = TokenBucket(
+                (
+                    self._group_chat_rate
+                    if isinstance(chat_id, str) or chat_id < 0
+                    else self._private_chat_rate
+                ),
+                capacity=self._chat_burst
+            )
+        return bucket
+
+    def put(self, method, priority=INTERACTIVE, **kwargs):
+        """Queue `method(**kwargs)` call and return a future of its result.
+
+        If the queue is not running, call `method` right away.
+        """
+        if self._queue is None:
+            return asyncio.ensure_future(method(**kwargs))
+        future = asyncio.get_event_loop().create_future()
+        sequence = next(self._sequence)
+        chat_id = _get_chat_id(kwargs)
+        if chat_id is None:  # E.g. inline messages: no lane to share
+            chat_id = ('inline', sequence)
+        message = OutboundMessage(method=method, kwargs=kwargs,
+                                  chat_id=chat_id, future=future,
+                                  attempts=0)
+        self._pending += 1
+        lane = self._lanes.get(chat_id)
+        if lane is None:
+            self._lanes[chat_id] = [(priority, sequence, message)]
+            self._schedule(chat_id)
+            return future
+        heapq.heappush(lane, (priority, sequence, message))
+        # Move chat up if it waits with a lower priority than this call's
+        if (
+                chat_id in self._scheduled
+                and priority < self._scheduled[chat_id][0]
+        ):
+            self._schedule(chat_id)
+        return future
+
+    async def send(self, method, priority=INTERACTIVE, **kwargs):
+        """Queue `method(**kwargs)` call and return its result."""
+        return await self.put(method, priority=priority, **kwargs)
+
+    def _schedule(self, chat_id, delay=0):
+        """Queue `chat_id` again after `delay` seconds, if it has calls."""
+        lane = self._lanes[chat_id]
+        if not lane:
+            del self._lanes[chat_id]
+            return
+        priority, sequence, _ = lane[0]
+        ticket = next(self._tickets)
+        self._scheduled[chat_id] = (priority, ticket)
+        entry = (priority, sequence, ticket, chat_id)
+        if delay:
+            asyncio.get_event_loop().call_later(
+                delay, self._queue.put_nowait, entry
+            )
+        else:
+            self._queue.put_nowait(entry)
+
+    async def run(self):
+        """Send queued calls until cancelled."""
+        self._queue = asyncio.PriorityQueue()
+        try:
+            await asyncio.gather(
+                *[self._work() for _ in range(self._workers)]
+            )
+        finally:
+            self._queue = None
+            self._scheduled = {}
+
+    async def _work(self):
+        while 1:
+            _, _, ticket, chat_id = await self._queue.get()
+            if self._scheduled.get(chat_id, (None, None))[1] != ticket:
+                continue  # Chat was queued again, or is being sent to
+            del self._scheduled[chat_id]
+            chat_bucket = self._get_chat_bucket(chat_id)
+            if chat_bucket is not None:
+                delay = chat_bucket.get_delay()
+                if delay:
+                    self._schedule(chat_id, delay)
+                    continue
+            delay = self._bucket.get_delay()
+            if delay:
+                await asyncio.sleep(delay)
+            priority, sequence, message = heapq.heappop(self._lanes[chat_id])
+            self._pending -= 1
+            if message.future.done():  # Caller gave up
+                self._schedule(chat_id)
+                continue
+            self._bucket.consume()
+            if chat_bucket is not None:
+                chat_bucket.consume()
+            try:
+                result = await message.method(**message.kwargs)
+            except Exception as e:
+                logging.error(f"Error sending message to {chat_id}: {e}",
+                              exc_info=True)
+                result = e
+            self._sent += 1
+            if (
+                    isinstance(result, TelegramError)
+                    and result.code == 429
+                    and message.attempts < self._max_retries
+            ):
+                retry_after = _get_retry_after(result)
+                logging.warning(f"Flood limit hit for chat {chat_id}, "
+                                f"retrying after {retry_after} s")
+                (chat_bucket or self._bucket).pause(retry_after)
+                self._retried += 1
+                self._pending += 1
+                heapq.heappush(
+                    self._lanes[chat_id],
+                    (priority, sequence,
+                     message._replace(attempts=message.attempts + 1))
+                )
+                self._schedule(chat_id, retry_after)
+                continue
+            if not message.future.done():
+                message.future.set_result(result)
+            self._schedule(chat_id)
@@ -0,0 +1,238 @@
+"""Profile the handling of selected updates on demand.
+
+Administrators may turn on `cProfile` for the next N updates, or for the
+    next N updates of a given chat, with the `/profile` command. Stats of
+    each profiled update are stored in `data/profiles/` and a summary is
+    sent back to the administrator.
+While profiling is off, updates are routed by the bot as usual: no code of
+    this module runs.
+"""
+
+# Standard library modules
+import cProfile
+import datetime
+import io
+import logging
+import os
+import pstats
+import time
+
+# Third party modules
+import davtelepot
+from davtelepot.utilities import get_cleaned_text
+
+# Project modules
+from .messages import default_profiling_messages
+
+# Telegram messages are at most 4096 characters long
+_MAX_SUMMARY_LENGTH = 3500
+
+
+def get_update_chat_id(update):
+    """Return id of the chat of a raw Telegram update, or None."""
+    for key in ('message', 'edited_message', 'callback_query',
+                'channel_post'):
+        if key not in update:
+            continue
+        content = update[key]
+        if key == 'callback_query':
+            content = content.get('message', {})
+        if 'chat' in content:
+            return content['chat']['id']
+    return None
+
+
+def get_update_type(update):
+    """Return the type of a raw Telegram update (e.g. `message`)."""
+    for key in update:
+        if key != 'update_id':
+            return key
+    return 'unknown'
+
+
+class UpdateProfiler:
+    """Run `cProfile` while the bot handles selected updates.
+
+    Profiling is switched on by replacing `bot.route_update` with a
+        profiling wrapper, and off by restoring it.
+    Only one update is profiled at a time. Other tasks running while that
+        update is awaited are profiled as well, so stats are an upper bound
+        of the time spent on the update.
+
+    Usage:
+    profiler = UpdateProfiler(bot, path='data/profiles')
+    profiler.start(updates=10, admin_chat_id=123)
+    """
+
+    def __init__(self, bot, path, summary_lines=15):
+        """Set bot and folder where stats will be stored."""
+        self._bot = bot
+        self._path = path
+        self._summary_lines = summary_lines
+        self._remaining = 0
+        self._chat_id = None
+        self._admin_chat_id = None
+        self._language = None
+        self._profiling = False
+
+    @property
+    def is_active(self):
+        """Return True if some update is going to be profiled."""
+        return self._remaining > 0
+
+    @property
+    def remaining(self):
+        """Return number of updates still to be profiled."""
+        return self._remaining
+
+    @property
+    def chat_id(self):
+        """Return id of the only chat being profiled, or None (all chats)."""
+        return self._chat_id
+
+    def start(self, updates, admin_chat_id, chat_id=None, language=None):
+        """Profile next `updates` updates (of chat `chat_id`, if given).
+
+        Summaries will be sent to `admin_chat_id`, in `language`.
+        """
+        self._remaining = updates
+        self._chat_id = chat_id
+        self._admin_chat_id = admin_chat_id
+        self._language = language
+        # Instance attribute shadows `Bot.route_update` method
+        self._bot.route_update = self._route_update
+
+    def stop(self):
+        """Stop profiling and route updates as usual."""
+        self._remaining = 0
+        self._bot.__dict__.pop('route_update', None)
+
+    async def _route_update(self, raw_update):
+        route_update = type(self._bot).route_update
+        if (
+                self._profiling
+                or (
+                    self._chat_id is not None
+                    and get_update_chat_id(raw_update) != self._chat_id
+                )
+        ):
+            return await route_update(self._bot, raw_update)
+        self._remaining -= 1
+        if self._remaining <= 0:
+            self.stop()
+        self._profiling = True
+        profile = cProfile.Profile()
+        started_at = time.perf_counter()
+        profile.enable()
+        try:
+            return await route_update(self._bot, raw_update)
+        finally:
+            profile.disable()
+            self._profiling = False
+            try:
+                await self._report(profile, raw_update,
+                                   time.perf_counter() - started_at)
+            except Exception as e:
+                logging.error(f"Error reporting update profile: {e}",
+                              exc_info=True)
+
+    async def _report(self, profile, update, duration):
+        """Store stats of `profile` and send a summary to administrator."""
+        os.makedirs(self._path, exist_ok=True)
+        file_name = os.path.join(
+            self._path,
+            f"{datetime.datetime.now():%Y%m%d_%H%M%S}_"
+            f"{update.get('update_id', 0)}.prof"
+        )
+        stats = pstats.Stats(profile)
+        stats.dump_stats(file_name)
+        stream = io.StringIO()
+        stats.stream = stream
+        stats.strip_dirs().sort_stats('cumulative').print_stats(
+            self._summary_lines
+        )
+        summary = stream.getvalue().strip()
+        if len(summary) > _MAX_SUMMARY_LENGTH:
+            summary = summary[:_MAX_SUMMARY_LENGTH] + '\n[...]'
+        await self._bot.send_message(
+            chat_id=self._admin_chat_id,
+            text=self._bot.get_message(
+                'profiling', 'summary',
+                language=self._language,
+                update_type=get_update_type(update),
+                chat_id=get_update_chat_id(update),
+                duration=duration * 1000,
+                file_name=os.path.basename(file_name),
+                remaining=self._remaining
+            # `send_message` escapes HTML symbols outside of valid tags
+            ) + f"\n\n<pre>{summary}</pre>",
+            parse_mode='HTML'
+        )
+
+
+async def profile_command(bot: davtelepot.bot.Bot, update: dict,
+                          user_record: dict, language: str,
+                          profiler: UpdateProfiler, max_updates=100):
+    """Start or stop profiling, or show profiling status.
+
+    `/profile N` profiles next N updates, `/profile chat ID [N]` next N
+        updates of chat ID, `/profile off` stops profiling.
+    """
+    arguments = get_cleaned_text(update, bot, ['profile']).split()
+    if arguments and arguments[0] == 'off':
+        profiler.stop()
+        return bot.get_message('profiling', 'stopped', language=language)
+    chat_id = None
+    if arguments and arguments[0] == 'chat':
+        if len(arguments) < 2 or not arguments[1].lstrip('-').isnumeric():
+            return bot.get_message('profiling', 'usage', language=language)
+        chat_id = int(arguments[1])
+        arguments = arguments[2:]
+    if not arguments and chat_id is None:
+        if not profiler.is_active:
+            return bot.get_message('profiling', 'usage', language=language)
+        return bot.get_message('profiling', 'status', language=language,
+                               n=profiler.remaining,
+                               chat_id=profiler.chat_id or '*')
+    if arguments and not arguments[0].isnumeric():
+        return bot.get_message('profiling', 'usage', language=language)
+    updates = min(int(arguments[0]) if arguments else 10, max_updates)
+    if updates < 1:
+        return bot.get_message('profiling', 'usage', language=language)
+    profiler.start(updates=updates, chat_id=chat_id,
+                   admin_chat_id=update['chat']['id'], language=language)
+    return bot.get_message('profiling', 'started', language=language,
+                           n=updates, chat_id=chat_id or '*')
+
+
+def init(telegram_bot: davtelepot.bot.Bot, profiling_messages=None,
+         folder_name='profiles'):
+    """Add admin-only `/profile` command to `telegram_bot`.
+
+    `folder_name` : str
+        Name of the folder in `data` where stats will be stored.
+    """
+    if profiling_messages is None:
+        profiling_messages = default_profiling_messages
+    telegram_bot.messages['profiling'] = profiling_messages
+    profiler = UpdateProfiler(
+        bot=telegram_bot,
+        path=os.path.join(
+            telegram_bot.path or os.path.dirname(os.path.abspath(__file__)),
+            'data',
+            folder_name
+        )
+    )
+
+    @telegram_bot.command(command='/profile',
+                          aliases=[],
+                          show_in_keyboard=False,
+                          description=profiling_messages[
+                              'profile_command']['description'],
+                          authorization_level='admin')
+    async def _profile_command(bot, update, user_record, language):
+        return await profile_command(bot=bot, update=update,
+                                     user_record=user_record,
+                                     language=language, profiler=profiler)
+
+    return profiler
@@ -0,0 +1,171 @@
+"""Sample the stack of the event loop thread and store it for flame graphs.
+
+A background thread reads the current frame of the sampled thread with
+    `sys._current_frames` (about 100 times per second by default) and counts
+    identical stacks. Counts are written in collapsed-stack format, one
+    `frame;frame;...;frame count` line per stack, which `flamegraph.pl`,
+    speedscope and similar tools read as is.
+Each file covers a period of time (one hour by default): the file of the
+    current period is rewritten every minute, files of older periods are
+    deleted when more than `backup_count` exist.
+"""
+
+# Standard library modules
+import datetime
+import logging
+import os
+import sys
+import threading
+import time
+
+
+def get_frame_label(code):
+    """Return flame graph label of `code` object: `function (file:line)`."""
+    return (
+        f"{code.co_name} "
+        f"({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+    ).replace(';', ':')
+
+
+class SamplingProfiler:
+    """Count stacks of a thread sampled at regular intervals.
+
+    Only code objects are collected while sampling: labels are computed when
+        counts are written, outside the sampled thread.
+
+    Usage:
+    profiler = SamplingProfiler(path='data/samples', rate=100)
+    profiler.start()  # From the thread to be sampled
+    ...
+    profiler.stop()
+    """
+
+    def __init__(self, path, rate=100, period=datetime.timedelta(hours=1),
+                 flush_interval=60, backup_count=48, max_depth=128):
+        """Set folder of collapsed-stack files and sampling rate (Hz)."""
+        self._path = path
+        self._interval = 1 / rate
+        self._period = period.total_seconds()
+        self._flush_interval = flush_interval
+        self._backup_count = backup_count
+        self._max_depth = max_depth
+        self._thread_id = None
+        self._thread = None
+        self._stop_event = threading.Event()
+        # Tuple of code objects (outermost first) -> number of samples
+        self._counts = {}
+        self._samples = 0
+        self._file_name = None
+
+    @property
+    def is_running(self):
+        """Return True if stacks are being sampled."""
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def rate(self):
+        """Return sampling rate, in samples per second."""
+        return 1 / self._interval
+
+    @property
+    def samples(self):
+        """Return number of samples taken in current period."""
+        return self._samples
+
+    @property
+    def file_name(self):
+        """Return name of the file of current period, or None."""
+        return self._file_name
+
+    def start(self, thread_id=None):
+        """Start sampling thread `thread_id` (default: calling thread)."""
+        if self.is_running:
+            return
+        self._thread_id = (
+            threading.get_ident() if thread_id is None else thread_id
+        )
+        self._stop_event.clear()
+        self._thread = threading.Thread(target=self._run,
+                                        name='SamplingProfiler',
+                                        daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop sampling and write counts of current period."""
+        if not self.is_running:
+            return
+        self._stop_event.set()
+        self._thread.join()
+        self._thread = None
+
+    def sample(self):
+        """Count current stack of sampled thread."""
+        frame = sys._current_frames().get(self._thread_id)
+        stack = []
+        while frame is not None and len(stack) < self._max_depth:
+            stack.append(frame.f_code)
+            frame = frame.f_back
+        if not stack:
+            return
+        stack = tuple(reversed(stack))
+        self._counts[stack] = self._counts.get(stack, 0) + 1
+        self._samples += 1
+
+    def _new_period(self):
+        self._counts = {}
+        self._samples = 0
+        os.makedirs(self._path, exist_ok=True)
+        self._file_name = os.path.join(
+            self._path,
+            f"{datetime.datetime.now():%Y%m%d_%H%M%S}.folded"
+        )
+        self._remove_old_files()
+
+    def _remove_old_files(self):
+        file_names = sorted(
+            file_name
+            for file_name in os.listdir(self._path)
+            if file_name.endswith('.folded')
+        )
+        for file_name in file_names[:-self._backup_count or None]:
+            os.remove(os.path.join(self._path, file_name))
+
+    def write(self):
+        """Write counts of current period to its collapsed-stack file."""
+        if self._file_name is None or not self._counts:
+            return
+        labels = {}
+        lines = []
+        for stack, count in sorted(self._counts.items(),
+                                   key=lambda item: -item[1]):
+            for code in stack:
+                if code not in labels:
+                    labels[code] = get_frame_label(code)
+            lines.append(
+                f"{';'.join(labels[code] for code in stack)} {count}\n"
+            )
+        temporary_file_name = f"{self._file_name}.tmp"
+        with open(temporary_file_name, 'w', encoding='utf-8') as stacks_file:
+            stacks_file.writelines(lines)
+        os.replace(temporary_file_name, self._file_name)
+
+    def _run(self):
+        self._new_period()
+        period_started_at = flushed_at = time.monotonic()
+        while not self._stop_event.wait(self._interval):
+            try:
+                self.sample()
+                now = time.monotonic()
+                if now - period_started_at >= self._period:
+                    self.write()
+                    self._new_period()
+                    period_started_at = flushed_at = now
+                elif now - flushed_at >= self._flush_interval:
+                    self.write()
+                    flushed_at = now
+            except Exception as e:
+                logging.error(f"Sampling profiler error: {e}", exc_info=True)
+        try:
+            self.write()
+        except Exception as e:
+            logging.error(f"Error writing sampled stacks: {e}", exc_info=True)
@@ -52,11 +52,14 @@ setuptools.setup(
     long_description=long_description,
     long_description_content_type="text/markdown",
     url="https://gogs.davte.it/davte/ciclopibot",
-    packages=setuptools.find_packages(),
+    packages=setuptools.find_packages(exclude=['benchmarks', 'benchmarks.*']),
     platforms=['any'],
     install_requires=[
         'davtelepot',
     ],
+    extras_require={
+        'numpy': ['numpy'],
+    },
     python_requires='>=3.5',
     classifiers=[
         "Development Status :: 5 - Production/Stable",
@@ -0,0 +1,74 @@
+"""Test alert detection and delivery."""
+
+# Standard library modules
+import asyncio
+import datetime
+import unittest
+from unittest import mock
+
+# Project modules
+from benchmarks.pages import make_page
+from ciclopibot import ciclopi
+from ciclopibot.alerts import Alert, AlertIndex
+from ciclopibot.messages import MessageCatalog, default_ciclopi_messages
+
+
+def get_table(bikes):
+    """Return the `StationTable` of a page with `bikes` {id: (bikes, free)}."""
+    return ciclopi.StationSnapshot(
+        ciclopi._extract_station_records(make_page(bikes=bikes)),
+        version=1,
+        fetched_at=datetime.datetime.now()
+    ).table
+
+
+class FakeOutbox:
+    """Record queued calls, failing for chat 0."""
+
+    def __init__(self):
+        self.calls = []
+
+    def put(self, method, **kwargs):
+        if kwargs['chat_id'] == 0:
+            raise ValueError("Chat not found")
+        self.calls.append(kwargs)
+
+
+class AlertsTest(unittest.IsolatedAsyncioTestCase):
+    """Alerts carry values of the snapshot that fired them."""
+
+    async def test_alert_carries_firing_values(self):
+        index = AlertIndex()
+        index.add(chat_id=1, station_id=2, kind='bikes', threshold=3)
+        alerts = index.get_alerts(get_table({2: (0, 10)}),
+                                  get_table({2: (4, 6)}))
+        self.assertEqual(len(alerts), 1)
+        self.assertEqual((alerts[0].bikes, alerts[0].free), (4, 6))
+
+    async def test_failing_alert_does_not_stop_sender(self):
+        outbox = FakeOutbox()
+        notifications = asyncio.Queue()
+        catalog = MessageCatalog(default_ciclopi_messages)
+        with mock.patch.multiple(ciclopi, ciclopi_outbox=outbox,
+                                 ciclopi_notifications=notifications,
+                                 message_catalog=catalog):
+            sender = asyncio.ensure_future(
+                ciclopi.send_alerts(bot=mock.Mock())
+            )
+            for chat_id in (0, 1):
+                notifications.put_nowait(
+                    Alert(chat_id=chat_id, station_id=2, kind='bikes',
+                          threshold=3, value=4, language='en', bikes=4,
+                          free=6)
+                )
+            with self.assertLogs(level='ERROR'):
+                while notifications.qsize():
+                    await asyncio.sleep(0.01)
+            await asyncio.sleep(0.01)
+            sender.cancel()
+        self.assertEqual(len(outbox.calls), 1)
+        self.assertIn('4', outbox.calls[0]['text'])
+
+
+if __name__ == '__main__':
+    unittest.main()
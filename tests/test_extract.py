@@ -0,0 +1,47 @@
+"""Test fast extraction of station records from CicloPi pages."""
+
+# Standard library modules
+import unittest
+
+# Third party modules
+from bs4 import BeautifulSoup
+
+# Project modules
+from benchmarks.pages import make_page
+from ciclopibot.ciclopi import _extract_station_records, _get_station_records
+
+
+class ExtractStationRecordsTest(unittest.TestCase):
+    """Compare `_extract_station_records` with BeautifulSoup extraction."""
+
+    def assert_same_records(self, page):
+        self.assertEqual(
+            _extract_station_records(page),
+            _get_station_records(BeautifulSoup(page, "html.parser"))
+        )
+
+    def test_plain_page(self):
+        self.assert_same_records(make_page(seed=1))
+
+    def test_page_with_comments(self):
+        page = make_page(seed=2).replace(
+            '<head>',
+            '<head><!--[if lt IE 9]><script src="html5.js"></script>'
+            '<![endif]-->'
+        ).replace(
+            '</ul>',
+            '<!-- <li class="rrItem">Old station</li> --></ul><!-- end -->'
+        ).replace(
+            '<div class="cssNumero">',
+            '<div class="cssNumero"><!-- id -->',
+            3
+        )
+        self.assert_same_records(page)
+
+    def test_unclosed_comment(self):
+        with self.assertRaises(ValueError):
+            _extract_station_records(make_page(seed=3) + '<!-- footer')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,51 @@
+"""Test `ciclopibot.forecast` profiles built from change-only samples."""
+
+# Standard library modules
+import datetime
+import unittest
+
+# Project modules
+from ciclopibot.forecast import (
+    StationForecaster, StationProfile, get_hour_of_week
+)
+
+# A Monday, 8:00 local time
+MONDAY_8 = datetime.datetime(2024, 1, 1, 8).timestamp()
+
+
+class StationProfileTest(unittest.TestCase):
+    """Unchanged intervals are continuous data, not gaps."""
+
+    def test_unchanged_interval_is_credited_to_each_hour(self):
+        profile = StationProfile()
+        profile.add_sample(MONDAY_8, 5)
+        # No change for two hours and a half
+        profile.add_sample(MONDAY_8 + 2.5 * 3600, 7)
+        hour = get_hour_of_week(MONDAY_8)
+        self.assertEqual(hour, 8)
+        for offset in (0, 1, 2):
+            self.assertEqual(profile.get_average(hour + offset), 5)
+        self.assertIsNone(profile.get_average(hour + 3))
+        self.assertGreater(profile.trend, 0)
+
+    def test_long_gap_is_not_credited(self):
+        profile = StationProfile()
+        profile.add_sample(MONDAY_8, 5)
+        profile.add_sample(MONDAY_8 + 10 * 3600, 7)
+        self.assertIsNone(profile.get_average(get_hour_of_week(MONDAY_8)))
+        self.assertEqual(profile.trend, 0)
+
+
+class StationForecasterTest(unittest.TestCase):
+    """Time keys change with the hours of week involved in forecasts."""
+
+    def test_time_key(self):
+        forecaster = StationForecaster(horizon=15 * 60)
+        self.assertEqual(forecaster.get_time_key(MONDAY_8),
+                         forecaster.get_time_key(MONDAY_8 + 40 * 60))
+        self.assertNotEqual(forecaster.get_time_key(MONDAY_8),
+                            forecaster.get_time_key(MONDAY_8 + 50 * 60))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,81 @@
+"""Test `ciclopibot.ciclopi.StationGridIndex` queries."""
+
+# Standard library modules
+import time
+import unittest
+from unittest import mock
+
+# Project modules
+from ciclopibot.ciclopi import (
+    Station, StationGridIndex, haversine_distance
+)
+
+PLACES = {
+    'pisa': (43.7160, 10.3966),
+    'rome': (41.9028, 12.4964),
+    'london': (51.5074, -0.1278),
+}
+
+
+def get_nearest(latitude, longitude, k, condition=None):
+    """Return `k` nearest stations by evaluating every distance."""
+    return sorted(
+        (
+            haversine_distance(latitude, longitude,
+                               *station['coordinates']),
+            station_id
+        )
+        for station_id, station in Station.stations.items()
+        if condition is None or condition(station_id)
+    )[:k]
+
+
+class StationGridIndexTest(unittest.TestCase):
+    """Grid queries match brute force, wherever the location is."""
+
+    def setUp(self):
+        self.index = StationGridIndex(Station.stations)
+
+    def test_nearest(self):
+        for name, (latitude, longitude) in PLACES.items():
+            with self.subTest(place=name):
+                self.assertEqual(
+                    self.index.get_nearest(latitude, longitude, k=5),
+                    get_nearest(latitude, longitude, k=5)
+                )
+                self.assertEqual(
+                    self.index.get_nearest(
+                        latitude, longitude, k=3,
+                        condition=lambda station_id: station_id % 2
+                    ),
+                    get_nearest(latitude, longitude, k=3,
+                                condition=lambda station_id: station_id % 2)
+                )
+
+    def test_out_of_grid_location_visits_no_ring(self):
+        for name in ('rome', 'london'):
+            with self.subTest(place=name), mock.patch.object(
+                    self.index, '_get_ring',
+                    wraps=self.index._get_ring) as get_ring:
+                started_at = time.perf_counter()
+                self.index.get_nearest(*PLACES[name], k=5)
+                self.index.get_within(*PLACES[name], radius=1e6)
+                self.assertLess(time.perf_counter() - started_at, 0.05)
+                self.assertEqual(get_ring.call_count, 0)
+
+    def test_within(self):
+        latitude, longitude = PLACES['rome']
+        self.assertEqual(
+            self.index.get_within(latitude, longitude, radius=300e3),
+            [
+                (distance, station_id)
+                for distance, station_id in get_nearest(
+                    latitude, longitude, k=len(Station.stations)
+                )
+                if distance <= 300e3
+            ]
+        )
+
+
+if __name__ == '__main__':
+    unittest.main()
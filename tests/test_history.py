@@ -0,0 +1,47 @@
+"""Test `ciclopibot.history` store."""
+
+# Standard library modules
+import os
+import tempfile
+import unittest
+
+# Project modules
+from ciclopibot.history import StationHistory
+
+
+class StationHistoryTest(unittest.IsolatedAsyncioTestCase):
+    """Append and scan records while the event loop is running."""
+
+    async def asyncSetUp(self):
+        folder = tempfile.TemporaryDirectory()
+        self.addCleanup(folder.cleanup)
+        self.path = os.path.join(folder.name, 'history.bin')
+
+    async def test_sync_runs_in_background(self):
+        history = StationHistory(self.path, sync_records=2)
+        self.addCleanup(history.close)
+        history.append(100, [(1, 2, 3, True)])
+        future = history.sync_in_background()
+        self.assertIsNotNone(future)
+        await future
+        self.assertEqual(os.path.getsize(self.path), 16 + 11)
+
+    async def test_scan_ignores_records_appended_later(self):
+        for ring_size in (1000, 1):  # Scan memory, then file
+            with self.subTest(ring_size=ring_size):
+                path = f'{self.path}.{ring_size}'
+                history = StationHistory(path, ring_size=ring_size)
+                self.addCleanup(history.close)
+                history.append(100, [(1, 2, 3, True), (2, 4, 5, True)])
+                records = history.scan(0)
+                history.append(200, [(1, 0, 5, True)])
+                self.assertEqual(
+                    [(record.timestamp, record.station_id)
+                     for record in records],
+                    [(100, 1), (100, 2)]
+                )
+                self.assertEqual(len(list(history.scan(0))), 3)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,93 @@
+"""Test `ciclopibot.outbox` ordering and rate limits."""
+
+# Standard library modules
+import asyncio
+import time
+import unittest
+
+# Project modules
+from ciclopibot.outbox import BULK, INTERACTIVE, OutboundQueue
+
+
+class OutboundQueueTest(unittest.IsolatedAsyncioTestCase):
+    """Send calls to a fake API method and record them."""
+
+    async def asyncSetUp(self):
+        self.calls = []
+
+    async def fake_send(self, chat_id, text):
+        self.calls.append((chat_id, text, time.monotonic()))
+        return text
+
+    def start(self, outbox):
+        task = asyncio.ensure_future(outbox.run())
+        self.addAsyncCleanup(self.cancel, task)
+
+    @staticmethod
+    async def cancel(task):
+        task.cancel()
+        await asyncio.gather(task, return_exceptions=True)
+
+    async def test_interactive_overtakes_bulk_of_same_chat(self):
+        outbox = OutboundQueue(rate=1000, private_chat_rate=1000, workers=1)
+        self.start(outbox)
+        await asyncio.sleep(0)
+        futures = [
+            outbox.put(self.fake_send, priority=BULK, chat_id=chat_id,
+                       text=f'bulk {chat_id}')
+            for chat_id in range(2, 50)
+        ] + [
+            outbox.put(self.fake_send, priority=BULK, chat_id=1,
+                       text=f'bulk 1.{n}')
+            for n in range(5)
+        ]
+        reply = await outbox.send(self.fake_send, priority=INTERACTIVE,
+                                  chat_id=1, text='reply')
+        self.assertEqual(reply, 'reply')
+        self.assertEqual(self.calls[0][1], 'reply')
+        await asyncio.gather(*futures)
+        self.assertEqual(
+            [text for chat_id, text, _ in self.calls if chat_id == 1],
+            ['reply'] + [f'bulk 1.{n}' for n in range(5)]
+        )
+        self.assertEqual(outbox.depth, 0)
+
+    async def test_interactive_after_bulk_already_queued(self):
+        outbox = OutboundQueue(rate=1000, private_chat_rate=20, workers=2)
+        self.start(outbox)
+        await asyncio.sleep(0)
+        bulk = [
+            outbox.put(self.fake_send, priority=BULK, chat_id=chat_id,
+                       text=f'bulk {chat_id}.{n}')
+            for n in range(3)
+            for chat_id in (1, 2, 3)
+        ]
+        # Let some bulk calls go, so that chat 1 waits for its bucket
+        await asyncio.sleep(0.03)
+        await outbox.send(self.fake_send, chat_id=1, text='reply')
+        await asyncio.gather(*bulk)
+        chat_1_texts = [text for chat_id, text, _ in self.calls
+                        if chat_id == 1]
+        self.assertLess(chat_1_texts.index('reply'),
+                        chat_1_texts.index('bulk 1.2'))
+
+    async def test_chat_rate_is_respected(self):
+        outbox = OutboundQueue(rate=1000, private_chat_rate=20, workers=4)
+        self.start(outbox)
+        await asyncio.sleep(0)
+        await asyncio.gather(*[
+            outbox.put(self.fake_send, chat_id=1,
+                       priority=(BULK if n % 2 else INTERACTIVE),
+                       text=str(n))
+            for n in range(6)
+        ])
+        times = [sent_at for _, _, sent_at in self.calls]
+        self.assertTrue(
+            all(b - a >= 0.045 for a, b in zip(times, times[1:]))
+        )
+        self.assertEqual([text for _, text, _ in self.calls],
+                         ['0', '2', '4', '1', '3', '5'])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,84 @@
+"""Test `ciclopibot.ciclopi.CicloPiSettingsCache` consistency."""
+
+# Standard library modules
+import asyncio
+import copy
+import unittest
+from unittest import mock
+
+# Project modules
+from ciclopibot import ciclopi
+
+
+class FakeDatabase:
+    """Serve settings as they were when each read started.
+
+    Reads complete only when `release` is called, to interleave writes.
+    """
+
+    def __init__(self, settings):
+        self.settings = settings
+        self.reads = 0
+        self._released = asyncio.Event()
+
+    def release(self):
+        self._released.set()
+
+    async def wait_for_read(self):
+        while not self.reads:
+            await asyncio.sleep(0)
+
+    async def read(self, function, chat_id):
+        self.reads += 1
+        settings = copy.deepcopy(self.settings)
+        await self._released.wait()
+        await asyncio.sleep(0)  # As a read in another thread would
+        return settings
+
+
+class CicloPiSettingsCacheTest(unittest.IsolatedAsyncioTestCase):
+    """A cold read never caches settings older than a later write."""
+
+    async def asyncSetUp(self):
+        self.db = FakeDatabase(
+            dict(record=dict(chat_id=1, sorting=0), custom_order=[])
+        )
+        patcher = mock.patch.object(ciclopi, 'ciclopi_db', self.db)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        self.settings = ciclopi.CicloPiSettingsCache()
+
+    async def test_write_during_cold_read(self):
+        first_read = asyncio.ensure_future(self.settings.get_record(1))
+        second_read = asyncio.ensure_future(self.settings.get_record(1))
+        await self.db.wait_for_read()
+        # A settings button writes to database while settings are read
+        self.db.settings['record']['sorting'] = 2
+        self.settings.update_record(1, sorting=2)
+        self.db.release()
+        for read in (first_read, second_read):
+            self.assertEqual((await read)['sorting'], 2)
+        self.assertEqual((await self.settings.get_record(1))['sorting'], 2)
+        self.assertEqual(self.db.reads, 2)
+
+    async def test_custom_order_write_during_cold_read(self):
+        read = asyncio.ensure_future(self.settings.get_custom_order(1))
+        await self.db.wait_for_read()
+        custom_order = [dict(chat_id=1, station=5, value=1)]
+        self.db.settings['custom_order'] = custom_order
+        self.settings.set_custom_order(1, custom_order)
+        self.db.release()
+        self.assertEqual(await read, custom_order)
+        self.assertEqual(await self.settings.get_custom_order(1),
+                         custom_order)
+
+    async def test_concurrent_misses_share_a_read(self):
+        self.db.release()
+        await asyncio.gather(
+            *[self.settings.get_record(1) for _ in range(5)]
+        )
+        self.assertEqual(self.db.reads, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,98 @@
+"""Test `StationSnapshotProvider` refresh policy."""
+
+# Standard library modules
+import asyncio
+import datetime
+import unittest
+
+# Project modules
+from benchmarks.pages import make_page
+from ciclopibot.ciclopi import (
+    StationSnapshot, StationSnapshotProvider, _extract_station_records
+)
+
+
+class FakeCachedPage:
+    """Stand-in for `ConditionalCachedPage`, serving synthetic pages."""
+
+    cache_time = datetime.timedelta(seconds=15)
+
+    def __init__(self):
+        self.page = None
+        self.last_update = None
+        self.is_old = True
+        self.downloads = 0
+
+    async def refresh(self):
+        await asyncio.sleep(0.01)
+        self.downloads += 1
+        self.page = make_page(seed=self.downloads)
+        self.last_update = datetime.datetime.now()
+        self.is_old = False
+        return 0
+
+
+class GetLatestSnapshotTest(unittest.IsolatedAsyncioTestCase):
+    """Stale snapshots are served only while not too old."""
+
+    async def test_stale_snapshot_is_served_while_refreshing(self):
+        page = FakeCachedPage()
+        provider = StationSnapshotProvider(
+            page, max_staleness=datetime.timedelta(hours=1)
+        )
+        first_snapshot = await provider.get_latest_snapshot()
+        self.assertEqual(page.downloads, 1)
+        page.is_old = True
+        self.assertIs(await provider.get_latest_snapshot(), first_snapshot)
+        self.assertEqual(page.downloads, 1)
+        await provider.refresh_in_background()
+        self.assertEqual(page.downloads, 2)
+        self.assertIsNot(provider.snapshot, first_snapshot)
+
+    async def test_too_stale_snapshot_waits_for_refresh(self):
+        page = FakeCachedPage()
+        provider = StationSnapshotProvider(
+            page, max_staleness=datetime.timedelta(0)
+        )
+        first_snapshot = await provider.get_latest_snapshot()
+        page.is_old = True
+        snapshots = await asyncio.gather(
+            *[provider.get_latest_snapshot() for _ in range(5)]
+        )
+        # A single download, awaited by all requests
+        self.assertEqual(page.downloads, 2)
+        self.assertTrue(
+            all(snapshot is provider.snapshot for snapshot in snapshots)
+        )
+        self.assertIsNot(provider.snapshot, first_snapshot)
+
+
+class StationViewTest(unittest.TestCase):
+    """Station setters do not change the shared snapshot."""
+
+    def test_copy_on_write(self):
+        snapshot = StationSnapshot(
+            _extract_station_records(make_page(bikes={2: (4, 6)})),
+            version=1,
+            fetched_at=datetime.datetime.now()
+        )
+        row = snapshot.table.get_row(2)
+        active = snapshot.table.active[row]
+        station = snapshot.get_stations()[row]
+        station.set_bikes(9)
+        station.set_free(0)
+        station.set_active(False)
+        station.set_description('Moved')
+        self.assertEqual((station.id, station.bikes, station.free),
+                         (2, 9, 0))
+        self.assertFalse(station.is_active)
+        self.assertEqual(station.description, 'Moved')
+        self.assertEqual((snapshot.table.bikes[row],
+                          snapshot.table.free[row]), (4, 6))
+        self.assertEqual(snapshot.table.active[row], active)
+        self.assertNotEqual(snapshot.table.descriptions[row], 'Moved')
+        self.assertEqual(snapshot.get_stations()[row].bikes, 4)
+
+
+if __name__ == '__main__':
+    unittest.main()